@@ -1,17 +1,65 @@
 import streamlit as st
-import pandas as pd
 import bidirectional_view_of_user as bv
 import followers_of_target as fot
 import targets_of_follower as tof
 import network_stats as ns
+import influence_of_user as iou
+import who_to_follow as wf
+import follow_path as fp
+from dataset_store import get_store
+from instrumentation import get_recorder, recording, show_performance_panel, stage
+from out_of_core import DEFAULT_MEMORY_LIMIT_MB
 
-def load_data(file):
+def load_data(file, mode=(False, None, False)):
     # This function loads the data from the uploaded file
     with st.spinner("Loading dataset..."):
-        df = pd.read_csv(file, header=None, names=['Follower', 'Target'])
-        st.session_state['df'] = df
+        # Sessions that upload the same file share one in-memory copy
+        if 'df_handle' in st.session_state:
+            st.session_state['df_handle'].release()
+        st.session_state['df_handle'] = open_dataset(file, mode)
         st.success("Data Loaded Successfully.")
 
+def open_dataset(source, mode):
+    out_of_core, memory_limit, compressed = mode
+    # A freshly loaded dataset has no edge updates applied
+    st.session_state.pop('applied_edge_updates', None)
+    st.session_state.pop('edge_update_message', None)
+    with stage("Load dataset"):
+        if out_of_core:
+            return get_store().open(source, out_of_core=True, memory_limit=memory_limit, compressed=compressed)
+        return get_store().open(source)
+
+def apply_edge_updates(handle_key, added, removed):
+    # Swap the session's dataset for one with the updates applied
+    applied = st.session_state.setdefault('applied_edge_updates', set())
+    try:
+        with st.spinner("Applying edge updates..."):
+            handle = get_store().update(st.session_state[handle_key], added, removed)
+    except ValueError as error:
+        st.session_state['edge_update_message'] = ('error', str(error))
+        return
+    st.session_state[handle_key] = handle
+    applied.add((getattr(added, 'file_id', None), getattr(removed, 'file_id', None)))
+    st.session_state['edge_update_message'] = ('success', f"Updated to {handle.index.num_edges:,} edges among {handle.index.num_nodes:,} users.")
+
+def show_edge_updates(handle_key):
+    # Daily edge dumps only add (and remove) a few edges, so they are applied
+    # to the loaded dataset instead of loading the whole edge list again
+    with st.sidebar.expander("Edge Updates"):
+        added = st.file_uploader("New Edges CSV", type="csv", key="added_edges")
+        removed = st.file_uploader("Removed Edges CSV", type="csv", key="removed_edges")
+        files = (getattr(added, 'file_id', None), getattr(removed, 'file_id', None))
+        # Applying the same new edges twice would add them twice
+        done = files in st.session_state.get('applied_edge_updates', set())
+        st.button("Apply Updates", on_click=apply_edge_updates, args=(handle_key, added, removed),
+                  disabled=(added is None and removed is None) or done)
+        if 'edge_update_message' in st.session_state:
+            kind, message = st.session_state['edge_update_message']
+            if kind == 'error':
+                st.error(message)
+            else:
+                st.success(message)
+
 def main():
     # Set page config
     st.set_page_config(page_title="Network Analysis Tool", layout="wide")
@@ -54,73 +102,131 @@ def main():
                                       ["Visualize Followers of a Target User", 
                                        "Visualize Targets a User Follows", 
                                        "Bidirectional View of a User", 
+                                       "Influence Around a User", 
+                                       "Who to Follow",
+                                       "Shortest Follow Path",
                                        "Global Statistics of the Network"], index=None, key="model_selection")
         
         # Data source selection
         st.markdown("## Data Source")
         dataset_choice = st.radio("Choose your data source:", 
                                   ["Upload CSV", "Use Default Dataset"], index=None, key="data_source_selection")
-        
+
+        # Out-of-core mode keeps the edges on disk for edge lists larger than RAM
+        st.markdown("## Processing Mode")
+        out_of_core = st.checkbox("Out-of-Core Mode", key="out_of_core_mode")
+        memory_limit_mb = st.number_input("Memory Limit (MB)", 256, 1048576, DEFAULT_MEMORY_LIMIT_MB, 256,
+                                          disabled=not out_of_core, key="memory_limit_mb")
+        compressed = st.checkbox("Compress Index", disabled=not out_of_core, key="compress_index",
+                                 help="Stores the follower and target lists delta-encoded, in a fraction of the disk "
+                                      "and page cache, at some cost in lookup and statistics speed.")
+        mode = (True, int(memory_limit_mb) * 1024 * 1024, compressed) if out_of_core else (False, None, False)
+
+        # Stage timings of every run, to find which step a slow click spends its time in
+        st.markdown("## Performance")
+        record_performance = st.checkbox("Show Performance Panel", key="performance_panel")
+        performance_panel = st.container()
+
+    # Stages are only recorded while the panel is shown
+    recorder = get_recorder() if record_performance else None
+    if recorder is not None:
+        recorder.new_run()
+    with recording(recorder):
+        show_analysis(dataset_choice, selected_model, mode)
+    if recorder is not None:
+        with performance_panel:
+            show_performance_panel(recorder)
+
+def show_analysis(dataset_choice, selected_model, mode):
     # Handling data source selection
     if dataset_choice == "Upload CSV":
         user_file_path = st.sidebar.file_uploader("Upload a CSV file", type="csv", key="csv_uploader")
         
         if user_file_path is not None:
-            if 'last_uploaded_file' not in st.session_state or st.session_state['last_uploaded_file'] != user_file_path:
-                load_data(user_file_path)
+            if 'last_uploaded_file' not in st.session_state or st.session_state['last_uploaded_file'] != user_file_path \
+                    or st.session_state['df_handle'].mode != mode:
+                load_data(user_file_path, mode)
                 st.session_state['last_uploaded_file'] = user_file_path  
 
         else:
             # Clear the dataframe from session state if the uploaded file is removed
-            if 'df' in st.session_state:
-                del st.session_state['df']
+            if 'df_handle' in st.session_state:
+                st.session_state['df_handle'].release()
+                del st.session_state['df_handle']
             if 'last_uploaded_file' in st.session_state:
                 del st.session_state['last_uploaded_file']
             st.error("Please upload a CSV file to proceed")
 
     elif dataset_choice == "Use Default Dataset":
         default_file_path = 'Twitter-dataset/data/edges.csv'
-        if 'default_df' not in st.session_state:
-            st.session_state['default_df'] = pd.read_csv(default_file_path, header=None, names=['Follower', 'Target'])
+        if 'default_handle' not in st.session_state or st.session_state['default_handle'].mode != mode:
+            with st.spinner("Loading dataset..."):
+                if 'default_handle' in st.session_state:
+                    st.session_state['default_handle'].release()
+                st.session_state['default_handle'] = open_dataset(default_file_path, mode)
             st.success("Data Loaded Successfully.")
 
+    handle_key = 'df_handle' if dataset_choice == "Upload CSV" else 'default_handle'
+    if dataset_choice is not None and handle_key in st.session_state:
+        show_edge_updates(handle_key)
+
     # Main area for content
     with st.container():
         
         if dataset_choice == "Upload CSV": #and 'df' in st.session_state:
-            if 'df' in st.session_state:
-                df = st.session_state['df']
+            if 'df_handle' in st.session_state:
+                df = st.session_state['df_handle'].df
+                index = st.session_state['df_handle'].index
                 # Check if a model has been selected
                 if selected_model is None or selected_model == "":
                     st.warning("Please select an analysis model from the sidebar to proceed.")
                     return
                 if selected_model == "Visualize Followers of a Target User":
-                    fot.run(df)
+                    fot.run(df, index)
                     return
                 elif selected_model == "Visualize Targets a User Follows":
-                    tof.run(df)
+                    tof.run(df, index)
                     return
                 elif selected_model == "Bidirectional View of a User":
-                    bv.run(df)
+                    bv.run(df, index)
+                    return
+                elif selected_model == "Influence Around a User":
+                    iou.run(df, index)
+                    return
+                elif selected_model == "Who to Follow":
+                    wf.run(df, index)
+                    return
+                elif selected_model == "Shortest Follow Path":
+                    fp.run(df, index)
                     return
                 elif selected_model == "Global Statistics of the Network":
-                    ns.run(df)
+                    ns.run(df, index)
                     return
 
 
-        elif dataset_choice == "Use Default Dataset" and 'default_df' in st.session_state:
-            df = st.session_state['default_df']
+        elif dataset_choice == "Use Default Dataset" and 'default_handle' in st.session_state:
+            df = st.session_state['default_handle'].df
+            index = st.session_state['default_handle'].index
             if selected_model == "Visualize Followers of a Target User":
-                fot.run(df)
+                fot.run(df, index)
                 return
             elif selected_model == "Visualize Targets a User Follows":
-                tof.run(df)
+                tof.run(df, index)
                 return
             elif selected_model == "Bidirectional View of a User":
-                bv.run(df)
+                bv.run(df, index)
+                return
+            elif selected_model == "Influence Around a User":
+                iou.run(df, index)
+                return
+            elif selected_model == "Who to Follow":
+                wf.run(df, index)
+                return
+            elif selected_model == "Shortest Follow Path":
+                fp.run(df, index)
                 return
             elif selected_model == "Global Statistics of the Network":
-                ns.run(df)
+                ns.run(df, index)
                 return
 
         else:
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from id_map import build_id_map
+
+
+def _csr(rows, columns, n):
+    # Offsets and neighbor lists of a CSR adjacency, with every neighbor list
+    # sorted. Sorting packed (row, column) keys orders both at once.
+    offset_dtype = np.int32 if len(rows) < np.iinfo(np.int32).max else np.int64
+    keys = rows.astype(np.int64) * max(n, 1) + columns
+    keys.sort()
+    neighbors = (keys % max(n, 1)).astype(columns.dtype)
+    offsets = np.zeros(n + 1, dtype=offset_dtype)
+    np.cumsum(np.bincount(rows, minlength=n), out=offsets[1:])
+    return offsets, neighbors
+
+
+class AdjacencyIndex:
+    # Forward (Follower -> Target) and reverse (Target -> Follower) adjacency
+    # over dense node indices, stored CSR-style as offsets plus sorted int32
+    # neighbor lists. A lookup is an ID translation plus a slice proportional
+    # to the user's degree.
+
+    def __init__(self, df, fingerprint=None):
+        # Content hash of the source file, used to key cached results on disk
+        self.fingerprint = fingerprint
+        self.id_map, src, dst = build_id_map(df['Follower'].to_numpy(), df['Target'].to_numpy())
+        n = len(self.id_map)
+        self.forward_offsets, self.forward_neighbors = _csr(src, dst, n)
+        self.reverse_offsets, self.reverse_neighbors = _csr(dst, src, n)
+        # Other structures computed from this dataset, kept for its lifetime
+        self.derived = {}
+
+    @classmethod
+    def from_arrays(cls, id_map, forward, reverse, fingerprint=None):
+        # Index over CSR arrays built elsewhere, as (offsets, neighbors) pairs
+        index = cls.__new__(cls)
+        index.fingerprint = fingerprint
+        index.id_map = id_map
+        index.forward_offsets, index.forward_neighbors = forward
+        index.reverse_offsets, index.reverse_neighbors = reverse
+        index.derived = {}
+        return index
+
+    @property
+    def num_nodes(self):
+        return len(self.id_map)
+
+    @property
+    def num_edges(self):
+        return len(self.forward_neighbors)
+
+    def node(self, user):
+        # Dense node index of a user ID, -1 when the user has no edges
+        return self.id_map.to_index(user)
+
+    def successors(self, node):
+        # Node indices the node follows
+        return self.forward_neighbors[self.forward_offsets[node]:self.forward_offsets[node + 1]]
+
+    def predecessors(self, node):
+        # Node indices following the node
+        return self.reverse_neighbors[self.reverse_offsets[node]:self.reverse_offsets[node + 1]]
+
+    def out_degrees(self):
+        return np.diff(self.forward_offsets)
+
+    def in_degrees(self):
+        return np.diff(self.reverse_offsets)
+
+    def edge_arrays(self):
+        # Source and destination node of every edge, grouped by source
+        src = np.repeat(np.arange(self.num_nodes, dtype=self.forward_neighbors.dtype), self.out_degrees())
+        return src, self.forward_neighbors
+
+    def followers_of(self, target):
+        # Edges whose Target is the given user, as Follower/Target user IDs
+        node = self.node(target)
+        followers = self.predecessors(node) if node >= 0 else self.reverse_neighbors[:0]
+        return pd.DataFrame({'Follower': self.id_map.to_ids(followers), 'Target': target})
+
+    def targets_of(self, follower):
+        # Edges whose Follower is the given user, as Follower/Target user IDs
+        node = self.node(follower)
+        targets = self.successors(node) if node >= 0 else self.forward_neighbors[:0]
+        return pd.DataFrame({'Follower': follower, 'Target': self.id_map.to_ids(targets)})
+
+    def in_degree(self, user):
+        node = self.node(user)
+        return int(self.reverse_offsets[node + 1] - self.reverse_offsets[node]) if node >= 0 else 0
+
+    def out_degree(self, user):
+        node = self.node(user)
+        return int(self.forward_offsets[node + 1] - self.forward_offsets[node]) if node >= 0 else 0
+
+
+def build_adjacency_index(df, fingerprint=None):
+    # Build the index once per loaded dataset
+    return AdjacencyIndex(df, fingerprint)
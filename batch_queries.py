@@ -0,0 +1,235 @@
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import network_stats as ns
+import who_to_follow as wf
+from dataset_store import get_store
+from graph_algorithms import gather_neighbors
+from out_of_core import DEFAULT_MEMORY_LIMIT_MB
+from parallel_graph import WORKERS, get_parallel_graph
+
+# Run with e.g. `python batch_queries.py edges.csv --users ids.txt --queries followers degree scores`.
+# The dataset is loaded once and the queries are answered for a batch of
+# users at a time; results are appended to one CSV or Parquet file per query.
+
+QUERIES = ['followers', 'targets', 'mutuals', 'degree', 'scores', 'recommendations']
+
+FORMATS = ['csv', 'parquet']
+
+BATCH_USERS = 1000
+
+
+def open_network(source, out_of_core=False, memory_limit=DEFAULT_MEMORY_LIMIT_MB * 1024 * 1024, compressed=False):
+    # Load a Follower,Target edge list, sharing the edge cache with the app.
+    # Returns a handle with the df and index; release it when done.
+    return get_store().open(source, out_of_core=out_of_core, memory_limit=memory_limit, compressed=compressed)
+
+
+def read_user_ids(path):
+    # User IDs from a file with one ID per line, or from the first column of
+    # a CSV. Lines that are not integers (such as a header) are skipped.
+    column = pd.read_csv(path, header=None, usecols=[0], dtype=str, skip_blank_lines=True)[0].str.strip()
+    return pd.to_numeric(column, errors='coerce').dropna().astype(np.int64).to_numpy()
+
+
+def _limit(owner, columns, limit):
+    # At most limit neighbors per user, the first ones in ID order
+    if not limit or len(owner) == 0:
+        return owner, columns
+    first = np.searchsorted(owner, owner)
+    keep = np.arange(len(owner)) - first < limit
+    return owner[keep], columns[keep]
+
+
+def neighborhoods(index, nodes, direction, graph=None):
+    # (position in nodes, neighbor) of every neighbor of nodes: gathered by
+    # the dataset's worker pool when it has one, otherwise in this process
+    if graph is not None:
+        return graph.neighborhoods(nodes, direction)
+    return gather_neighbors(getattr(index, direction + '_offsets'), getattr(index, direction + '_neighbors'), nodes)
+
+
+def followers(index, users, nodes, limit=None, graph=None):
+    owner, columns = _limit(*neighborhoods(index, nodes, 'reverse', graph), limit)
+    return pd.DataFrame({'User ID': users[owner], 'Follower': index.id_map.to_ids(columns)})
+
+
+def targets(index, users, nodes, limit=None, graph=None):
+    owner, columns = _limit(*neighborhoods(index, nodes, 'forward', graph), limit)
+    return pd.DataFrame({'User ID': users[owner], 'Target': index.id_map.to_ids(columns)})
+
+
+def mutuals(index, users, nodes, limit=None, graph=None):
+    # Users each user follows that follow them back. Both neighbor lists are
+    # sorted per user, so their packed (user, neighbor) keys intersect directly.
+    n = max(index.num_nodes, 1)
+    owner, columns = neighborhoods(index, nodes, 'forward', graph)
+    follows = owner * n + columns
+    owner, columns = neighborhoods(index, nodes, 'reverse', graph)
+    keys = np.intersect1d(follows, owner * n + columns, assume_unique=False)
+    owner, columns = keys // n, keys % n
+    keep = columns != nodes[owner]
+    owner, columns = _limit(owner[keep], columns[keep], limit)
+    return pd.DataFrame({'User ID': users[owner], 'Mutual Friend': index.id_map.to_ids(columns)})
+
+
+def degree(index, users, nodes, limit=None, graph=None):
+    return pd.DataFrame({
+        'User ID': users,
+        'Followers': np.asarray(index.reverse_offsets[nodes + 1]) - np.asarray(index.reverse_offsets[nodes]),
+        'Following': np.asarray(index.forward_offsets[nodes + 1]) - np.asarray(index.forward_offsets[nodes]),
+    })
+
+
+def scores(index, users, nodes, vectors):
+    return pd.DataFrame({'User ID': users, 'PageRank': vectors['pagerank'][nodes],
+                         'Hub Score': vectors['hubs'][nodes], 'Authority Score': vectors['authorities'][nodes]})
+
+
+def recommendations(index, users, nodes, limit=None, settings=None):
+    # Accounts each user might follow next, limit of them (ten by default)
+    return wf.recommend_many(index, users, limit or wf.DEFAULT_TOP_K, **(settings or {}))
+
+
+QUERY_FUNCTIONS = {'followers': followers, 'targets': targets, 'mutuals': mutuals, 'degree': degree}
+
+
+def score_vectors(df, index):
+    # Full PageRank and HITS vectors, from the result cache the app fills
+    pagerank, _ = ns.pagerank_scores(df, index=index)
+    hubs, authorities, _ = ns.hits_scores(df, index=index)
+    return {'pagerank': pagerank, 'hubs': hubs, 'authorities': authorities}
+
+
+def answer_batch(index, users, queries, limit=None, vectors=None, recommend_settings=None, graph=None):
+    # {query: DataFrame} for one batch of user IDs. Users missing from the
+    # network are left out. With a worker pool (graph), the neighbor lists
+    # are gathered by the workers, each from its own row block.
+    nodes = np.asarray(index.node(users), dtype=np.int64)
+    known = nodes >= 0
+    users, nodes = users[known], nodes[known]
+    results = {}
+    for query in queries:
+        if query == 'scores':
+            results[query] = scores(index, users, nodes, vectors)
+        elif query == 'recommendations':
+            results[query] = recommendations(index, users, nodes, limit, recommend_settings)
+        else:
+            results[query] = QUERY_FUNCTIONS[query](index, users, nodes, limit, graph)
+    return results, int((~known).sum())
+
+
+def run_queries(handle, users, queries, batch_users=BATCH_USERS, workers=WORKERS, limit=None, recommend_settings=None):
+    # Yield (results, missing) for consecutive batches of users, in order.
+    # Batches are answered on a thread pool (NumPy releases the GIL in the
+    # gathers), with at most two batches per worker in flight. On datasets
+    # large enough for the worker pool, the follower, target and mutual
+    # lists are gathered there by row block instead.
+    df, index = handle.df, handle.index
+    vectors = score_vectors(df, index) if 'scores' in queries else None
+    graph = get_parallel_graph(index, workers) if {'followers', 'targets', 'mutuals'} & set(queries) else None
+    users = np.asarray(users, dtype=np.int64)
+    batches = (users[start:start + batch_users] for start in range(0, len(users), batch_users))
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='batch-queries') as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(answer_batch, index, batch, queries, limit, vectors, recommend_settings, graph))
+            if len(pending) >= 2 * max(workers, 1):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ResultWriter:
+    # Appends the batches of one query to a CSV or Parquet file as they come
+
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+        self.writer = None
+        self.started = False
+        self.rows = 0
+
+    def write(self, frame):
+        if self.file_format == 'parquet':
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            # The first batch writes the header, even when it is empty
+            frame.to_csv(self.path, mode='a' if self.started else 'w', header=not self.started, index=False)
+        self.started = True
+        self.rows += len(frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def write_queries(handle, users, queries, output_dir, file_format='csv', batch_users=BATCH_USERS, workers=WORKERS,
+                  limit=None, recommend_settings=None):
+    # Answer the queries for every user and stream them to
+    # output_dir/<query>.<format>. Returns the rows written per query and the
+    # number of users not in the network.
+    os.makedirs(output_dir, exist_ok=True)
+    writers = {query: ResultWriter(os.path.join(output_dir, f"{query}.{file_format}"), file_format) for query in queries}
+    missing = 0
+    try:
+        for results, batch_missing in run_queries(handle, users, queries, batch_users, workers, limit, recommend_settings):
+            missing += batch_missing
+            for query, frame in results.items():
+                writers[query].write(frame)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {query: writer.rows for query, writer in writers.items()}, missing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer per-user queries for a list of users without the GUI.")
+    parser.add_argument('edges', help="Follower,Target edge list CSV")
+    parser.add_argument('--users', required=True, help="file with one user ID per line (or a CSV whose first column holds them)")
+    parser.add_argument('--queries', nargs='+', choices=QUERIES, default=QUERIES)
+    parser.add_argument('--output-dir', default='query_results')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_USERS, help="users answered per batch")
+    parser.add_argument('--limit', type=int, default=0,
+                        help="most followers, targets or mutuals listed per user (0 for all), or recommendations (0 for ten)")
+    parser.add_argument('--similarity', choices=list(wf.SIMILARITIES), default='jaccard', help="how recommendations are ranked")
+    parser.add_argument('--basis', choices=list(wf.BASES), default='targets',
+                        help="recommend accounts followed by the accounts each user follows, or by their followers")
+    parser.add_argument('--hub-limit', type=int, default=wf.DEFAULT_HUB_LIMIT,
+                        help="skip users following more accounts than this when recommending")
+    parser.add_argument('--added', help="edge list CSV of new edges to apply before answering")
+    parser.add_argument('--removed', help="edge list CSV of edges to remove before answering")
+    parser.add_argument('--out-of-core', action='store_true', help="keep the edges and index on disk")
+    parser.add_argument('--memory-limit', type=int, default=DEFAULT_MEMORY_LIMIT_MB, help="out-of-core memory limit in MB")
+    parser.add_argument('--compressed', action='store_true', help="keep the out-of-core index compressed")
+    args = parser.parse_args(argv)
+
+    users = read_user_ids(args.users)
+    handle = open_network(args.edges, args.out_of_core, args.memory_limit * 1024 * 1024, args.compressed)
+    try:
+        if args.added or args.removed:
+            handle = get_store().update(handle, args.added, args.removed)
+        recommend_settings = {'similarity': args.similarity, 'basis': args.basis, 'hub_limit': args.hub_limit}
+        rows, missing = write_queries(handle, users, args.queries, args.output_dir, args.format, args.batch_size,
+                                      args.workers, args.limit or None, recommend_settings)
+    finally:
+        handle.release()
+    for query, count in rows.items():
+        print(f"{query}: {count:,} rows written to {os.path.join(args.output_dir, f'{query}.{args.format}')}")
+    if missing:
+        print(f"{missing:,} of {len(users):,} users are not in the network", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import psutil
+import streamlit as st
+import GUI
+import bidirectional_view_of_user as bv
+import followers_of_target as fot
+import targets_of_follower as tof
+import network_stats as ns
+from dataset_cache import CACHE_DIR
+from dataset_store import get_store
+from graph_rendering import sample_neighbors, split_cap, DEFAULT_NODE_CAP
+from instrumentation import PeakMemory
+from out_of_core import DEFAULT_MEMORY_LIMIT_MB
+from parallel_graph import WORKERS
+from result_cache import RESULT_CACHE_DIR
+
+# Run with e.g. `python benchmark.py --edges 1e5 1e6 --output results.json`.
+# Every scale gets a synthetic edge list; every public lookup, renderer and
+# metric is timed on it from a cold cache, together with its peak memory.
+
+DEFAULT_SCALES = [100_000, 1_000_000]
+
+# Users per synthetic node, about what the Twitter dataset has
+DEFAULT_MEAN_DEGREE = 8.0
+
+# Degree distributions fall off as degree ** -exponent
+DEFAULT_OUT_EXPONENT = 2.5
+DEFAULT_IN_EXPONENT = 2.1
+
+WRITE_ROWS = 2_000_000
+
+RANGE_OF_INTEREST = 10
+
+
+def _power_law_weights(n, exponent, rng):
+    # Chung-Lu weights, node rank ** (-1 / (exponent - 1)), in a random order
+    # so that the heaviest followers and targets are different users
+    weights = np.arange(1, n + 1, dtype=np.float64) ** (-1.0 / (exponent - 1.0))
+    cumulative = np.cumsum(rng.permutation(weights))
+    return cumulative / cumulative[-1]
+
+
+def write_power_law_edges(path, num_edges, mean_degree=DEFAULT_MEAN_DEGREE, out_exponent=DEFAULT_OUT_EXPONENT,
+                          in_exponent=DEFAULT_IN_EXPONENT, seed=0):
+    # Write a directed edge list whose out- and in-degrees follow power laws,
+    # in the headerless Follower,Target format of the default dataset. Each
+    # edge picks its follower and target with probability proportional to
+    # their weights, a block of rows at a time, so any scale fits in memory.
+    rng = np.random.default_rng(seed)
+    num_nodes = max(int(num_edges / mean_degree), 2)
+    out_weights = _power_law_weights(num_nodes, out_exponent, rng)
+    in_weights = _power_law_weights(num_nodes, in_exponent, rng)
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        for start in range(0, num_edges, WRITE_ROWS):
+            rows = min(WRITE_ROWS, num_edges - start)
+            # User IDs start at 1, as the app expects
+            followers = np.searchsorted(out_weights, rng.random(rows), side='right') + 1
+            targets = np.searchsorted(in_weights, rng.random(rows), side='right') + 1
+            pd.DataFrame({'Follower': np.minimum(followers, num_nodes), 'Target': np.minimum(targets, num_nodes)}) \
+                .to_csv(file, header=False, index=False)
+    return num_nodes
+
+
+def _reset(index):
+    # Forget computed results, so every run starts from a cold cache. The
+    # worker pool of a parallel graph is kept, as the app keeps it too.
+    if index is not None:
+        kept = {name: value for name, value in index.derived.items() if name == 'parallel_graph'}
+        index.derived.clear()
+        index.derived.update(kept)
+    shutil.rmtree(RESULT_CACHE_DIR, ignore_errors=True)
+    plt.close('all')
+
+
+def measure(function, repeats, setup=None):
+    # Wall times of repeats cold runs of function(), and the largest peak
+    # memory growth among them. Returns the timing and the last result.
+    seconds, peaks = [], []
+    result = None
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        with PeakMemory() as memory:
+            started = time.perf_counter()
+            result = function()
+            seconds.append(time.perf_counter() - started)
+        peaks.append(memory.growth())
+    timing = {'seconds': seconds, 'best': min(seconds), 'median': statistics.median(seconds),
+              'peak_rss_growth_bytes': max(peaks)}
+    return timing, result
+
+
+def _forget_loaded():
+    # Drop the loaded dataset from the shared store, so the next load reads
+    # the file (or its edge cache) again
+    handle = st.session_state.pop('df_handle', None)
+    if handle is not None:
+        handle.release()
+    store = get_store()
+    with store.lock:
+        store.entries.clear()
+
+
+def _hub(degrees):
+    return int(np.argmax(degrees)) if len(degrees) else 0
+
+
+def _index_bytes(index):
+    # Bytes of the follower/target index files of an out-of-core index, None in memory
+    directory = getattr(index, 'directory', None)
+    if directory is None or not getattr(index, 'out_of_core', False):
+        return None
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+               if name.startswith(('forward_', 'reverse_')))
+
+
+def benchmark_scale(path, out_of_core, memory_limit, repeats, log, compressed=False):
+    results = {}
+
+    def record(name, function, setup=None, **details):
+        timing, result = measure(function, repeats, setup)
+        results[name] = dict(timing, **details)
+        log(f"  {name}: {timing['best']:.3f}s best, {timing['peak_rss_growth_bytes'] / 2 ** 20:.0f} MB peak growth")
+        return result
+
+    mode = (out_of_core, memory_limit, compressed and out_of_core)
+
+    # Loading from the CSV, then from the binary edge cache it leaves behind
+    def cold():
+        _forget_loaded()
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    record('load_data (csv)', lambda: GUI.load_data(path, mode), setup=cold)
+    record('load_data (edge cache)', lambda: GUI.load_data(path, mode), setup=_forget_loaded)
+    handle = st.session_state['df_handle']
+    df, index = handle.df, handle.index
+
+    # Lookups and renderers on the busiest users, drawn as the app draws them
+    # with the default cap on users
+    out_degree, in_degree = np.asarray(index.out_degrees()), np.asarray(index.in_degrees())
+    target = int(index.id_map.ids[_hub(in_degree)])
+    follower = int(index.id_map.ids[_hub(out_degree)])
+    user = int(index.id_map.ids[_hub(out_degree + in_degree)])
+
+    followers = record('get_followers_of_target', lambda: fot.get_followers_of_target(target, df, index),
+                       user=target, edges=int(in_degree.max()) if len(in_degree) else 0)
+    targets = record('get_targets_user_follows', lambda: tof.get_targets_user_follows(follower, df, index),
+                     user=follower, edges=int(out_degree.max()) if len(out_degree) else 0)
+
+    def both_directions():
+        return bv.get_followers_of_target(user, df, index), bv.get_targets_user_follows(user, df, index)
+    user_followers, user_targets = record('get_followers_and_targets (bidirectional)', both_directions, user=user)
+
+    shown_followers, _ = sample_neighbors(followers, 'Follower', DEFAULT_NODE_CAP, index=index)
+    shown_targets, _ = sample_neighbors(targets, 'Target', DEFAULT_NODE_CAP, index=index)
+    followers_cap, targets_cap = split_cap(DEFAULT_NODE_CAP, len(user_followers), len(user_targets))
+    shown_both = pd.concat([sample_neighbors(user_targets, 'Target', targets_cap, index=index)[0],
+                            sample_neighbors(user_followers, 'Follower', followers_cap, index=index)[0]])
+    record('visualize_followers_of_target', lambda: fot.visualize_followers_of_target(target, shown_followers),
+           user=target, edges=len(shown_followers))
+    record('visualize_targets_user_follows', lambda: tof.visualize_targets_user_follows(follower, shown_targets),
+           user=follower, edges=len(shown_targets))
+    record('bidirectional_view_of_target', lambda: bv.bidirectional_view_of_target(user, shown_both),
+           user=user, edges=len(shown_both))
+
+    # Every network statistic, from a cold result cache
+    metrics = {
+        'most_active_followers': lambda: ns.most_active_followers(df, RANGE_OF_INTEREST, index),
+        'most_followed_targets': lambda: ns.most_followed_targets(df, RANGE_OF_INTEREST, index),
+        'get_degree_centrality': lambda: ns.get_degree_centrality(df, RANGE_OF_INTEREST, index),
+        'get_pagerank': lambda: ns.get_pagerank(df, RANGE_OF_INTEREST, index=index),
+        'get_hits_scores': lambda: ns.get_hits_scores(df, RANGE_OF_INTEREST, index=index),
+        'get_reciprocity': lambda: ns.get_reciprocity(df, RANGE_OF_INTEREST, index),
+        'component_report (weak)': lambda: ns.component_report(df, 'weak', index),
+        'component_report (strong)': lambda: ns.component_report(df, 'strong', index),
+        'get_triangles': lambda: ns.get_triangles(df, index=index),
+    }
+    for name, function in metrics.items():
+        record(name, function, setup=lambda: _reset(index))
+    _reset(index)
+
+    _forget_loaded()
+    return results, {'nodes': int(index.num_nodes), 'edge_rows': int(index.num_edges), 'index_bytes': _index_bytes(index)}
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'workers': WORKERS,
+        'memory_bytes': psutil.virtual_memory().total,
+    }
+
+
+def run_benchmarks(scales, workdir, out_of_core=False, memory_limit=DEFAULT_MEMORY_LIMIT_MB * 1024 * 1024, repeats=3,
+                   mean_degree=DEFAULT_MEAN_DEGREE, out_exponent=DEFAULT_OUT_EXPONENT, in_exponent=DEFAULT_IN_EXPONENT,
+                   seed=0, log=print, compressed=False):
+    # Benchmark every scale in workdir, which holds the generated edge lists
+    # and the caches the app writes while it runs
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'environment': environment(), 'runs': []}
+    previous = os.getcwd()
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    try:
+        for num_edges in scales:
+            path = os.path.abspath(f"power_law_{num_edges}_{seed}.csv")
+            log(f"{num_edges:,} edges")
+            started = time.perf_counter()
+            if not os.path.exists(path):
+                write_power_law_edges(path, num_edges, mean_degree, out_exponent, in_exponent, seed)
+            generated = time.perf_counter() - started
+            results, graph = benchmark_scale(path, out_of_core, memory_limit, repeats, log, compressed)
+            report['runs'].append({
+                'edges': num_edges, 'mean_degree': mean_degree, 'out_exponent': out_exponent,
+                'in_exponent': in_exponent, 'seed': seed, 'out_of_core': out_of_core, 'compressed': compressed and out_of_core,
+                'memory_limit_bytes': memory_limit if out_of_core else None, 'repeats': repeats,
+                'generate_seconds': generated, 'graph': graph, 'results': results,
+            })
+    finally:
+        os.chdir(previous)
+    return report
+
+
+def compare_reports(old, new):
+    # (edges, function, old best, new best, ratio) for every function timed
+    # at the same scale and mode in both reports
+    rows = []
+    old_runs = {(run['edges'], run['out_of_core'], run.get('compressed', False)): run for run in old['runs']}
+    for run in new['runs']:
+        before = old_runs.get((run['edges'], run['out_of_core'], run.get('compressed', False)))
+        if before is None:
+            continue
+        for name, timing in run['results'].items():
+            if name in before['results']:
+                old_best = before['results'][name]['best']
+                rows.append((run['edges'], name, old_best, timing['best'], timing['best'] / old_best if old_best else float('inf')))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the network analysis functions on synthetic power-law graphs.")
+    parser.add_argument('--edges', nargs='+', type=float, default=DEFAULT_SCALES, help="edge counts to generate, e.g. 1e5 1e6")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the JSON report")
+    parser.add_argument('--compare', help="an earlier JSON report to compare the new timings with")
+    parser.add_argument('--repeats', type=int, default=3, help="cold runs per function")
+    parser.add_argument('--workdir', help="directory for the edge lists and caches (default: a temporary one)")
+    parser.add_argument('--out-of-core', action='store_true', help="load the edges in out-of-core mode")
+    parser.add_argument('--memory-limit', type=int, default=DEFAULT_MEMORY_LIMIT_MB, help="out-of-core memory limit in MB")
+    parser.add_argument('--compressed', action='store_true', help="compress the out-of-core index")
+    parser.add_argument('--mean-degree', type=float, default=DEFAULT_MEAN_DEGREE)
+    parser.add_argument('--out-exponent', type=float, default=DEFAULT_OUT_EXPONENT)
+    parser.add_argument('--in-exponent', type=float, default=DEFAULT_IN_EXPONENT)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='network-benchmark-')
+    report = run_benchmarks([int(edges) for edges in args.edges], workdir, args.out_of_core, args.memory_limit * 1024 * 1024,
+                            args.repeats, args.mean_degree, args.out_exponent, args.in_exponent, args.seed,
+                            compressed=args.compressed)
+    if args.workdir is None:
+        shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            old = json.load(file)
+        for edges, name, old_best, new_best, ratio in compare_reports(old, report):
+            print(f"{edges:>12,}  {name:<45} {old_best:9.3f}s -> {new_best:9.3f}s  x{ratio:.2f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,94 +1,37 @@
 import pandas as pd
-import networkx as nx
 import streamlit as st
-from pyvis.network import Network
 import streamlit.components.v1 as components
-import tempfile
-import os
-import shutil
-
-def get_followers_of_target(target, df):
-    df_followers_of_target = df[df.Target == target]
-    return df_followers_of_target
-
-def get_targets_user_follows(follower, df):
-    df_targets_user_follows = df[df.Follower == follower]
-    return df_targets_user_follows
+from graph_rendering import render_network_html, sample_neighbors, split_cap, DEFAULT_NODE_CAP, SAMPLING_METHODS
+from adjacency_index import build_adjacency_index
+from ego_network import extract_ego_network, DIRECTIONS, DEFAULT_FANOUTS
+from reciprocity import mutual_friends, mark_mutual_edges
+from instrumentation import stage
+
+def get_followers_of_target(target, df, index=None):
+    # Answer from the adjacency index when one was built for this dataset
+    with stage("Find followers"):
+        if index is not None:
+            return index.followers_of(target)
+        df_followers_of_target = df[df.Target == target]
+        return df_followers_of_target
+
+def get_targets_user_follows(follower, df, index=None):
+    # Answer from the adjacency index when one was built for this dataset
+    with stage("Find targets"):
+        if index is not None:
+            return index.targets_of(follower)
+        df_targets_user_follows = df[df.Follower == follower]
+        return df_targets_user_follows
 
 def bidirectional_view_of_target(target, df):
-    G = nx.from_pandas_edgelist(df, 'Follower', 'Target', create_using=nx.DiGraph())
-
-    pos = nx.circular_layout(G)
-
-    # Create a Pyvis network
-    net = Network(notebook=False, width="100%", height="900px", directed=True)
-    net.toggle_hide_edges_on_drag(False)
-    net.toggle_physics(True)
+    # Render the edges to an HTML string in memory
+    return render_network_html(target, df, direction="LR")
 
-    for node in G.nodes:
-        size = 35 if node == target else 25  # Increase the size for better visibility
-        color = '#FF9999' if node == target else '#4169E1'  # Light blue color for regular nodes
-        border_color = '#00008B'  # Dark blue border for contrast
-        title = f"ID: {node}"  # The title will be shown on hover
-        net.add_node(node, label=str(node), x=pos[node][0]*1000, y=pos[node][1]*1000, size=size, color=color, title=title, borderWidth=2, borderColor=border_color, font={'size': 14, 'color': '#000000'})
-
-    for edge in G.edges:
-        net.add_edge(edge[0], edge[1], width=0.5)  # Keep edges thin
-
-    # Use hierarchical layout to potentially improve the clarity
-    net.set_options("""
-    {
-      "physics": {
-        "hierarchicalRepulsion": {
-          "centralGravity": 0.0,
-          "springLength": 100,
-          "springConstant": 0.01,
-          "nodeDistance": 120,
-          "damping": 0.09
-        },
-        "minVelocity": 0.75,
-        "solver": "hierarchicalRepulsion"
-      },
-      "nodes": {
-        "scaling": {
-          "label": {
-            "enabled": true
-          }
-        }
-      },
-      "edges": {
-        "color": {
-          "inherit": true
-        },
-        "smooth": false
-      },
-      "layout": {
-        "hierarchical": {
-          "enabled": false,
-          "levelSeparation": 150,
-          "nodeSpacing": 100,
-          "treeSpacing": 200,
-          "blockShifting": true,
-          "edgeMinimization": true,
-          "parentCentralization": true,
-          "direction": "LR", 
-          "sortMethod": "directed" 
-        }
-      }
-    }
-    """)
-
-    # Create a temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.html')
-    
-    # Generate the network in the temporary file
-    net.save_graph(temp_file.name)
-
-    return temp_file.name
-
-def run(df):
+def run(df, index=None):
     
     data = df
+    if index is None:
+        index = build_adjacency_index(data)
 
     st.subheader("Visualize the Bidirectional View of a Target User")
     
@@ -110,23 +53,48 @@ def run(df):
 
     # Display the head the data so user can pick a target
     st.dataframe(data[0:1000], height=150)
-    
+
+    # Large neighborhoods are drawn as a sample of at most node_cap users
+    node_cap = st.number_input('Maximum Users to Draw', 10, 100000, DEFAULT_NODE_CAP, 50)
+    sampling = st.radio('Sampling for Large Neighborhoods', SAMPLING_METHODS, horizontal=True)
+
+    # The ego network follows edges for up to three hops instead of one
+    view = st.radio('View', ["Direct Followers and Targets", "K-Hop Ego Network"], horizontal=True)
+    if view == "K-Hop Ego Network":
+        hops = st.slider('Hops', 1, 3, 2)
+        direction = st.radio('Direction', DIRECTIONS, horizontal=True)
+        columns = st.columns(3)
+        fanouts = [columns[hop].number_input(f'Users per User at Hop {hop + 1}', 1, 100000, DEFAULT_FANOUTS[hop], 1)
+                   for hop in range(hops)]
+
     if st.button('Visualize') and valid_input is True:
         with st.spinner('Generating Visualization...'):
-            followers_of_target = get_followers_of_target(user_id, data)
-            targets_user_follows = get_targets_user_follows(user_id, data)
-            filtered_df = pd.concat([targets_user_follows, followers_of_target])
-            
-            temp_file_path = bidirectional_view_of_target(user_id, filtered_df) 
-            
-            # Read from the temporary file
-            with open(temp_file_path, 'r', encoding='utf-8') as file:
-                source_code = file.read()
-                components.html(source_code, width=700, height=800)
-
-            # Clean up: delete the temporary file
-            os.remove(temp_file_path)
-            shutil.rmtree('lib')
+            if view == "K-Hop Ego Network":
+                with stage("Extract ego network"):
+                    filtered_df, hop_counts = extract_ego_network(index, user_id, hops, direction,
+                                                                  [int(fanout) for fanout in fanouts], int(node_cap), sampling)
+                counts = ", ".join(f"{count['users']} new users at hop {count['hop']}" for count in hop_counts)
+                st.markdown(f"**{len(filtered_df)} edges shown: {counts or 'user not found'}**")
+            else:
+                followers_of_target = get_followers_of_target(user_id, data, index)
+                targets_user_follows = get_targets_user_follows(user_id, data, index)
+
+                # Share the node cap between both directions
+                followers_cap, targets_cap = split_cap(int(node_cap), len(followers_of_target), len(targets_user_follows))
+                followers_shown, followers_total = sample_neighbors(followers_of_target, 'Follower', followers_cap, sampling, index)
+                targets_shown, targets_total = sample_neighbors(targets_user_follows, 'Target', targets_cap, sampling, index)
+                st.markdown(f"**{len(followers_shown)} of {followers_total} followers and {len(targets_shown)} of {targets_total} targets shown**")
+                filtered_df = pd.concat([targets_shown, followers_shown])
+
+            # Users following each other are listed and their edges highlighted
+            with stage("Find mutual friends"):
+                friends = mutual_friends(index, user_id)
+                filtered_df = mark_mutual_edges(index, filtered_df)
+            st.markdown(f"**{len(friends)} mutual friends**")
+            st.dataframe(pd.DataFrame({'User ID': friends}), height=150)
+
+            source_code = bidirectional_view_of_target(user_id, filtered_df)
+            components.html(source_code, width=700, height=800)
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
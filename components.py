@@ -0,0 +1,236 @@
+import numpy as np
+
+# Once this few edges are left, the remaining strongly connected components
+# are found with an iterative Tarjan pass instead of more coloring rounds
+TARJAN_EDGES = 1_000_000
+
+# Start nodes between progress callbacks in the Tarjan pass
+TARJAN_REPORT_NODES = 65_536
+
+
+class EdgeStream:
+    # Distinct non-loop edges of an index among the nodes still alive, as
+    # (src, dst) blocks. An in-memory index keeps them as one pair of arrays
+    # that shrinks as nodes are removed; an out-of-core index streams its
+    # edge blocks until the remaining edges fit in one block. callback() is
+    # called before every block handed out.
+
+    def __init__(self, index, callback=None):
+        self.index = index
+        self.callback = callback
+        self.alive = None
+        self.arrays = None
+        if getattr(index, 'out_of_core', False):
+            self.limit = index.chunk_edges
+        else:
+            self.limit = None
+            src, dst = index.edge_arrays()
+            self.arrays = self._keep(src, dst, None)
+
+    @staticmethod
+    def _keep(src, dst, alive, distinct=None):
+        keep = src != dst
+        if distinct is not None:
+            keep &= distinct
+        if alive is not None:
+            keep &= alive[src] & alive[dst]
+        return src[keep], dst[keep]
+
+    def blocks(self):
+        if self.arrays is not None:
+            self.report()
+            yield self.arrays
+            return
+        for src, dst, distinct in self.index.edge_blocks():
+            self.report()
+            yield self._keep(src, dst, self.alive, distinct)
+
+    def report(self):
+        if self.callback is not None:
+            self.callback()
+
+    def restrict(self, alive):
+        # Drop edges touching nodes that are no longer alive
+        self.alive = alive
+        if self.arrays is not None:
+            self.arrays = self._keep(*self.arrays, alive)
+        elif self.count() <= self.limit:
+            blocks = list(self.blocks())
+            self.arrays = (np.concatenate([src for src, _ in blocks]), np.concatenate([dst for _, dst in blocks]))
+
+    def count(self):
+        return sum(len(src) for src, _ in self.blocks())
+
+
+def weakly_connected_components(index, callback=None):
+    # Union-find over arrays: every round hooks the root of each edge's larger
+    # label under the smaller one, then compresses paths by pointer jumping
+    # until every node points at its root. Labels only decrease, so no cycles
+    # form, and the rounds stop when no edge joins two different roots.
+    # Returns the root of every node, which is the smallest node in its
+    # component. callback() is called before every pass over a block of edges.
+    parent = np.arange(index.num_nodes, dtype=np.int64)
+    stream = EdgeStream(index, callback)
+    rounds = 0
+    while True:
+        rounds += 1
+        merged = False
+        for src, dst in stream.blocks():
+            root_src, root_dst = parent[src], parent[dst]
+            joined = root_src != root_dst
+            if joined.any():
+                merged = True
+                np.minimum.at(parent, np.maximum(root_src[joined], root_dst[joined]),
+                              np.minimum(root_src[joined], root_dst[joined]))
+                parent = _compress(parent)
+        if not merged:
+            break
+    return parent, {'rounds': rounds}
+
+
+def _compress(parent):
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+
+def _trim(stream, labels, alive):
+    # Nodes with no remaining in- or out-edges are strongly connected
+    # components of their own; removing them can expose more
+    n = len(alive)
+    while True:
+        out_degree = np.zeros(n, dtype=np.int64)
+        in_degree = np.zeros(n, dtype=np.int64)
+        for src, dst in stream.blocks():
+            out_degree += np.bincount(src, minlength=n)
+            in_degree += np.bincount(dst, minlength=n)
+        trimmed = alive & ((out_degree == 0) | (in_degree == 0))
+        if not trimmed.any():
+            return
+        labels[trimmed] = np.flatnonzero(trimmed)
+        alive &= ~trimmed
+        stream.restrict(alive)
+
+
+def _color_phase(stream, labels, alive):
+    # Forward-propagate the largest node index to a fixpoint; each node whose
+    # color is its own index is a root, and its component is the set of nodes
+    # of the same color that reach it. Those components are removed.
+    n = len(alive)
+    color = np.where(alive, np.arange(n), -1)
+    while True:
+        updated = color.copy()
+        for src, dst in stream.blocks():
+            np.maximum.at(updated, dst, color[src])
+        if np.array_equal(updated, color):
+            break
+        color = updated
+
+    member = alive & (color == np.arange(n))
+    while True:
+        added = False
+        for src, dst in stream.blocks():
+            reached = member[dst] & ~member[src] & (color[src] == color[dst])
+            if reached.any():
+                member[src[reached]] = True
+                added = True
+        if not added:
+            break
+    labels[member] = color[member]
+    alive &= ~member
+    stream.restrict(alive)
+
+
+def _tarjan(stream, labels, alive):
+    # Iterative Tarjan over the remaining subgraph, with an explicit stack of
+    # (node, next edge position) in place of recursion
+    nodes = np.flatnonzero(alive)
+    if len(nodes) == 0:
+        return
+    local = np.full(len(alive), -1, dtype=np.int64)
+    local[nodes] = np.arange(len(nodes))
+    blocks = list(stream.blocks())
+    src = local[np.concatenate([src for src, _ in blocks])] if blocks else np.empty(0, dtype=np.int64)
+    dst = local[np.concatenate([dst for _, dst in blocks])] if blocks else np.empty(0, dtype=np.int64)
+    order = np.argsort(src, kind='stable')
+    offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=len(nodes)), out=offsets[1:])
+    offsets, neighbors = offsets.tolist(), dst[order].tolist()
+
+    count = len(nodes)
+    number = [-1] * count
+    lowlink = [0] * count
+    on_stack = [False] * count
+    component = [-1] * count
+    stack = []
+    counter = 0
+    for start in range(count):
+        if number[start] >= 0:
+            continue
+        if start % TARJAN_REPORT_NODES == 0:
+            stream.report()
+        work = [(start, offsets[start])]
+        number[start] = lowlink[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack[start] = True
+        while work:
+            node, position = work[-1]
+            if position < offsets[node + 1]:
+                work[-1] = (node, position + 1)
+                neighbor = neighbors[position]
+                if number[neighbor] < 0:
+                    number[neighbor] = lowlink[neighbor] = counter
+                    counter += 1
+                    stack.append(neighbor)
+                    on_stack[neighbor] = True
+                    work.append((neighbor, offsets[neighbor]))
+                elif on_stack[neighbor]:
+                    lowlink[node] = min(lowlink[node], number[neighbor])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == number[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = node
+                    if member == node:
+                        break
+
+    labels[nodes] = nodes[np.asarray(component)]
+    alive[:] = False
+
+
+def strongly_connected_components(index, callback=None):
+    # Trimming and coloring rounds over the edge arrays, finished by an
+    # iterative Tarjan pass once few edges remain. No step recurses.
+    # Returns a representative node of every node's component. callback() is
+    # called before every pass over a block of edges.
+    n = index.num_nodes
+    labels = np.full(n, -1, dtype=np.int64)
+    alive = np.ones(n, dtype=bool)
+    stream = EdgeStream(index, callback)
+    phases = 0
+    while alive.any():
+        _trim(stream, labels, alive)
+        if stream.count() <= TARJAN_EDGES:
+            _tarjan(stream, labels, alive)
+            break
+        phases += 1
+        _color_phase(stream, labels, alive)
+    return labels, {'phases': phases}
+
+
+def component_summary(labels):
+    # Components numbered from largest to smallest, their sizes, and the
+    # number of the component of every node
+    representatives, component, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    order = np.lexsort((representatives, -sizes))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[component], sizes[order]
@@ -0,0 +1,212 @@
+import json
+import os
+import numpy as np
+from id_map import index_dtype
+
+# Neighbor list entries per block. A lookup decodes the whole blocks holding
+# the entries it asks for; every block starts with a full value, so any block
+# decodes without the ones before it.
+BLOCK_EDGES = 128
+
+# Working bytes per edge while a block of edges is decoded: the encoded bytes,
+# the int64 gaps and their running sums, and the restart mask
+DECODE_BYTES_PER_EDGE = 40
+
+
+def _varint_lengths(values):
+    # Bytes each non-negative value takes as a varint, 7 bits per byte
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 63, 7):
+        lengths += values >= (1 << shift)
+    return lengths
+
+
+def _encode_varints(values, lengths):
+    # Values as little-endian base-128 varints; the high bit of a byte is set
+    # when more bytes of the same value follow
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    data = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    for k in range(int(lengths.max()) if len(lengths) else 0):
+        longer = np.flatnonzero(lengths > k)
+        chunk = (values[longer] >> (7 * k)) & 0x7F
+        chunk |= (lengths[longer] > k + 1) * 0x80
+        data[starts[longer] + k] = chunk
+    return data
+
+
+def _decode_varints(data):
+    # Inverse of _encode_varints: one int64 per byte with the high bit clear
+    data = np.asarray(data)
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) == 0:
+        return np.empty(0, dtype=np.int64)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    values = (data[starts] & 0x7F).astype(np.int64)
+    extra = ends - starts
+    for k in range(1, int(extra.max()) + 1):
+        longer = np.flatnonzero(extra >= k)
+        values[longer] |= (data[starts[longer] + k] & 0x7F).astype(np.int64) << (7 * k)
+    return values
+
+
+def _ranges(starts, ends):
+    # starts[0]..ends[0]-1, starts[1]..ends[1]-1, ... as one array
+    lengths = ends - starts
+    return np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+
+
+def _range_restarts(offsets, start, end, block_edges):
+    # Which of the positions start..end-1 begin a block or a neighbor list.
+    # Those hold full values; every other position holds the gap to the
+    # entry before it.
+    restart = np.zeros(end - start, dtype=bool)
+    restart[(-start) % block_edges::block_edges] = True
+    # Searching with the offsets' own dtype keeps numpy from converting all of them
+    first, last = np.searchsorted(offsets, np.array([start, end], dtype=offsets.dtype))
+    restart[np.asarray(offsets[first:last], dtype=np.int64) - start] = True
+    return restart
+
+
+def _position_restarts(offsets, positions, block_edges):
+    # Same as _range_restarts for any sorted positions
+    rows = np.searchsorted(offsets, positions.astype(offsets.dtype), side='right') - 1
+    return (positions % block_edges == 0) | (np.asarray(offsets[rows], dtype=np.int64) == positions)
+
+
+def _gaps(values, restart):
+    gaps = np.empty_like(values)
+    gaps[:1] = values[:1]
+    np.subtract(values[1:], values[:-1], out=gaps[1:])
+    gaps[restart] = values[restart]
+    return gaps
+
+
+def _undo_gaps(gaps, restart):
+    # Running sums of the gaps, restarted at every full value. The sums before
+    # each restart never decrease (gaps are non-negative), so the base to take
+    # off carries forward with a running maximum.
+    values = np.cumsum(gaps)
+    base = np.where(restart, values - gaps, 0)
+    np.maximum.accumulate(base, out=base)
+    values -= base
+    return values
+
+
+class CompressedNeighbors:
+    # Read-only stand-in for the neighbor array of a CSR adjacency. The sorted
+    # neighbor lists are stored as gaps between consecutive entries, encoded
+    # as varints in blocks of block_edges entries, with the byte offset of
+    # every block in blocks. Slices and integer-array indexing decode only
+    # the blocks holding the positions asked for, so lookups work straight
+    # from memory-mapped files.
+
+    def __init__(self, offsets, blocks, data, dtype, block_edges=BLOCK_EDGES):
+        self.offsets = offsets
+        self.blocks = blocks
+        self.data = data
+        self.dtype = np.dtype(dtype)
+        self.block_edges = block_edges
+        self.shape = (int(offsets[-1]),)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _decode_range(self, first, last):
+        # Every entry of blocks first..last-1
+        start, end = first * self.block_edges, min(last * self.block_edges, len(self))
+        gaps = _decode_varints(self.data[int(self.blocks[first]):int(self.blocks[last])])
+        return _undo_gaps(gaps, _range_restarts(self.offsets, start, end, self.block_edges))
+
+    def _decode_blocks(self, blocks):
+        # Every entry of the given sorted, distinct blocks, in order
+        data = self.data[_ranges(np.asarray(self.blocks[blocks], dtype=np.int64),
+                                 np.asarray(self.blocks[blocks + 1], dtype=np.int64))]
+        starts = blocks * self.block_edges
+        positions = _ranges(starts, np.minimum(starts + self.block_edges, len(self)))
+        return _undo_gaps(_decode_varints(data), _position_restarts(self.offsets, positions, self.block_edges))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                if start >= stop:
+                    return np.empty(0, dtype=self.dtype)
+                first, last = start // self.block_edges, (stop - 1) // self.block_edges + 1
+                offset = first * self.block_edges
+                return self._decode_range(first, last)[start - offset:stop - offset].astype(self.dtype)
+            key = np.arange(start, stop, step)
+        positions = np.asarray(key)
+        if positions.dtype == bool:
+            positions = np.flatnonzero(positions)
+        positions = positions.astype(np.int64)
+        positions = np.where(positions < 0, positions + len(self), positions)
+        if positions.size and (positions.min() < 0 or positions.max() >= len(self)):
+            raise IndexError(f"index out of bounds for {len(self)} neighbors")
+        if positions.size == 0:
+            return np.empty(positions.shape, dtype=self.dtype)
+        # Only the last block can be short, so the entry of a position sits at
+        # the rank of its block times the block size plus its place in it
+        block = positions // self.block_edges
+        blocks = np.unique(block)
+        values = self._decode_blocks(blocks)
+        found = values[np.searchsorted(blocks, block) * self.block_edges + positions % self.block_edges]
+        result = found.astype(self.dtype)
+        return result[()] if result.ndim == 0 else result
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:]
+        return values if dtype is None else values.astype(dtype)
+
+
+def compress_neighbors(directory, prefix, chunk_edges, block_edges=BLOCK_EDGES):
+    # Replace <prefix>_neighbors.npy in directory with its compressed form,
+    # <prefix>_blocks.npy and <prefix>_data.npy, a chunk of whole blocks at a
+    # time. The first pass sizes every block, the second writes the bytes.
+    offsets = np.load(os.path.join(directory, prefix + '_offsets.npy'), mmap_mode='r')
+    neighbors_path = os.path.join(directory, prefix + '_neighbors.npy')
+    neighbors = np.load(neighbors_path, mmap_mode='r')
+    edges = len(neighbors)
+    chunk = max(chunk_edges // block_edges, 1) * block_edges
+
+    def chunk_gaps(start, end):
+        values = np.asarray(neighbors[start:end], dtype=np.int64)
+        return _gaps(values, _range_restarts(offsets, start, end, block_edges))
+
+    sizes = []
+    for start in range(0, edges, chunk):
+        lengths = _varint_lengths(chunk_gaps(start, min(start + chunk, edges)))
+        sizes.append(np.add.reduceat(lengths, np.arange(0, len(lengths), block_edges)))
+    blocks = np.zeros(-(-edges // block_edges) + 1, dtype=np.int64)
+    if sizes:
+        np.cumsum(np.concatenate(sizes), out=blocks[1:])
+
+    data_path = os.path.join(directory, prefix + '_data.npy')
+    if blocks[-1] == 0:
+        np.save(data_path, np.empty(0, dtype=np.uint8))
+    else:
+        data = np.lib.format.open_memmap(data_path, mode='w+', dtype=np.uint8, shape=(int(blocks[-1]),))
+        for start in range(0, edges, chunk):
+            end = min(start + chunk, edges)
+            gaps = chunk_gaps(start, end)
+            data[blocks[start // block_edges]:blocks[-(-end // block_edges)]] = _encode_varints(gaps, _varint_lengths(gaps))
+        data.flush()
+        del data
+    np.save(os.path.join(directory, prefix + '_blocks.npy'), blocks)
+    del neighbors
+    os.remove(neighbors_path)
+
+
+def load_neighbors(directory, prefix, offsets):
+    # The neighbor array of one CSR direction in directory, memory-mapped,
+    # whether it was stored plain or compressed
+    neighbors_path = os.path.join(directory, prefix + '_neighbors.npy')
+    if os.path.exists(neighbors_path):
+        return np.load(neighbors_path, mmap_mode='r')
+    with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as file:
+        block_edges = json.load(file).get('block_edges', BLOCK_EDGES)
+    blocks = np.load(os.path.join(directory, prefix + '_blocks.npy'), mmap_mode='r')
+    data = np.load(os.path.join(directory, prefix + '_data.npy'), mmap_mode='r')
+    return CompressedNeighbors(offsets, blocks, data, index_dtype(len(offsets) - 1), block_edges)
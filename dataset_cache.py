@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = '.edge_cache'
+MANIFEST_FILE = 'manifest.json'
+CHUNK_ROWS = 5_000_000
+HASH_BLOCK = 1 << 20
+
+
+def _hash_stream(stream):
+    digest = hashlib.blake2b(digest_size=16)
+    for block in iter(lambda: stream.read(HASH_BLOCK), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_manifest():
+    try:
+        with open(os.path.join(CACHE_DIR, MANIFEST_FILE), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    temp_path = os.path.join(CACHE_DIR, MANIFEST_FILE + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(temp_path, os.path.join(CACHE_DIR, MANIFEST_FILE))
+
+
+def file_fingerprint(source):
+    # Fingerprint of an edge list: size, mtime and a content hash.
+    # Files on disk are only re-hashed when their size or mtime changes.
+    if isinstance(source, (str, os.PathLike)):
+        path = os.path.abspath(source)
+        stat = os.stat(path)
+        manifest = _read_manifest()
+        entry = manifest.get(path)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry
+        with open(path, 'rb') as file:
+            content_hash = _hash_stream(file)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': content_hash}
+        manifest[path] = entry
+        _write_manifest(manifest)
+        return entry
+
+    # Uploaded files have no mtime, so the content alone identifies them
+    source.seek(0)
+    content_hash = _hash_stream(source)
+    size = source.tell()
+    source.seek(0)
+    return {'size': size, 'mtime': None, 'hash': content_hash}
+
+
+def _parse_csv(source):
+    # Parse in chunks so only one chunk is ever held as int64
+    followers, targets = [], []
+    reader = pd.read_csv(source, header=None, names=['Follower', 'Target'], dtype=np.int64, chunksize=CHUNK_ROWS)
+    for chunk in reader:
+        followers.append(chunk['Follower'].to_numpy())
+        targets.append(chunk['Target'].to_numpy())
+        if followers[-1].size and max(followers[-1].max(), targets[-1].max()) <= np.iinfo(np.int32).max \
+                and min(followers[-1].min(), targets[-1].min()) >= np.iinfo(np.int32).min:
+            followers[-1] = followers[-1].astype(np.int32)
+            targets[-1] = targets[-1].astype(np.int32)
+    if not followers:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+    return np.concatenate(followers), np.concatenate(targets)
+
+
+def _stream_csv_to_entry(source, entry_dir, fingerprint, chunk_rows):
+    # Stream the CSV chunk by chunk into raw int64 files, then copy them into
+    # .npy columns (int32 when the IDs fit), never holding more than one chunk
+    temp_dir = entry_dir + '.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    names = ['follower', 'target']
+    rows, low, high = 0, 0, 0
+    raw_files = [open(os.path.join(temp_dir, name + '.raw'), 'wb') for name in names]
+    try:
+        reader = pd.read_csv(source, header=None, names=['Follower', 'Target'], dtype=np.int64, chunksize=chunk_rows)
+        for chunk in reader:
+            for raw_file, column in zip(raw_files, ['Follower', 'Target']):
+                values = chunk[column].to_numpy()
+                values.tofile(raw_file)
+                low, high = min(low, values.min()), max(high, values.max())
+            rows += len(chunk)
+    finally:
+        for raw_file in raw_files:
+            raw_file.close()
+
+    fits_int32 = low >= np.iinfo(np.int32).min and high <= np.iinfo(np.int32).max
+    for name in names:
+        raw_path = os.path.join(temp_dir, name + '.raw')
+        column = np.lib.format.open_memmap(os.path.join(temp_dir, name + '.npy'), mode='w+',
+                                           dtype=np.int32 if fits_int32 else np.int64, shape=(rows,))
+        if rows:
+            raw = np.memmap(raw_path, dtype=np.int64, mode='r', shape=(rows,))
+            for start in range(0, rows, chunk_rows):
+                column[start:start + chunk_rows] = raw[start:start + chunk_rows]
+            del raw
+        column.flush()
+        del column
+        os.remove(raw_path)
+
+    with open(os.path.join(temp_dir, 'meta.json'), 'w', encoding='utf-8') as file:
+        json.dump({'size': fingerprint['size'], 'hash': fingerprint['hash'], 'edges': rows}, file)
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    os.replace(temp_dir, entry_dir)
+
+
+def _write_entry(entry_dir, follower, target, fingerprint):
+    temp_dir = entry_dir + '.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    np.save(os.path.join(temp_dir, 'follower.npy'), follower)
+    np.save(os.path.join(temp_dir, 'target.npy'), target)
+    with open(os.path.join(temp_dir, 'meta.json'), 'w', encoding='utf-8') as file:
+        json.dump({'size': fingerprint['size'], 'hash': fingerprint['hash'], 'edges': int(follower.size)}, file)
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    os.replace(temp_dir, entry_dir)
+
+
+def _read_entry(entry_dir, fingerprint):
+    try:
+        with open(os.path.join(entry_dir, 'meta.json'), 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        if meta['size'] != fingerprint['size'] or meta['hash'] != fingerprint['hash']:
+            return None
+        follower = np.load(os.path.join(entry_dir, 'follower.npy'), mmap_mode='r')
+        target = np.load(os.path.join(entry_dir, 'target.npy'), mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None
+    return follower, target
+
+
+def entry_directory(fingerprint):
+    return os.path.join(CACHE_DIR, fingerprint['hash'])
+
+
+def load_edge_list(source, fingerprint=None, out_of_core=False, chunk_rows=CHUNK_ROWS):
+    # Load a Follower,Target edge list, mapping the binary column cache when it
+    # exists and parsing the CSV (then writing the cache) when it does not.
+    # Out of core, the CSV is streamed straight to the cache so the edge list
+    # never has to fit in memory. Returns the DataFrame and the fingerprint.
+    if fingerprint is None:
+        fingerprint = file_fingerprint(source)
+    entry_dir = entry_directory(fingerprint)
+
+    columns = _read_entry(entry_dir, fingerprint)
+    if columns is None and out_of_core:
+        _stream_csv_to_entry(source, entry_dir, fingerprint, chunk_rows)
+        columns = _read_entry(entry_dir, fingerprint)
+        if columns is None:
+            raise OSError(f"Could not map the edge cache in {entry_dir}")
+    if columns is None:
+        follower, target = _parse_csv(source)
+        try:
+            _write_entry(entry_dir, follower, target, fingerprint)
+            columns = _read_entry(entry_dir, fingerprint)
+        except OSError:
+            # A read-only working directory just means no cache
+            columns = None
+        if columns is None:
+            columns = follower, target
+
+    df = pd.DataFrame({'Follower': columns[0], 'Target': columns[1]}, copy=False)
+    return df, fingerprint
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+import weakref
+import numpy as np
+import scipy.sparse as sp
+from adjacency_index import build_adjacency_index
+from dataset_cache import file_fingerprint, load_edge_list, entry_directory
+from out_of_core import build_out_of_core_index, DEFAULT_MEMORY_LIMIT_MB
+from parallel_graph import ParallelGraph
+from instrumentation import stage
+from incremental import apply_delta, read_edge_file
+
+# Datasets no session is using are evicted, least recently used first, once
+# the registry holds more than this many bytes
+MEMORY_BUDGET_BYTES = int(float(os.environ.get('NETWORK_TOOL_MEMORY_BUDGET_MB', 8192)) * 1024 * 1024)
+
+
+def _nbytes(obj):
+    # Approximate size of the arrays held by a dataset and its derived structures.
+    # Memory-mapped files are left to the page cache and worker pools hold
+    # no arrays of their own, so neither is counted.
+    if isinstance(obj, (np.memmap, ParallelGraph)):
+        return 0
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if sp.issparse(obj):
+        return sum(getattr(obj, name).nbytes for name in ('data', 'indices', 'indptr') if hasattr(obj, name))
+    if isinstance(obj, dict):
+        return sum(_nbytes(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(value) for value in obj)
+    if hasattr(obj, '__dict__'):
+        return sum(_nbytes(value) for name, value in vars(obj).items() if name != 'df')
+    return 0
+
+
+class DatasetEntry:
+
+    def __init__(self, key, fingerprint, df, index, mode):
+        self.key = key
+        self.mode = mode
+        self.fingerprint = fingerprint
+        self.df = df
+        self.index = index
+        self.refcount = 0
+        self.last_used = time.monotonic()
+
+    def nbytes(self):
+        columns = sum(_nbytes(self.df[column].to_numpy()) for column in self.df.columns)
+        return columns + _nbytes(self.index)
+
+
+class DatasetHandle:
+    # A session's reference to a shared dataset. The reference is released
+    # explicitly or when the session drops the handle.
+
+    def __init__(self, store, entry):
+        self.key = entry.key
+        self.mode = entry.mode
+        self.fingerprint = entry.fingerprint
+        self.df = entry.df
+        self.index = entry.index
+        self._release = weakref.finalize(self, store.release, entry.key)
+
+    def release(self):
+        self._release()
+
+
+class DatasetStore:
+
+    def __init__(self, memory_budget=MEMORY_BUDGET_BYTES):
+        self.memory_budget = memory_budget
+        self.entries = {}
+        # Reentrant because handles can be finalized by the garbage collector
+        # while this thread already holds the lock
+        self.lock = threading.RLock()
+        self.loading = {}
+
+    def open(self, source, out_of_core=False, memory_limit=DEFAULT_MEMORY_LIMIT_MB * 1024 * 1024, compressed=False):
+        # Return a handle to the dataset for source, loading it only if no
+        # session has it in memory already. Out of core, the edges and the
+        # adjacency index stay in memory-mapped files, with the neighbor
+        # lists delta-encoded when compressed.
+        with stage("Fingerprint file"):
+            fingerprint = file_fingerprint(source)
+        compressed = bool(compressed and out_of_core)
+        mode = (out_of_core, memory_limit if out_of_core else None, compressed)
+        key = fingerprint['hash'] if not out_of_core else f"{fingerprint['hash']}-ooc-{memory_limit}"
+        if compressed:
+            key += '-compressed'
+
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry.refcount += 1
+                    entry.last_used = time.monotonic()
+                    return DatasetHandle(self, entry)
+                pending = self.loading.get(key)
+                if pending is None:
+                    pending = self.loading[key] = threading.Event()
+                    break
+            # Another session is loading the same file, wait and share it
+            pending.wait()
+
+        try:
+            with stage("Read edge list"):
+                df, fingerprint = load_edge_list(source, fingerprint, out_of_core=out_of_core)
+            with stage("Build index"):
+                if out_of_core:
+                    directory = os.path.join(entry_directory(fingerprint), 'csr_compressed' if compressed else 'csr')
+                    index = build_out_of_core_index(df, fingerprint['hash'], memory_limit, directory, compressed)
+                else:
+                    index = build_adjacency_index(df, fingerprint['hash'])
+            entry = DatasetEntry(key, fingerprint, df, index, mode)
+            with self.lock:
+                entry.refcount += 1
+                self.entries[key] = entry
+                self._evict()
+            return DatasetHandle(self, entry)
+        finally:
+            with self.lock:
+                del self.loading[key]
+            pending.set()
+
+    def update(self, handle, added=None, removed=None):
+        # Handle to the dataset of handle with the edges of the removed file
+        # taken out and those of the added file appended. The index is merged
+        # from the loaded one instead of re-reading the edge list; sessions
+        # still using the old dataset keep it. Releases handle.
+        if handle.mode[0]:
+            raise ValueError("Edge updates need an in-memory dataset; reload the updated edge list in out-of-core mode.")
+        with stage("Read edge updates"):
+            added, removed = read_edge_file(added), read_edge_file(removed)
+        with stage("Apply edge updates"):
+            df, index = apply_delta(handle.df, handle.index, added, removed)
+        key = f"{handle.key}+{index.fingerprint}"
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                fingerprint = {'size': None, 'mtime': None, 'hash': index.fingerprint}
+                entry = self.entries[key] = DatasetEntry(key, fingerprint, df, index, handle.mode)
+            entry.refcount += 1
+            entry.last_used = time.monotonic()
+            updated = DatasetHandle(self, entry)
+        handle.release()
+        with self.lock:
+            self._evict()
+        return updated
+
+    def release(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.refcount = max(entry.refcount - 1, 0)
+                entry.last_used = time.monotonic()
+            self._evict()
+
+    def total_bytes(self):
+        with self.lock:
+            return sum(entry.nbytes() for entry in self.entries.values())
+
+    def _evict(self):
+        # Drop unused datasets, least recently used first, until within budget
+        sizes = {key: entry.nbytes() for key, entry in self.entries.items()}
+        total = sum(sizes.values())
+        idle = sorted((entry for entry in self.entries.values() if entry.refcount == 0), key=lambda entry: entry.last_used)
+        for entry in idle:
+            if total <= self.memory_budget:
+                break
+            total -= sizes[entry.key]
+            del self.entries[entry.key]
+
+
+_store = DatasetStore()
+
+
+def get_store():
+    return _store
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+DIRECTIONS = ["Both", "Targets (out)", "Followers (in)"]
+
+# Users expanded per frontier user at each hop by default
+DEFAULT_FANOUTS = [100, 20, 5]
+
+# Neighbor lists longer than this are read as a random sample of positions,
+# so hub accounts with millions of edges cost the same as smaller ones
+SCAN_LIMIT = 100_000
+
+
+def _neighbor_sample(offsets, neighbors, node, fanout, method, index, rng):
+    # At most fanout distinct neighbors of node from one CSR direction
+    start, end = int(offsets[node]), int(offsets[node + 1])
+    if end - start > SCAN_LIMIT:
+        positions = np.sort(rng.choice(end - start, size=SCAN_LIMIT, replace=False))
+        candidates = np.unique(np.asarray(neighbors[start + positions]))
+    else:
+        candidates = np.unique(np.asarray(neighbors[start:end]))
+    if len(candidates) <= fanout:
+        return candidates
+    if method == "Most Connected":
+        degree = (index.forward_offsets[candidates + 1] - index.forward_offsets[candidates]) + \
+                 (index.reverse_offsets[candidates + 1] - index.reverse_offsets[candidates])
+        keep = np.lexsort((candidates, -degree))[:fanout]
+    else:
+        keep = rng.choice(len(candidates), size=fanout, replace=False)
+    return candidates[np.sort(keep)]
+
+
+def extract_ego_network(index, user, hops=2, direction="Both", fanouts=DEFAULT_FANOUTS, node_budget=500,
+                        method="Most Connected", seed=0):
+    # Breadth-first expansion from user over the adjacency index, up to hops
+    # steps along follow edges in the chosen direction. Each frontier user
+    # contributes at most fanouts[hop] neighbors, and no new users are added
+    # once node_budget users are in the network, so the work is bounded by
+    # the budget and fan-outs rather than by the degrees reached.
+    # Returns the Follower/Target edges among the kept users, as user IDs, and
+    # per-hop counts.
+    source = index.node(user)
+    empty = pd.DataFrame({'Follower': index.id_map.ids[:0], 'Target': index.id_map.ids[:0]})
+    if source < 0:
+        return empty, []
+
+    rng = np.random.default_rng(seed)
+    sides = []
+    if direction in ("Both", "Targets (out)"):
+        sides.append((index.forward_offsets, index.forward_neighbors, False))
+    if direction in ("Both", "Followers (in)"):
+        sides.append((index.reverse_offsets, index.reverse_neighbors, True))
+
+    visited = {source}
+    frontier = [source]
+    followers, targets = [], []
+    hop_counts = []
+    for hop in range(hops):
+        fanout = fanouts[min(hop, len(fanouts) - 1)]
+        next_frontier = []
+        edges_before = len(followers)
+        for node in frontier:
+            for offsets, neighbors, reverse in sides:
+                for neighbor in _neighbor_sample(offsets, neighbors, node, fanout, method, index, rng).tolist():
+                    if neighbor not in visited:
+                        if len(visited) >= node_budget:
+                            continue
+                        visited.add(neighbor)
+                        next_frontier.append(neighbor)
+                    followers.append(neighbor if reverse else node)
+                    targets.append(node if reverse else neighbor)
+        hop_counts.append({'hop': hop + 1, 'users': len(next_frontier), 'edges': len(followers) - edges_before})
+        frontier = next_frontier
+        if not frontier:
+            break
+
+    edges = pd.DataFrame({'Follower': index.id_map.to_ids(np.asarray(followers, dtype=np.int64)),
+                          'Target': index.id_map.to_ids(np.asarray(targets, dtype=np.int64))})
+    return edges.drop_duplicates(ignore_index=True), hop_counts
@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+import streamlit.components.v1 as components
+from graph_algorithms import gather_neighbors
+from graph_rendering import render_network_html
+from adjacency_index import build_adjacency_index
+from instrumentation import stage
+
+MODES = ["One Shortest Path", "All Shortest Paths"]
+
+# Longest path searched for, in follow edges
+DEFAULT_MAX_DEPTH = 6
+MAX_DEPTH = 20
+
+# The search gives up once it has reached this many users from both ends
+DEFAULT_MAX_VISITED = 1_000_000
+
+# Most paths listed and drawn when all shortest paths are asked for
+DEFAULT_MAX_PATHS = 100
+
+
+def _frontier_edges(offsets, frontier):
+    # Edges read when expanding the frontier
+    return int((np.asarray(offsets[frontier + 1], dtype=np.int64) - np.asarray(offsets[frontier], dtype=np.int64)).sum())
+
+
+def bidirectional_search(index, source, target, max_depth=DEFAULT_MAX_DEPTH, max_visited=DEFAULT_MAX_VISITED):
+    # Breadth-first search forward from source over the accounts each user
+    # follows and backward from target over each user's followers. A whole
+    # level is expanded at a time, on whichever side has fewer edges to read,
+    # until the two sides reach a common user. Returns the distance of every
+    # node from both ends (-1 where not reached), the length of the shortest
+    # path, the users where the sides met and what the search read. The
+    # length is None when there is no path within max_depth, or when more
+    # than max_visited users were reached before the sides met.
+    forward = np.full(index.num_nodes, -1, dtype=np.int8)
+    backward = np.full(index.num_nodes, -1, dtype=np.int8)
+    forward[source] = 0
+    backward[target] = 0
+    info = {'visited': 1 if source == target else 2, 'edges_read': 0, 'stopped': None}
+    if source == target:
+        return forward, backward, 0, np.array([source]), info
+
+    sides = [(index.forward_offsets, index.forward_neighbors, forward, backward),
+             (index.reverse_offsets, index.reverse_neighbors, backward, forward)]
+    frontiers = [np.array([source], dtype=np.int64), np.array([target], dtype=np.int64)]
+    depths = [0, 0]
+    while True:
+        if depths[0] + depths[1] >= max_depth:
+            info['stopped'] = 'depth'
+            break
+        # Every user reachable from one end has been seen, so there is no path
+        if len(frontiers[0]) == 0 or len(frontiers[1]) == 0:
+            break
+        costs = [_frontier_edges(sides[side][0], frontiers[side]) for side in (0, 1)]
+        side = 0 if costs[0] <= costs[1] else 1
+        offsets, neighbors, distance, other = sides[side]
+
+        _, reached = gather_neighbors(offsets, neighbors, frontiers[side])
+        reached = np.unique(reached[distance[reached] < 0])
+        depths[side] += 1
+        distance[reached] = depths[side]
+        frontiers[side] = reached
+        info['edges_read'] += costs[side]
+        info['visited'] += len(reached)
+
+        meeting = reached[other[reached] >= 0]
+        if len(meeting):
+            return forward, backward, depths[0] + depths[1], meeting, info
+        if info['visited'] > max_visited:
+            info['stopped'] = 'visited'
+            break
+    return forward, backward, None, np.empty(0, dtype=np.int64), info
+
+
+def one_path(index, forward, backward, length, meeting):
+    # A shortest path as node indices, walked from the first meeting user
+    # back to the source and on to the target one neighbor list at a time
+    middle = int(meeting[0])
+    position = int(forward[middle])
+    path = [middle]
+    for step in range(position, 0, -1):
+        followers = np.asarray(index.predecessors(path[0]), dtype=np.int64)
+        path.insert(0, int(followers[forward[followers] == step - 1][0]))
+    for step in range(position, length):
+        targets = np.asarray(index.successors(path[-1]), dtype=np.int64)
+        path.append(int(targets[backward[targets] == length - step - 1][0]))
+    return np.array([path], dtype=np.int64)
+
+
+def path_steps(index, forward, backward, length, meeting):
+    # Every edge on a shortest path, grouped by its position along the path:
+    # steps[k] holds the (from, to) node indices of the edges from position
+    # k to k + 1, sorted. Each side is swept out from the meeting users over
+    # the neighbors one level closer to its end.
+    position = int(forward[meeting[0]])
+    steps = [None] * length
+    layer = meeting
+    for step in range(position, 0, -1):
+        owner, followers = gather_neighbors(index.reverse_offsets, index.reverse_neighbors, layer)
+        keep = forward[followers] == step - 1
+        steps[step - 1] = (followers[keep], layer[owner[keep]])
+        layer = np.unique(followers[keep])
+    layer = meeting
+    for step in range(position, length):
+        owner, targets = gather_neighbors(index.forward_offsets, index.forward_neighbors, layer)
+        keep = backward[targets] == length - step - 1
+        steps[step] = (layer[owner[keep]], targets[keep])
+        layer = np.unique(targets[keep])
+    for step, (tails, heads) in enumerate(steps):
+        # Repeated follows of the same account would repeat paths
+        pairs = np.unique(np.column_stack([tails, heads]), axis=0)
+        steps[step] = (pairs[:, 0], pairs[:, 1])
+    return steps
+
+
+def count_paths(steps, source):
+    # Number of shortest paths, counted forward one position at a time
+    nodes, counts = np.array([source], dtype=np.int64), np.ones(1)
+    for tails, heads in steps:
+        weights = counts[np.searchsorted(nodes, tails)]
+        nodes, inverse = np.unique(heads, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights, minlength=len(nodes))
+    return float(counts.sum())
+
+
+def enumerate_paths(steps, source, max_paths=DEFAULT_MAX_PATHS):
+    # Up to max_paths shortest paths as rows of node indices, in order of the
+    # node indices along them. Every partial path reaches the target, so
+    # keeping the first max_paths at each position loses no complete path
+    # among the first max_paths.
+    paths = np.array([[source]], dtype=np.int64)
+    for tails, heads in steps:
+        starts = np.searchsorted(tails, paths[:, -1])
+        lengths = np.searchsorted(tails, paths[:, -1], side='right') - starts
+        owner = np.repeat(np.arange(len(paths)), lengths)
+        positions = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[owner]
+        paths = np.column_stack([paths[owner], heads[positions]])[:max_paths]
+    return paths
+
+
+def find_paths(source_user, target_user, index, mode=MODES[0], max_depth=DEFAULT_MAX_DEPTH,
+               max_visited=DEFAULT_MAX_VISITED, max_paths=DEFAULT_MAX_PATHS):
+    # Shortest follow paths from source_user to target_user: a DataFrame with
+    # one path per row, the follow edges along them for drawing, and what the
+    # search read. The info is None when either user is not in the network.
+    source, target = index.node(source_user), index.node(target_user)
+    if source < 0 or target < 0:
+        return pd.DataFrame({'Path': []}), pd.DataFrame({'Follower': [], 'Target': []}), None
+    with stage("Bidirectional BFS"):
+        forward, backward, length, meeting, info = bidirectional_search(index, source, target, max_depth, max_visited)
+    info['length'] = length
+    if length is None:
+        return pd.DataFrame({'Path': []}), pd.DataFrame({'Follower': [], 'Target': []}), info
+
+    with stage("Collect paths"):
+        if length == 0:
+            paths = np.array([[source]], dtype=np.int64)
+            info['paths'] = 1
+        elif mode == MODES[0]:
+            paths = one_path(index, forward, backward, length, meeting)
+        else:
+            steps = path_steps(index, forward, backward, length, meeting)
+            info['paths'] = count_paths(steps, source)
+            paths = enumerate_paths(steps, source, max_paths)
+
+    users = index.id_map.to_ids(paths)
+    table = pd.DataFrame({'Path': [" → ".join(str(user) for user in path) for path in users.tolist()]})
+    edges = pd.DataFrame({'Follower': users[:, :-1].ravel(), 'Target': users[:, 1:].ravel()})
+    return table, edges.drop_duplicates().reset_index(drop=True), info
+
+
+def parse_user_id(label, key):
+    # A user ID typed into a text area, or None after showing why it is not valid
+    user_input = st.text_area(label, key=key)
+
+    # Clean user_input
+    user_input = user_input.strip().replace(',', '')
+
+    # Check if user_input is valid
+    try:
+        user_id = int(user_input)
+    except ValueError:
+        st.error("Please enter a valid integer as User ID. Choose an ID from the data below.")
+        return None
+    if not 1 <= user_id <= 11316811:
+        st.error("User ID must be between 1 and 11316811.")
+        return None
+    return user_id
+
+
+def run(df, index=None):
+
+    data = df
+    if index is None:
+        index = build_adjacency_index(data)
+
+    st.subheader("Shortest Follow Path Between Two Users")
+
+    source_id = parse_user_id('Enter the User ID the Path Starts From', 'path_source')
+    target_id = parse_user_id('Enter the User ID the Path Leads To', 'path_target')
+
+    # Display the head the data so user can pick the users
+    st.dataframe(data[0:1000], height=150)
+
+    mode = st.radio('Paths', MODES, horizontal=True)
+    with st.expander("Search Settings"):
+        max_depth = st.slider('Maximum Path Length', 1, MAX_DEPTH, DEFAULT_MAX_DEPTH)
+        max_visited = int(st.number_input('Maximum Users Visited', 1000, 100_000_000, DEFAULT_MAX_VISITED, 100_000))
+        max_paths = int(st.number_input('Maximum Paths Shown', 1, 10_000, DEFAULT_MAX_PATHS, 10))
+
+    if st.button('Find Path') and source_id is not None and target_id is not None:
+        with st.spinner('Searching for Paths...'):
+            paths, edges, info = find_paths(source_id, target_id, index, mode, max_depth, max_visited, max_paths)
+        if info is None:
+            st.error("User ID not found in the dataset.")
+            return
+        searched = f"visited {info['visited']:,} users over {info['edges_read']:,} edges"
+        if info['length'] is None:
+            if info['stopped'] == 'depth':
+                st.warning(f"No path of at most {max_depth} follows from {source_id} to {target_id} ({searched}).")
+            elif info['stopped'] == 'visited':
+                st.warning(f"Stopped after reaching more than {max_visited:,} users without finding a path ({searched}).")
+            else:
+                st.warning(f"{target_id} cannot be reached from {source_id} by following accounts ({searched}).")
+            return
+        st.markdown(f"### Shortest Path from {source_id} to {target_id}: {info['length']} Follows")
+        if 'paths' in info and mode == MODES[1]:
+            st.markdown(f"**{info['paths']:,.0f} shortest paths, {len(paths):,} shown; {searched}**")
+        else:
+            st.markdown(f"**Search {searched}**")
+        st.dataframe(paths)
+        if len(edges):
+            with st.spinner('Generating Visualization...'):
+                source_code = render_network_html(source_id, edges, direction="LR")
+                components.html(source_code, width=700, height=800)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,241 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def adjacency_matrix(src, dst, n):
+    # Unweighted n x n CSR matrix with one entry per distinct edge, matching a
+    # DiGraph where repeated rows collapse into a single edge
+    A = sp.csr_matrix((np.ones(len(src), dtype=np.float64), (src, dst)), shape=(n, n))
+    A.sum_duplicates()
+    A.data[:] = 1.0
+    return A
+
+
+def csr_adjacency(offsets, neighbors, n):
+    # Adjacency matrix over an existing CSR index with sorted neighbor lists.
+    # The index arrays are shared, and only copied when repeated edges have to
+    # be collapsed.
+    A = sp.csr_matrix((np.ones(len(neighbors)), neighbors, offsets), shape=(n, n))
+    repeated = neighbors[1:] == neighbors[:-1]
+    row_starts = offsets[1:-1]
+    repeated[row_starts[(row_starts > 0) & (row_starts < len(neighbors))] - 1] = False
+    if repeated.any():
+        A = A.copy()
+        A.sum_duplicates()
+        A.data[:] = 1.0
+    return A
+
+
+def start_vector(start, n):
+    # Initial scores of an iteration: a previous result when one is given, so
+    # a slightly changed graph needs only a few iterations, otherwise uniform
+    if start is None or len(start) != n or not np.sum(start) > 0:
+        return np.full(n, 1.0 / n)
+    start = np.asarray(start, dtype=np.float64)
+    return start / start.sum()
+
+
+def power_pagerank(n, out_degree, spread, alpha=0.85, tol=1e-06, max_iter=100, callback=None, start=None):
+    # Power iteration for PageRank given the distinct out-degree of every node
+    # and spread(share), which returns A^T @ share. Dangling nodes (no
+    # out-edges) spread their rank uniformly, as in nx.pagerank, and the run
+    # stops once the L1 change falls below n * tol. Starts from start when
+    # given (a warm start), otherwise from uniform scores.
+    if n == 0:
+        return np.empty(0), {'iterations': 0, 'residual': 0.0, 'converged': True}
+
+    is_dangling = out_degree == 0
+    inverse_degree = np.zeros(n)
+    inverse_degree[~is_dangling] = 1.0 / out_degree[~is_dangling]
+
+    x = start_vector(start, n)
+    teleport = (1 - alpha) / n
+    residual = np.inf
+    iterations = 0
+    while iterations < max_iter:
+        iterations += 1
+        x_last = x
+        x = alpha * (spread(x_last * inverse_degree) + x_last[is_dangling].sum() / n) + teleport
+        residual = np.abs(x - x_last).sum()
+        if callback is not None:
+            callback(iterations, residual)
+        if residual < n * tol:
+            break
+
+    info = {'iterations': iterations, 'residual': float(residual), 'converged': bool(residual < n * tol)}
+    return x, info
+
+
+def pagerank(A, alpha=0.85, tol=1e-06, max_iter=100, callback=None, start=None):
+    n = A.shape[0]
+    out_degree = np.asarray(A.sum(axis=1)).ravel()
+    AT = A.T.tocsr()
+    return power_pagerank(n, out_degree, lambda share: AT @ share, alpha, tol, max_iter, callback, start)
+
+
+def power_hits(n, authority, hub, tol=1e-08, max_iter=100, callback=None, start=None):
+    # Alternate a = authority(h) = A^T h and h = hub(a) = A a, scaling both by
+    # their maximum every step, until the L1 change in the hub vector drops
+    # below tol. Scores are normalized to sum to one, as in nx.hits. start is
+    # an optional initial hub vector.
+    if n == 0:
+        return np.empty(0), np.empty(0), {'iterations': 0, 'residual': 0.0, 'converged': True}
+
+    h = start_vector(start, n)
+    residual = np.inf
+    iterations = 0
+    while iterations < max_iter:
+        iterations += 1
+        h_last = h
+        a = authority(h_last)
+        a_max = a.max()
+        if a_max > 0:
+            a /= a_max
+        h = hub(a)
+        h_max = h.max()
+        if h_max > 0:
+            h /= h_max
+        residual = np.abs(h - h_last).sum()
+        if callback is not None:
+            callback(iterations, residual)
+        if residual < tol:
+            break
+
+    a = authority(h)
+    h_sum = h.sum()
+    a_sum = a.sum()
+    if h_sum > 0:
+        h /= h_sum
+    if a_sum > 0:
+        a /= a_sum
+    info = {'iterations': iterations, 'residual': float(residual), 'converged': bool(residual < tol)}
+    return h, a, info
+
+
+def hits(A, tol=1e-08, max_iter=100, AT=None, callback=None, start=None):
+    if AT is None:
+        AT = A.T.tocsr()
+    return power_hits(A.shape[0], lambda h: AT @ h, lambda a: A @ a, tol, max_iter, callback, start)
+
+
+def personalized_pagerank(offsets, neighbors, source, alpha=0.85, epsilon=1e-06):
+    # Approximate PageRank personalized to one node, by local push (Andersen,
+    # Chung and Lang). Residual mass is pushed to the neighbors in the CSR
+    # arrays from every node holding more than epsilon times its degree, all
+    # such nodes at once per round, so only the part of the graph that carries
+    # more than epsilon of the mass is read. Rank that reaches a dangling node
+    # returns to the source, as nx.pagerank does with a personalization vector.
+    # Returns the nodes that received rank, their scores and the work done.
+    n = len(offsets) - 1
+    # Zeroed lazily by the OS, so only pages that are touched cost memory
+    rank = np.zeros(n)
+    residual = np.zeros(n)
+    residual[source] = 1.0
+    frontier = np.array([source], dtype=np.int64)
+    reached = [frontier]
+    rounds = 0
+    edges_read = 0
+    while len(frontier):
+        rounds += 1
+        mass = residual[frontier]
+        residual[frontier] = 0.0
+        rank[frontier] += (1 - alpha) * mass
+
+        # Neighbor lists of the whole frontier, gathered in one step
+        starts = np.asarray(offsets[frontier], dtype=np.int64)
+        counts = np.asarray(offsets[frontier + 1], dtype=np.int64) - starts
+        total = int(counts.sum())
+        edges_read += total
+        owner = np.repeat(np.arange(len(frontier)), counts)
+        row_starts = np.cumsum(counts) - counts
+        targets = np.asarray(neighbors[np.repeat(starts - row_starts, counts) + np.arange(total)])
+
+        # Repeated edges count once, matching the global PageRank
+        distinct = np.ones(total, dtype=bool)
+        distinct[1:] = (targets[1:] != targets[:-1]) | (owner[1:] != owner[:-1])
+        targets, owner = targets[distinct], owner[distinct]
+        out_degree = np.bincount(owner, minlength=len(frontier))
+        dangling = out_degree == 0
+        share = np.zeros(len(frontier))
+        share[~dangling] = alpha * mass[~dangling] / out_degree[~dangling]
+        np.add.at(residual, targets, share[owner])
+        residual[source] += alpha * mass[dangling].sum()
+
+        candidates = np.unique(np.append(targets, source))
+        limits = epsilon * np.maximum(np.asarray(offsets[candidates + 1]) - np.asarray(offsets[candidates]), 1)
+        frontier = candidates[residual[candidates] >= limits]
+        reached.append(frontier)
+
+    nodes = np.unique(np.concatenate(reached))
+    info = {'rounds': rounds, 'nodes': len(nodes), 'edges_read': edges_read, 'residual': float(1.0 - rank[nodes].sum())}
+    return nodes, rank[nodes], info
+
+
+def gather_neighbors(offsets, neighbors, nodes):
+    # Neighbor lists of nodes concatenated in order, and the position in
+    # nodes of each entry, without a Python loop over the nodes
+    starts = np.asarray(offsets[nodes], dtype=np.int64)
+    lengths = np.asarray(offsets[nodes + 1], dtype=np.int64) - starts
+    owner = np.repeat(np.arange(len(nodes)), lengths)
+    positions = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[owner]
+    return owner, np.asarray(neighbors[positions], dtype=np.int64)
+
+
+def distinct_row_lengths(offsets, neighbors, chunk_edges):
+    # Length of every neighbor list counting repeated entries once, reading
+    # chunk_edges entries at a time. Lists are sorted, so a repeat follows
+    # its first copy; an entry opening a list is never a repeat.
+    lengths = np.diff(np.asarray(offsets, dtype=np.int64))
+    edges = int(offsets[-1])
+    for start in range(1, edges, chunk_edges):
+        end = min(start + chunk_edges, edges)
+        block = np.asarray(neighbors[start - 1:end])
+        positions = start + np.flatnonzero(block[1:] == block[:-1])
+        rows = np.searchsorted(offsets, positions.astype(offsets.dtype), side='right') - 1
+        repeat = np.asarray(offsets[rows], dtype=np.int64) != positions
+        lengths -= np.bincount(rows[repeat], minlength=len(lengths))
+    return lengths
+
+
+def edges_exist(offsets, neighbors, rows, columns):
+    # For each (row, column) pair, whether column is in the row's sorted
+    # neighbor list. A binary search over all pairs at once, one vectorized
+    # step per halving.
+    rows = np.asarray(rows, dtype=np.int64)
+    columns = np.asarray(columns, dtype=np.int64)
+    low = np.asarray(offsets[rows], dtype=np.int64)
+    high = np.asarray(offsets[rows + 1], dtype=np.int64)
+    while True:
+        active = low < high
+        if not active.any():
+            break
+        middle = (low + high) // 2
+        values = np.zeros(len(rows), dtype=np.int64)
+        values[active] = neighbors[middle[active]]
+        below = active & (values < columns)
+        low = np.where(below, middle + 1, low)
+        high = np.where(active & ~below, middle, high)
+    found = low < np.asarray(offsets[rows + 1], dtype=np.int64)
+    found[found] = np.asarray(neighbors[low[found]]) == columns[found]
+    return found
+
+
+def degree_arrays(src, dst, n):
+    # Out-degree, in-degree and total degree of every node, counted per edge row
+    out_degree = np.bincount(src, minlength=n)
+    in_degree = np.bincount(dst, minlength=n)
+    return out_degree, in_degree, out_degree + in_degree
+
+
+def top_k(values, k):
+    # Indices of the k largest values, largest first, found with a partial sort.
+    # Ties are broken by the lower index so results are deterministic.
+    values = np.asarray(values)
+    k = min(k, values.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    threshold = np.partition(values, values.size - k)[values.size - k]
+    above = np.flatnonzero(values > threshold)
+    ties = np.flatnonzero(values == threshold)[:k - above.size]
+    selected = np.concatenate([above, ties])
+    return selected[np.lexsort((selected, -values[selected]))]
@@ -0,0 +1,152 @@
+import json
+import numpy as np
+import pandas as pd
+import pyvis
+from pyvis.network import Network
+from instrumentation import stage
+
+# Largest number of neighbor nodes drawn by default. Above this the views
+# draw a sample and say how many were left out.
+DEFAULT_NODE_CAP = 500
+
+SAMPLING_METHODS = ["Most Connected", "Random"]
+
+MUTUAL_EDGE_COLOR = '#FF8C00'
+
+# pyvis release whose Network internals (nodes, node_ids, node_map, edges)
+# render_network_html fills directly; it is the one pinned in
+# requirements.txt. The public add_node/add_edge scan every node added so
+# far on each call, which is quadratic in the node cap, and add_nodes takes
+# no border or font options. Other releases fall back to add_node/add_edge.
+PYVIS_BULK_VERSION = '0.3.2'
+
+PYVIS_OPTIONS = """
+{
+  "physics": {
+    "hierarchicalRepulsion": {
+      "centralGravity": 0.0,
+      "springLength": 100,
+      "springConstant": 0.01,
+      "nodeDistance": 120,
+      "damping": 0.09
+    },
+    "minVelocity": 0.75,
+    "solver": "hierarchicalRepulsion"
+  },
+  "nodes": {
+    "scaling": {
+      "label": {
+        "enabled": true
+      }
+    }
+  },
+  "edges": {
+    "color": {
+      "inherit": true
+    },
+    "smooth": false
+  },
+  "layout": {
+    "hierarchical": {
+      "enabled": false,
+      "levelSeparation": 150,
+      "nodeSpacing": 100,
+      "treeSpacing": 200,
+      "blockShifting": true,
+      "edgeMinimization": true,
+      "parentCentralization": true,
+      "direction": "DU",
+      "sortMethod": "directed"
+    }
+  }
+}
+"""
+
+
+def circular_positions(count):
+    # Same placement as nx.circular_layout: evenly spaced on the unit circle
+    if count == 1:
+        return np.zeros((1, 2))
+    theta = np.arange(count) * 2 * np.pi / max(count, 1)
+    return np.column_stack([np.cos(theta), np.sin(theta)])
+
+
+def sample_neighbors(edges, column, cap, method="Most Connected", index=None, seed=0):
+    # Keep at most cap rows of edges, choosing the neighbors in column either
+    # by their total degree in the full graph or uniformly at random.
+    # Returns the kept rows and the number of rows there were.
+    total = len(edges)
+    if cap is None or total <= cap:
+        return edges, total
+
+    with stage("Sample neighbors"):
+        if method == "Most Connected" and index is not None:
+            nodes = index.node(edges[column].to_numpy())
+            degree = (index.forward_offsets[nodes + 1] - index.forward_offsets[nodes]) + \
+                     (index.reverse_offsets[nodes + 1] - index.reverse_offsets[nodes])
+            # Highest degree first, ties broken by position so the choice is stable
+            keep = np.lexsort((np.arange(total), -degree))[:cap]
+        else:
+            keep = np.random.default_rng(seed).choice(total, size=cap, replace=False)
+        return edges.iloc[np.sort(keep)], total
+
+
+def split_cap(cap, first_count, second_count):
+    # Share a node cap between two neighbor lists, giving each at least half
+    # unless the other needs less
+    second = min(second_count, cap // 2)
+    first = min(first_count, cap - second)
+    second = min(second_count, cap - first)
+    return first, second
+
+
+def render_network_html(target, df, direction="DU"):
+    # Draw the edges in df around target and return the page as an HTML string.
+    # direction is the hierarchical layout direction ("DU", "LR", ...).
+    # Nodes and edges are added in bulk on the pinned pyvis release, as pyvis
+    # checks for duplicates on every add_node/add_edge call. Edges flagged in
+    # an optional Mutual column are drawn highlighted.
+    bulk = pyvis.__version__ == PYVIS_BULK_VERSION
+    with stage("Build pyvis network"):
+        edges = df.drop_duplicates(['Follower', 'Target'])
+        nodes = pd.unique(np.concatenate([edges['Follower'].to_numpy(), edges['Target'].to_numpy()]))
+        pos = circular_positions(len(nodes)) * 1000
+
+        # Create a Pyvis network
+        net = Network(notebook=False, width="100%", height="900px", directed=True, cdn_resources="in_line")
+        net.toggle_hide_edges_on_drag(False)
+        net.toggle_physics(True)
+
+        border_color = '#00008B'  # Dark blue border for contrast
+        for node, (x, y) in zip(nodes.tolist(), pos.tolist()):
+            size = 35 if node == target else 25  # Increase the size for better visibility
+            color = '#FF9999' if node == target else '#4169E1'  # Light blue color for regular nodes
+            node_options = {'label': str(node), 'shape': 'dot', 'x': x, 'y': y, 'size': size, 'color': color,
+                       'title': f"ID: {node}", 'borderWidth': 2, 'borderColor': border_color,
+                       'font': {'size': 14, 'color': '#000000'}}
+            if bulk:
+                net.nodes.append({'id': node, **node_options})
+                net.node_ids.append(node)
+                net.node_map[node] = net.nodes[-1]
+            else:
+                net.add_node(node, **node_options)
+
+        mutual = edges['Mutual'].tolist() if 'Mutual' in edges else [False] * len(edges)
+        for follower, followed, is_mutual in zip(edges['Follower'].tolist(), edges['Target'].tolist(), mutual):
+            if is_mutual:
+                # Mutual follows stand out in orange
+                edge_options = {'arrows': 'to', 'width': 2, 'color': MUTUAL_EDGE_COLOR}
+            else:
+                edge_options = {'arrows': 'to', 'width': 0.5}  # Keep edges thin
+            if bulk:
+                net.edges.append({'from': follower, 'to': followed, **edge_options})
+            else:
+                net.add_edge(follower, followed, **edge_options)
+
+        # Use hierarchical layout to potentially improve the clarity
+        options = json.loads(PYVIS_OPTIONS)
+        options['layout']['hierarchical']['direction'] = direction
+        net.set_options(json.dumps(options))
+
+    with stage("Generate HTML"):
+        return net.generate_html()
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+from adjacency_index import build_adjacency_index
+from graph_algorithms import top_k
+
+SAMPLE_METHODS = ["Edge Sample", "Node Sample"]
+
+# Samples kept with the full dataset; older ones are dropped first
+MAX_PREVIEWS = 2
+
+
+def _edge_blocks(index):
+    # (src, dst) node indices of every edge row, a block at a time
+    if getattr(index, 'out_of_core', False):
+        for src, dst, _ in index.edge_blocks():
+            yield src, dst
+    else:
+        yield index.edge_arrays()
+
+
+def sample_edges(index, method="Edge Sample", fraction=0.05, seed=0):
+    # Reproducible sample of the edges: each edge kept with probability
+    # fraction, or, for a node sample, each user kept with probability
+    # fraction together with the edges among kept users. The same seed gives
+    # the same sample whatever the block sizes.
+    rng = np.random.default_rng(seed)
+    kept_nodes = rng.random(index.num_nodes) < fraction if method == "Node Sample" else None
+    followers, targets = [], []
+    for src, dst in _edge_blocks(index):
+        if kept_nodes is None:
+            keep = rng.random(len(src)) < fraction
+        else:
+            keep = kept_nodes[src] & kept_nodes[dst]
+        followers.append(src[keep])
+        targets.append(dst[keep])
+    src = np.concatenate(followers) if followers else np.empty(0, dtype=np.int64)
+    dst = np.concatenate(targets) if targets else np.empty(0, dtype=np.int64)
+    return index.id_map.to_ids(src), index.id_map.to_ids(dst)
+
+
+def preview_sample(index, method="Edge Sample", fraction=0.05, seed=0):
+    # Sampled edge list and its adjacency index, kept with the full dataset
+    # for the last MAX_PREVIEWS samples asked for. The sample gets its own
+    # fingerprint, so results computed on it are cached apart from the full
+    # run. Samples run on one process, so they never start a worker pool or
+    # a shared copy of their own.
+    previews = index.derived.setdefault('previews', {})
+    key = (method, fraction, seed)
+    if key in previews:
+        # Move to the end, as the most recently used
+        previews[key] = previews.pop(key)
+        return previews[key]
+    followers, targets = sample_edges(index, method, fraction, seed)
+    df = pd.DataFrame({'Follower': followers, 'Target': targets})
+    fingerprint = None
+    if index.fingerprint is not None:
+        fingerprint = f"{index.fingerprint}-{method.split()[0].lower()}-{fraction:g}-{seed}"
+    sample_index = build_adjacency_index(df, fingerprint)
+    sample_index.derived['single_process'] = True
+    previews[key] = (df, sample_index)
+    for old in list(previews)[:max(len(previews) - MAX_PREVIEWS, 0)]:
+        del previews[old]
+    return previews[key]
+
+
+def compare_to_full(sample_ids, sample_scores, full_ids, full_scores, k, scale=None):
+    # How well the top k of a sample run matches the full run: the share of
+    # the full top k found, and, when sample values scale to full ones (as
+    # degrees do by 1 / fraction), the mean relative error of the scaled
+    # values of the sample's top users
+    sample_top = top_k(sample_scores, k)
+    users = sample_ids[sample_top]
+    full_top = full_ids[top_k(full_scores, k)]
+    comparison = {'overlap': len(np.intersect1d(users, full_top)) / max(len(full_top), 1)}
+    if scale is not None and len(users):
+        full_values = full_scores[np.searchsorted(full_ids, users)]
+        estimates = sample_scores[sample_top] * scale
+        comparison['relative_error'] = float(np.mean(np.abs(estimates - full_values) / np.maximum(full_values, 1)))
+    return comparison
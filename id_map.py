@@ -0,0 +1,68 @@
+import numpy as np
+
+
+def index_dtype(size):
+    return np.int32 if size < np.iinfo(np.int32).max else np.int64
+
+
+class IdMap:
+    # Translates raw user IDs to dense node indices 0..n-1 and back. Every
+    # graph structure and score vector in the tool is indexed by node, and
+    # user IDs only reappear when results are displayed.
+
+    def __init__(self, ids):
+        # Sorted, unique user IDs; position i holds the ID of node i
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def to_index(self, users):
+        # Node index of each user ID, or -1 for IDs not in the dataset
+        users = np.asarray(users)
+        if len(self.ids) == 0:
+            indices = np.full(users.shape, -1, dtype=np.int32)
+        else:
+            positions = np.minimum(np.searchsorted(self.ids, users), len(self.ids) - 1)
+            found = self.ids[positions] == users
+            indices = np.where(found, positions, -1).astype(index_dtype(len(self.ids)))
+        return int(indices) if indices.ndim == 0 else indices
+
+    def to_ids(self, indices):
+        return self.ids[indices]
+
+
+def compact_edges(follower, target):
+    # Map raw user IDs to dense node indices.
+    # Returns the sorted user IDs and the edge endpoints as node indices.
+    follower = np.asarray(follower)
+    target = np.asarray(target)
+    if follower.size == 0:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+
+    low = min(follower.min(), target.min())
+    high = max(follower.max(), target.max())
+    if low >= 0 and high < 4 * (follower.size + target.size) + 1024:
+        # IDs are small enough for a presence table, which avoids sorting all edges
+        present = np.zeros(int(high) + 1, dtype=bool)
+        present[follower] = True
+        present[target] = True
+        nodes = np.flatnonzero(present)
+        lookup = np.cumsum(present, dtype=np.int64) - 1
+        dtype = index_dtype(len(nodes))
+        src = lookup[follower].astype(dtype)
+        dst = lookup[target].astype(dtype)
+    else:
+        nodes, inverse = np.unique(np.concatenate([follower, target]), return_inverse=True)
+        inverse = inverse.astype(index_dtype(len(nodes)))
+        src, dst = inverse[:follower.size], inverse[follower.size:]
+
+    # User IDs are stored as int32 whenever they fit
+    if len(nodes) and nodes[0] >= np.iinfo(np.int32).min and nodes[-1] <= np.iinfo(np.int32).max:
+        nodes = nodes.astype(np.int32)
+    return nodes, src, dst
+
+
+def build_id_map(follower, target):
+    nodes, src, dst = compact_edges(follower, target)
+    return IdMap(nodes), src, dst
@@ -0,0 +1,180 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from adjacency_index import AdjacencyIndex
+from id_map import IdMap
+from result_cache import load_result, result_key
+
+
+def read_edge_file(source):
+    # Follower and Target columns of a headerless edge list CSV (a path or an
+    # uploaded file), as int64 arrays. None reads as no edges.
+    if source is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    df = pd.read_csv(source, header=None, names=['Follower', 'Target'], dtype=np.int64)
+    return df['Follower'].to_numpy(), df['Target'].to_numpy()
+
+
+def delta_fingerprint(fingerprint, added, removed):
+    # Fingerprint of a dataset after a delta, so its results are cached apart
+    # from those of the dataset it was built from
+    digest = hashlib.blake2b(str(fingerprint).encode('utf-8'), digest_size=16)
+    for column in (*added, *removed):
+        digest.update(np.ascontiguousarray(column, dtype=np.int64).tobytes())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def _contains(sorted_keys, keys):
+    # Whether each key is in sorted_keys
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[positions] == keys
+
+
+def _bisect(neighbors, low, high, values, right=False):
+    # Vectorized binary search of each value in neighbors[low:high]: the
+    # first position holding a value >= it (> it when right is set)
+    low, high = low.copy(), high.copy()
+    while True:
+        active = low < high
+        if not active.any():
+            return low
+        middle = (low + high) // 2
+        probe = np.asarray(neighbors[np.where(active, middle, 0)])
+        higher = (probe <= values) if right else (probe < values)
+        low = np.where(active & higher, middle + 1, low)
+        high = np.where(active & ~higher, middle, high)
+
+
+def _edge_positions(offsets, neighbors, rows, columns):
+    # Positions of every copy of the edges (rows, columns) in a CSR adjacency,
+    # and the number of copies of each edge
+    starts = np.asarray(offsets[rows], dtype=np.int64)
+    ends = np.asarray(offsets[rows + 1], dtype=np.int64)
+    first = _bisect(neighbors, starts, ends, columns)
+    last = _bisect(neighbors, first, ends, columns, right=True)
+    copies = last - first
+    positions = np.arange(int(copies.sum())) - np.repeat(np.cumsum(copies) - copies, copies) + np.repeat(first, copies)
+    return positions, copies
+
+
+def _merge_direction(offsets, neighbors, removed_rows, removed_columns, remap, n, added_rows, added_columns, dtype):
+    # One direction of the updated index: the removed edges are deleted by
+    # position, the rest renumbered, and the added edges inserted at their
+    # place in each sorted neighbor list. Every step is a binary search per
+    # changed edge or a copy of the arrays; nothing is sorted again.
+    positions, copies = _edge_positions(offsets, neighbors, removed_rows, removed_columns)
+    degree = np.diff(np.asarray(offsets, dtype=np.int64)) - np.bincount(removed_rows, weights=copies, minlength=len(remap)).astype(np.int64)
+    kept = np.delete(np.asarray(neighbors), positions)
+    alive = remap >= 0
+    if len(remap) != n or not np.array_equal(remap, np.arange(n)):
+        kept = remap[kept]
+    new_degree = np.zeros(n, dtype=np.int64)
+    new_degree[remap[alive]] = degree[alive]
+    kept_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(new_degree, out=kept_offsets[1:])
+
+    order = np.lexsort((added_columns, added_rows))
+    added_rows, added_columns = added_rows[order], added_columns[order]
+    places = _bisect(kept, kept_offsets[added_rows], kept_offsets[added_rows + 1], added_columns, right=True)
+    merged = np.insert(kept.astype(dtype), places, added_columns.astype(dtype))
+    new_offsets = kept_offsets
+    new_offsets[1:] += np.cumsum(np.bincount(added_rows, minlength=n))
+    offset_dtype = np.int32 if len(merged) < np.iinfo(np.int32).max else np.int64
+    return new_offsets.astype(offset_dtype), merged
+
+
+def _pair_keys(followers, targets, width):
+    return followers.astype(np.int64) * width + targets
+
+
+def apply_delta(df, index, added, removed=None):
+    # The edge list and adjacency index after removing every copy of the
+    # (follower, target) pairs in removed and then appending the pairs in
+    # added, each given as a (followers, targets) pair of arrays. The index
+    # is merged from the existing one rather than rebuilt, and keeps what is
+    # needed to warm-start PageRank and HITS from its cached results. Users
+    # left without edges are dropped, so the result matches loading the
+    # updated edge list from scratch.
+    if removed is None:
+        removed = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    added_followers, added_targets = (np.asarray(column, dtype=np.int64) for column in added)
+    removed_followers, removed_targets = (np.asarray(column, dtype=np.int64) for column in removed)
+    old_ids, old_n = index.id_map.ids, index.num_nodes
+    width = max(old_n, 1)
+
+    # Distinct removed pairs between known users
+    removed_src, removed_dst = index.node(removed_followers), index.node(removed_targets)
+    known = (removed_src >= 0) & (removed_dst >= 0)
+    pairs = np.unique(_pair_keys(removed_src[known], removed_dst[known], width))
+    removed_src, removed_dst = pairs // width, pairs % width
+
+    # Users keeping an edge, plus every user in the added edges
+    _, out_copies = _edge_positions(index.forward_offsets, index.forward_neighbors, removed_src, removed_dst)
+    out_degree = np.diff(np.asarray(index.forward_offsets, dtype=np.int64)) - np.bincount(removed_src, weights=out_copies, minlength=old_n)
+    in_degree = np.diff(np.asarray(index.reverse_offsets, dtype=np.int64)) - np.bincount(removed_dst, weights=out_copies, minlength=old_n)
+    has_edges = (out_degree + in_degree) > 0
+    ids = np.union1d(old_ids[has_edges], np.concatenate([added_followers, added_targets]))
+    if len(ids) and ids[0] >= np.iinfo(np.int32).min and ids[-1] <= np.iinfo(np.int32).max:
+        ids = ids.astype(np.int32)
+    id_map = IdMap(ids)
+    n = len(id_map)
+    remap = np.where(has_edges, id_map.to_index(old_ids), -1).astype(np.int64)
+
+    src, dst = id_map.to_index(added_followers).astype(np.int64), id_map.to_index(added_targets).astype(np.int64)
+    dtype = np.int32 if n < np.iinfo(np.int32).max else np.int64
+    forward = _merge_direction(index.forward_offsets, index.forward_neighbors, removed_src, removed_dst, remap, n, src, dst, dtype)
+    reverse = _merge_direction(index.reverse_offsets, index.reverse_neighbors, removed_dst, removed_src, remap, n, dst, src, dtype)
+
+    fingerprint = delta_fingerprint(index.fingerprint, (added_followers, added_targets), (removed_followers, removed_targets))
+    updated = AdjacencyIndex.from_arrays(id_map, forward, reverse, fingerprint)
+    updated.derived['previous'] = {'fingerprint': index.fingerprint, 'results': index.derived.get('results', {}),
+                                   'remap': remap}
+
+    # The edge list itself: rows of removed pairs dropped, added rows appended.
+    # Rows are matched on packed user IDs, which needs no lookup per row.
+    if len(pairs):
+        follower, target = df['Follower'].to_numpy(), df['Target'].to_numpy()
+        low, high = min(old_ids[0], 0), int(old_ids[-1])
+        span = high - low + 1
+        if span < 2 ** 31:
+            rows = _pair_keys(follower - low, target - low, span)
+            removed_rows = np.sort(_pair_keys(old_ids[removed_src] - low, old_ids[removed_dst] - low, span))
+        else:
+            rows = _pair_keys(index.node(follower), index.node(target), width)
+            removed_rows = pairs
+        df = df[~_contains(removed_rows, rows)]
+    if len(added_followers):
+        dtype = ids.dtype
+        df = pd.concat([df.astype(dtype), pd.DataFrame({'Follower': added_followers.astype(dtype),
+                                                        'Target': added_targets.astype(dtype)})], ignore_index=True)
+    return df.reset_index(drop=True), updated
+
+
+def warm_start(index, name, params):
+    # The arrays of the result the dataset this index was updated from had
+    # for the same metric and parameters, moved to the new node numbering.
+    # New users start at the mean score. None without such a result.
+    previous = index.derived.get('previous') if index is not None else None
+    if previous is None:
+        return None
+    key = result_key(name, params)
+    result = previous['results'].get(key)
+    if result is None and previous['fingerprint']:
+        result = load_result(previous['fingerprint'], key)
+    if result is None:
+        return None
+    remap = previous['remap']
+    kept = remap >= 0
+    arrays = {}
+    for vector, values in result[0].items():
+        if len(values) != len(remap):
+            return None
+        start = np.full(index.num_nodes, values[kept].mean() if kept.any() else 1.0)
+        start[remap[kept]] = values[kept]
+        arrays[vector] = start
+    return arrays
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+import streamlit.components.v1 as components
+from graph_algorithms import personalized_pagerank, top_k
+from graph_rendering import render_network_html
+from adjacency_index import build_adjacency_index
+from instrumentation import stage
+
+DIRECTIONS = ["Accounts the user follows", "Accounts following the user"]
+
+EPSILONS = [1e-4, 1e-5, 1e-6, 1e-7, 1e-8]
+
+def get_related_users(user, index, range_of_interest, direction=DIRECTIONS[0], alpha=0.85, epsilon=1e-06):
+    # Top users by PageRank personalized to user. Following the edges forward
+    # ranks the accounts whose content reaches the user; following them in
+    # reverse ranks the audience the user reaches.
+    source = index.node(user)
+    if source < 0:
+        return pd.DataFrame({'Score': [], 'User ID': []}), None
+    if direction == DIRECTIONS[0]:
+        offsets, neighbors = index.forward_offsets, index.forward_neighbors
+    else:
+        offsets, neighbors = index.reverse_offsets, index.reverse_neighbors
+    with stage("Personalized PageRank"):
+        nodes, scores, info = personalized_pagerank(offsets, neighbors, source, alpha, epsilon)
+
+    # The user always holds the most rank, so leave them out of the list
+    keep = nodes != source
+    nodes, scores = nodes[keep], scores[keep]
+    top = top_k(scores, range_of_interest)
+    users = index.id_map.to_ids(nodes[top])
+    return pd.DataFrame({'Score': scores[top], 'User ID': users}, index=users), info
+
+def related_edges(index, users):
+    # Follow edges among the given users, as Follower/Target user IDs
+    nodes = index.node(np.asarray(users))
+    followers, targets = [], []
+    for node in nodes:
+        successors = index.successors(node)
+        successors = successors[np.isin(successors, nodes)]
+        followers.append(np.full(len(successors), node))
+        targets.append(successors)
+    followers = np.concatenate(followers) if followers else np.empty(0, dtype=np.int64)
+    targets = np.concatenate(targets) if targets else np.empty(0, dtype=np.int64)
+    return pd.DataFrame({'Follower': index.id_map.to_ids(followers), 'Target': index.id_map.to_ids(targets)})
+
+def run(df, index=None):
+
+    data = df
+    if index is None:
+        index = build_adjacency_index(data)
+
+    st.subheader("Influence Around a User")
+
+    user_input = st.text_area('Enter User ID')
+
+    # Clean user_input
+    user_input = user_input.strip().replace(',', '')
+
+    # Check if user_input is valid
+    valid_input = False
+    try:
+        user_id = int(user_input)
+        if 1 <= user_id <= 11316811:
+            valid_input = True
+        else:
+            st.error("User ID must be between 1 and 11316811.")
+    except ValueError:
+        st.error("Please enter a valid integer as User ID. Choose an ID from the data below.")
+
+    # Display the head the data so user can pick a user
+    st.dataframe(data[0:1000], height=150)
+
+    direction = st.radio('Rank', DIRECTIONS, horizontal=True)
+    range_of_interest = st.slider('Number of Related Users', 1, 100, 10)
+    with st.expander("Personalized PageRank Settings"):
+        alpha = st.slider('Alpha (damping factor)', 0.5, 0.99, 0.85, 0.01, key='ppr_alpha')
+        # Smaller values read more of the graph for a more exact ranking
+        epsilon = st.select_slider('Precision (epsilon)', EPSILONS, value=1e-06, format_func=lambda value: f"{value:.0e}")
+
+    if st.button('Find Related Users') and valid_input is True:
+        with st.spinner('Calculating Personalized PageRank...'):
+            related, info = get_related_users(user_id, index, range_of_interest, direction, alpha, epsilon)
+        if info is None:
+            st.error("User ID not found in the dataset.")
+            return
+        st.markdown(f"### Top {len(related)} Users Related to {user_id}")
+        st.markdown(f"**Reached {info['nodes']} users over {info['edges_read']} edges "
+                    f"in {info['rounds']} rounds, leaving {info['residual']:.2e} of the rank unassigned**")
+        st.dataframe(related)
+        with st.spinner('Generating Visualization...'):
+            with stage("Find edges among related users"):
+                edges = related_edges(index, np.append(related['User ID'].to_numpy(), user_id))
+            source_code = render_network_html(user_id, edges)
+            components.html(source_code, width=700, height=800)
+
+if __name__ == "__main__":
+    run()
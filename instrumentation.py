@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager, nullcontext
+import pandas as pd
+import psutil
+import streamlit as st
+
+# Stage records kept per session; the oldest are dropped first
+MAX_EVENTS = 5000
+
+# How often the peak memory sampler reads the resident set size
+SAMPLE_SECONDS = 0.005
+
+# The recorder and open stages of the current thread
+_active = threading.local()
+
+_DISABLED = nullcontext()
+
+
+class PeakMemory:
+    # Context manager that samples the resident set size on a background
+    # thread and records the peak above the size on entry
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.peak = 0
+        self.start = 0
+        self.stopped = threading.Event()
+
+    def _sample(self):
+        while not self.stopped.wait(SAMPLE_SECONDS):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self.start = self.peak = self.process.memory_info().rss
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+        return False
+
+    def growth(self):
+        return self.peak - self.start
+
+
+class Recorder:
+    # Stage records of one browser session. Background jobs started from the
+    # session add theirs from other threads, hence the lock.
+
+    def __init__(self):
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.lock = threading.Lock()
+        self.run = 0
+        self.trace_allocations = False
+
+    def new_run(self):
+        self.run += 1
+        return self.run
+
+    def add(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.events)
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+
+
+def get_recorder():
+    if 'performance_recorder' not in st.session_state:
+        st.session_state['performance_recorder'] = Recorder()
+    return st.session_state['performance_recorder']
+
+
+def current_recorder():
+    return getattr(_active, 'recorder', None)
+
+
+@contextmanager
+def recording(recorder, run=None):
+    # Record the stages run on this thread into recorder; None records nothing
+    previous = current_recorder(), getattr(_active, 'run', None), getattr(_active, 'stack', None)
+    _active.recorder = recorder
+    _active.run = run if run is not None else getattr(recorder, 'run', None)
+    _active.stack = []
+    if recorder is not None and recorder.trace_allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    try:
+        yield recorder
+    finally:
+        _active.recorder, _active.run, _active.stack = previous
+
+
+def bind(function):
+    # Wrap function so that the stages it runs on another thread are recorded
+    # into the recorder of this thread, under the current run
+    recorder, run = current_recorder(), getattr(_active, 'run', None)
+    if recorder is None:
+        return function
+
+    def bound(*args, **kwargs):
+        with recording(recorder, run):
+            return function(*args, **kwargs)
+    return bound
+
+
+def stage(name):
+    # Time the enclosed block as a stage: wall time, CPU time of this thread,
+    # peak resident set growth and, when enabled, the peak of Python
+    # allocations. Costs nothing while no recorder is active.
+    recorder = current_recorder()
+    if recorder is None:
+        return _DISABLED
+    return _recorded_stage(recorder, name)
+
+
+@contextmanager
+def _recorded_stage(recorder, name):
+    stack = _active.stack
+    tracing = recorder.trace_allocations and tracemalloc.is_tracing()
+    frame = {'allocated': 0, 'base': 0}
+    if tracing:
+        # The traced peak is global, so hand the peak so far to the parent
+        # stage before restarting it for this one
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['allocated'] = max(stack[-1]['allocated'], peak - stack[-1]['base'])
+        tracemalloc.reset_peak()
+        frame['base'] = current
+    stack.append(frame)
+    depth = len(stack) - 1
+    started = time.time()
+    wall, cpu = time.perf_counter(), time.thread_time()
+    memory = PeakMemory()
+    try:
+        with memory:
+            yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+        stack.pop()
+        allocated = None
+        if tracing and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            allocated = max(frame['allocated'], peak - frame['base'])
+            if stack:
+                stack[-1]['allocated'] = max(stack[-1]['allocated'], peak - stack[-1]['base'])
+        thread = threading.current_thread()
+        recorder.add({'name': name, 'run': _active.run, 'depth': depth, 'start': started, 'wall': wall, 'cpu': cpu,
+                      'peak_rss_growth': memory.growth(), 'allocated_peak': allocated,
+                      'thread': thread.ident, 'thread_name': thread.name})
+
+
+def stage_table(events):
+    # One row per stage, nested stages indented under their parent
+    return pd.DataFrame({
+        'Stage': [" " * event['depth'] + event['name'] for event in events],
+        'Wall (ms)': [event['wall'] * 1000 for event in events],
+        'CPU (ms)': [event['cpu'] * 1000 for event in events],
+        'Peak RSS (MB)': [event['peak_rss_growth'] / 2 ** 20 for event in events],
+        'Allocated (MB)': [None if event['allocated_peak'] is None else event['allocated_peak'] / 2 ** 20 for event in events],
+    })
+
+
+def stage_summary(events):
+    # Calls and wall time of each stage over every recorded run, slowest first
+    if not events:
+        return pd.DataFrame(columns=['Calls', 'Total (s)', 'Mean (ms)', 'Max (ms)'])
+    frame = pd.DataFrame({'Stage': [event['name'] for event in events], 'wall': [event['wall'] for event in events]})
+    summary = frame.groupby('Stage')['wall'].agg(['count', 'sum', 'mean', 'max'])
+    summary.columns = ['Calls', 'Total (s)', 'Mean (ms)', 'Max (ms)']
+    summary[['Mean (ms)', 'Max (ms)']] *= 1000
+    return summary.sort_values('Total (s)', ascending=False)
+
+
+def chrome_trace(events):
+    # The stages in the Trace Event Format read by chrome://tracing and
+    # Perfetto, one complete event per stage on the thread that ran it
+    pid = os.getpid()
+    trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread, 'args': {'name': name}}
+             for thread, name in {event['thread']: event['thread_name'] for event in events}.items()]
+    for event in events:
+        trace.append({'name': event['name'], 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': event['thread'],
+                      'ts': event['start'] * 1e6, 'dur': event['wall'] * 1e6,
+                      'args': {'run': event['run'], 'cpu_ms': event['cpu'] * 1000,
+                               'peak_rss_growth_bytes': event['peak_rss_growth'],
+                               'allocated_peak_bytes': event['allocated_peak']}})
+    return json.dumps({'traceEvents': trace, 'displayTimeUnit': 'ms'})
+
+
+def show_performance_panel(recorder):
+    # Stages of the latest run, totals over all runs, and the trace download
+    events = recorder.snapshot()
+    latest = [event for event in events if event['run'] == recorder.run]
+    st.markdown("#### Latest Run")
+    if latest:
+        # Stages are recorded as they finish; list them in the order they started
+        st.dataframe(stage_table(sorted(latest, key=lambda event: event['start'])), hide_index=True)
+    else:
+        st.caption("No stages ran in the latest run.")
+    st.markdown("#### All Runs")
+    st.dataframe(stage_summary(events))
+    recorder.trace_allocations = st.checkbox("Trace Python Allocations", key='trace_allocations',
+                                             help="Records the peak Python and NumPy allocations of each stage, at some cost in speed.")
+    if not recorder.trace_allocations and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    st.download_button("Export Trace", chrome_trace(events), file_name="performance_trace.json", mime="application/json")
+    st.button("Clear", key='clear_performance', on_click=recorder.clear)
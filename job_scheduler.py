@@ -0,0 +1,110 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import bind
+
+# Long-running statistics run on a small shared pool; numpy and scipy release
+# the GIL in their inner loops, so threads run them in parallel
+MAX_WORKERS = 2
+
+# Finished jobs kept so that a rerun can pick up their result
+MAX_FINISHED_JOBS = 32
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+
+    def __init__(self, key, description, cancellable=True):
+        self.key = key
+        self.description = description
+        # Whether the function calls report often enough to be stopped
+        self.cancellable = cancellable
+        self.progress = {}
+        self.started = time.monotonic()
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def report(self, iterations=None, residual=None):
+        # Progress callback handed to the algorithm. Raising here is how a
+        # cancelled job stops at its next iteration.
+        if iterations is not None:
+            self.progress = {'iterations': iterations, 'residual': residual}
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.key)
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def done(self):
+        return self.future.done()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def failed(self):
+        return self.future.done() and not self.future.cancelled() and self.future.exception() is not None
+
+    def result(self):
+        return self.future.result()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+
+class JobScheduler:
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='network-stats')
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key, description, function, cancellable=True):
+        # Start function(job) in the background, or return the job already
+        # running or finished for the same key. A failed job is returned as
+        # well, so its error is shown instead of the work starting over on
+        # every rerun; forget_failed clears it for an explicit retry.
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and not job.cancelled():
+                return job
+            job = Job(key, description, cancellable)
+            # Stages the job runs are recorded with the session that started it
+            job.future = self.executor.submit(bind(function), job)
+            self.jobs[key] = job
+            self._forget_finished()
+            return job
+
+    def get(self, key):
+        with self.lock:
+            return self.jobs.get(key)
+
+    def forget_failed(self, key):
+        # Drop the job for key if it ended with an error, so that the next
+        # submit runs it again
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job.failed():
+                del self.jobs[key]
+
+    def cancel(self, key):
+        with self.lock:
+            job = self.jobs.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def _forget_finished(self):
+        finished = [key for key, job in self.jobs.items() if job.done()]
+        for key in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[key]
+
+
+_scheduler = JobScheduler()
+
+
+def get_scheduler():
+    return _scheduler
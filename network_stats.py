@@ -1,144 +1,410 @@
+import time
 import pandas as pd
 import numpy as np
 import streamlit as st
-import networkx as nx
 import matplotlib.pyplot as plt
-from multiprocessing import Pool
-
-def most_active_followers(df, range_of_interest):
-    # Calculate most active followers in the Network
-    follower_freq = df.Follower.value_counts().rename_axis('Follower').reset_index(name='Frequency')
-    
-    # Calculate the statistics of the most active followers
-    stats = follower_freq.Frequency.describe()
-
-    plt.figure(figsize=(14, 8))
-
-    bin_edges = np.logspace(np.log10(follower_freq['Frequency'].min()), np.log10(follower_freq['Frequency'].max()))
-    plt.hist(follower_freq['Frequency'], bins=bin_edges, color='skyblue', edgecolor='black')
+from graph_algorithms import adjacency_matrix, csr_adjacency, pagerank, hits, degree_arrays, top_k
+from id_map import compact_edges
+import out_of_core as ooc
+from adjacency_index import build_adjacency_index
+from job_scheduler import get_scheduler
+from parallel_graph import get_parallel_graph
+from result_cache import cached_result, find_result
+from graph_sampling import preview_sample, compare_to_full, SAMPLE_METHODS
+from reciprocity import reciprocity_summary
+from components import weakly_connected_components, strongly_connected_components, component_summary
+from instrumentation import stage
+from incremental import warm_start
+from triangles import global_triangles, user_triangles, METHODS as TRIANGLE_METHODS, DEFAULT_SAMPLES, DEFAULT_TIME_BUDGET
+
+# Seconds between checks on a running background job
+POLL_SECONDS = 1.0
+
+METRIC_LABELS = {
+    'active_followers': "Calculating Most Active Followers...",
+    'followed_targets': "Calculating Most Followed Targets...",
+    'degree_centrality': "Calculating Degree Centrality...",
+    'pagerank': "Calculating PageRank...",
+    'hits': "Calculating HITS Scores...",
+    'reciprocity': "Calculating Reciprocity...",
+    'components': "Calculating Connected Components...",
+    'triangles': "Counting Triangles...",
+}
+
+# Metrics whose preview is compared with the full run, and the cached score
+# vectors each comparison uses
+PREVIEW_SCORES = {
+    'active_followers': [('', 'degrees', 'out_degree')],
+    'followed_targets': [('', 'degrees', 'in_degree')],
+    'degree_centrality': [('', 'degrees', 'total_degree')],
+    'pagerank': [('', 'pagerank', 'scores')],
+    'hits': [('Hubs', 'hits', 'hubs'), ('Authorities', 'hits', 'authorities')],
+}
+
+# Settings each metric's result depends on
+METRIC_SETTINGS = {
+    'pagerank': ('alpha', 'tol', 'max_iter'),
+    'triangles': ('triangle_method', 'samples', 'time_budget'),
+}
+
+COMPONENT_KINDS = {'weak': "Weakly Connected", 'strong': "Strongly Connected"}
+
+# Metrics whose computation checks for cancellation between blocks or
+# iterations. The degree metrics are a single pass over the offsets and
+# offer no Cancel button.
+CANCELLABLE_METRICS = {'pagerank', 'hits', 'reciprocity', 'components', 'triangles'}
+
+def get_degrees(df, index=None):
+    # Out-, in- and total degree of every user. With an index these are the
+    # CSR offset differences, otherwise one bincount pass over node indices.
+    def compute():
+        if index is not None:
+            nodes = index.id_map.ids
+            out_degree, in_degree = index.out_degrees(), index.in_degrees()
+            total_degree = out_degree + in_degree
+        else:
+            nodes, src, dst = compact_edges(df['Follower'].to_numpy(), df['Target'].to_numpy())
+            out_degree, in_degree, total_degree = degree_arrays(src, dst, len(nodes))
+        return {'nodes': nodes, 'out_degree': out_degree, 'in_degree': in_degree, 'total_degree': total_degree}, {}
+
+    degrees, info = cached_result(index, 'degrees', {}, compute)
+    return degrees['nodes'], degrees['out_degree'], degrees['in_degree'], degrees['total_degree']
+
+def plot_degree_distribution(counts, bin_edges, label):
+    # A figure of its own, closed by show_plot once drawn, so reruns do not
+    # leave figures open in pyplot
+    fig, ax = plt.subplots(figsize=(14, 8))
+
+    # The counts are precomputed, so each bin is drawn with its count as weight
+    ax.hist(bin_edges[:-1], bins=bin_edges, weights=counts, color='skyblue', edgecolor='black')
 
     # Set the scale of the x-axis and y-axis to logarithmic to handle the wide range of values.
-    plt.xscale('log')
-    plt.yscale('log')
+    ax.set_xscale('log')
+    ax.set_yscale('log')
 
     # Adding a title and labels
-    plt.title('Log-Scale Distribution of "Follower" Count', fontsize=20)
-    plt.xlabel('Follower Count', fontsize=16)
-    plt.ylabel('Frequency', fontsize=16)
+    ax.set_title(f'Log-Scale Distribution of "{label}" Count', fontsize=20)
+    ax.set_xlabel(f'{label} Count', fontsize=16)
+    ax.set_ylabel('Frequency', fontsize=16)
 
     # Customizing the tick marks and grid lines for better readability
-    plt.xticks(fontsize=12)
-    plt.yticks(fontsize=12)
+    ax.tick_params(labelsize=12)
 
     # Make sure everything fits without overlapping
-    plt.tight_layout()
+    fig.tight_layout()
 
-    return follower_freq[0:range_of_interest], stats, plt
+    return fig
 
-def most_followed_targets(df, range_of_interest):
-    # Calculate most followed targets in the Network
-    target_count = df.Target.value_counts().rename_axis('Target').reset_index(name='Frequency')
+def show_plot(fig):
+    # Matplotlib draws the figure here, not when it is built
+    with stage("Draw plot"):
+        st.pyplot(fig)
+    plt.close(fig)
 
-    # Calculate the statistics of the most followed targets
-    stats = target_count.Frequency.describe()
+def get_degree_summary(df, index, degree_name):
+    # Statistics and the log-binned histogram of one degree, cached with the dataset
+    def compute():
+        nodes, out_degree, in_degree, total_degree = get_degrees(df, index)
+        degree = out_degree if degree_name == 'out_degree' else in_degree
+        frequency = degree[degree > 0]
+        stats = pd.Series(frequency, name='Frequency').describe()
+        bin_edges = np.logspace(np.log10(frequency.min()), np.log10(frequency.max()))
+        counts, bin_edges = np.histogram(frequency, bins=bin_edges)
+        return {'stats': stats.to_numpy(), 'stats_index': stats.index.to_numpy(dtype=str), 'counts': counts, 'bin_edges': bin_edges}, {}
 
-    plt.figure(figsize=(14, 8))
+    summary, info = cached_result(index, 'degree_summary', {'degree': degree_name}, compute)
+    return summary
 
-    bin_edges = np.logspace(np.log10(target_count['Frequency'].min()), np.log10(target_count['Frequency'].max()))
-    plt.hist(target_count['Frequency'], bins=bin_edges, color='skyblue', edgecolor='black')
+def degree_summary(df, index, degree_name, label, range_of_interest):
+    nodes, out_degree, in_degree, total_degree = get_degrees(df, index)
+    degree = out_degree if degree_name == 'out_degree' else in_degree
 
-    # Set the scale of the x-axis and y-axis to logarithmic to handle the wide range of values.
-    plt.xscale('log')
-    plt.yscale('log')
+    # Users with at least one edge in this direction, as value_counts would list them
+    active = degree > 0
+    frequency = degree[active]
 
-    # Adding a title and labels
-    plt.title('Log-Scale Distribution of "Target" Count', fontsize=20)
-    plt.xlabel('Target Count', fontsize=16)
-    plt.ylabel('Frequency', fontsize=16)
+    summary = get_degree_summary(df, index, degree_name)
+    stats = pd.Series(summary['stats'], index=summary['stats_index'], name='Frequency')
 
-    # Customizing the tick marks and grid lines for better readability
-    plt.xticks(fontsize=12)
-    plt.yticks(fontsize=12)
-
-    # Make sure everything fits without overlapping
-    plt.tight_layout()
+    # Get the top users by partial sort
+    top = top_k(frequency, range_of_interest)
+    top_df = pd.DataFrame({label: nodes[active][top], 'Frequency': frequency[top]})
 
-    return target_count[0:range_of_interest], stats, plt
+    return top_df, stats, plot_degree_distribution(summary['counts'], summary['bin_edges'], label)
 
-def create_subgraph(edges_list):
-    return nx.from_pandas_edgelist(edges_list, 'Follower', 'Target', create_using=nx.DiGraph())
+def most_active_followers(df, range_of_interest, index=None):
+    # Calculate most active followers in the Network
+    return degree_summary(df, index, 'out_degree', 'Follower', range_of_interest)
 
-def get_pagerank(df, range_of_interest):
+def most_followed_targets(df, range_of_interest, index=None):
+    # Calculate most followed targets in the Network
+    return degree_summary(df, index, 'in_degree', 'Target', range_of_interest)
+
+def build_sparse_graph(df, index=None):
+    # Sparse adjacency matrix over node indices, and its transpose
+    with stage("Build sparse graph"):
+        if index is not None:
+            A = csr_adjacency(index.forward_offsets, index.forward_neighbors, index.num_nodes)
+            AT = csr_adjacency(index.reverse_offsets, index.reverse_neighbors, index.num_nodes)
+            return index.id_map.ids, A, AT
+        nodes, src, dst = compact_edges(df['Follower'].to_numpy(), df['Target'].to_numpy())
+        A = adjacency_matrix(src, dst, len(nodes))
+        return nodes, A, A.T.tocsr()
+
+def pagerank_scores(df, alpha=0.85, tol=1e-06, max_iter=100, index=None, callback=None):
+    # PageRank of every node, or the full score vector from an earlier run.
+    # After an edge update, the iteration starts from the scores before it.
+    params = {'alpha': alpha, 'tol': tol, 'max_iter': max_iter}
+
+    def compute():
+        start = warm_start(index, 'pagerank', params)
+        start = start['scores'] if start is not None else None
+        graph = get_parallel_graph(index) if index is not None else None
+        if graph is not None:
+            # Large graphs: row-block SpMV on worker processes over shared files
+            scores, info = graph.pagerank(alpha=alpha, tol=tol, max_iter=max_iter, callback=callback, start=start)
+            return {'scores': scores}, dict(info, warm_start=start is not None)
+        if getattr(index, 'out_of_core', False):
+            scores, info = ooc.pagerank(index, alpha=alpha, tol=tol, max_iter=max_iter, callback=callback, start=start)
+            return {'scores': scores}, dict(info, warm_start=start is not None)
+        nodes, A, AT = build_sparse_graph(df, index)
+        scores, info = pagerank(A, alpha=alpha, tol=tol, max_iter=max_iter, callback=callback, start=start)
+        return {'scores': scores}, dict(info, warm_start=start is not None)
+
+    result, info = cached_result(index, 'pagerank', params, compute)
+    return result['scores'], info
+
+def get_pagerank(df, range_of_interest, alpha=0.85, tol=1e-06, max_iter=100, index=None, callback=None):
 
     data = df
 
-    # Splitting the DataFrame into chunks for parallel processing
-    df_split = np.array_split(data, 4)
-
-    # Create a pool of processes
-    with Pool(4) as pool:
-        # Create subgraphs in parallel
-        subgraphs = pool.map(create_subgraph, df_split)
-
-    # Combine subgraphs into a single graph
-    G = nx.DiGraph()
-    for sg in subgraphs:
-        G = nx.compose(G, sg)
-
-    # Calculate the pagerank
-    pagerank = nx.pagerank(G, alpha=0.85, max_iter=100, tol=1e-06)
-
-    # Process the pagerank results
-    pagerank_df = pd.DataFrame.from_dict(pagerank, orient='index', columns=['Pagerank'])
-    pagerank_df['User ID'] = pagerank_df.index
-    pagerank_df.reset_index(drop=True, inplace=False)
+    # Calculate the pagerank, or reuse the full score vector from an earlier run
+    scores, info = pagerank_scores(data, alpha, tol, max_iter, index, callback)
+    nodes = get_degrees(data, index)[0]
 
     # Get the top nodes efficiently
-    top_pagerank_df = pagerank_df.nlargest(range_of_interest, 'Pagerank')
+    top = top_k(scores, range_of_interest)
+    top_pagerank_df = pd.DataFrame({'Pagerank': scores[top], 'User ID': nodes[top]}, index=nodes[top])
 
-    return top_pagerank_df
+    return top_pagerank_df, info
 
-def get_degree_centrality(df, range_of_interest):
-    G = nx.from_pandas_edgelist(df, 'Follower', 'Target', create_using=nx.DiGraph())
-    degree_centrality = nx.degree_centrality(G)
+def get_degree_centrality(df, range_of_interest, index=None):
+    nodes, out_degree, in_degree, total_degree = get_degrees(df, index)
 
-    # Convert to DataFrame
-    degree_centrality_df = pd.DataFrame.from_dict(degree_centrality, orient='index', columns=['DegreeCentrality'])
-    degree_centrality_df['User'] = degree_centrality_df.index
-    degree_centrality_df.reset_index(drop=True, inplace=False)
+    # Normalize by the maximum possible degree, as nx.degree_centrality does
+    scale = 1.0 / (len(nodes) - 1) if len(nodes) > 1 else 1.0
+    top = top_k(total_degree, range_of_interest)
 
-    # Get the top nodes
-    top_degree_centrality_df = degree_centrality_df.nlargest(range_of_interest, 'DegreeCentrality')
+    # Convert to DataFrame
+    top_degree_centrality_df = pd.DataFrame({'DegreeCentrality': total_degree[top] * scale, 'User': nodes[top]}, index=nodes[top])
 
     return top_degree_centrality_df
 
-def get_hits_scores(df, range_of_interest):
-    # Create a graph from the dataframe
-    G = nx.from_pandas_edgelist(df, 'Follower', 'Target', create_using=nx.DiGraph())
-
-    # Compute the HITS algorithm
-    hubs, authorities = nx.hits(G, max_iter=100, tol=1e-08)
-
-    # Convert to DataFrames
-    hubs_df = pd.DataFrame.from_dict(hubs, orient='index', columns=['HubScore'])
-    authorities_df = pd.DataFrame.from_dict(authorities, orient='index', columns=['AuthorityScore'])
-
-    # Reset index to have the user column
-    hubs_df['User'] = hubs_df.index
-    authorities_df['User'] = authorities_df.index
-
-    hubs_df.reset_index(drop=True, inplace=False)
-    authorities_df.reset_index(drop=True, inplace=False)
+def hits_scores(df, tol=1e-08, max_iter=100, index=None, callback=None):
+    # Hub and authority scores of every node, or the full score vectors from an earlier run.
+    # After an edge update, the iteration starts from the hub scores before it.
+    params = {'tol': tol, 'max_iter': max_iter}
+
+    def compute():
+        start = warm_start(index, 'hits', params)
+        start = start['hubs'] if start is not None else None
+        graph = get_parallel_graph(index) if index is not None else None
+        if graph is not None:
+            hubs, authorities, info = graph.hits(tol=tol, max_iter=max_iter, callback=callback, start=start)
+            return {'hubs': hubs, 'authorities': authorities}, dict(info, warm_start=start is not None)
+        if getattr(index, 'out_of_core', False):
+            hubs, authorities, info = ooc.hits(index, tol=tol, max_iter=max_iter, callback=callback, start=start)
+            return {'hubs': hubs, 'authorities': authorities}, dict(info, warm_start=start is not None)
+        nodes, A, AT = build_sparse_graph(df, index)
+        hubs, authorities, info = hits(A, tol=tol, max_iter=max_iter, AT=AT, callback=callback, start=start)
+        return {'hubs': hubs, 'authorities': authorities}, dict(info, warm_start=start is not None)
+
+    result, info = cached_result(index, 'hits', params, compute)
+    return result['hubs'], result['authorities'], info
+
+def get_hits_scores(df, range_of_interest, tol=1e-08, max_iter=100, index=None, callback=None):
+    # Compute the HITS algorithm, or reuse the full score vectors from an earlier run
+    hubs, authorities, info = hits_scores(df, tol, max_iter, index, callback)
+    nodes = get_degrees(df, index)[0]
 
     # Get the top nodes by hub score and authority score
-    top_hubs_df = hubs_df.nlargest(range_of_interest, 'HubScore')
-    top_authorities_df = authorities_df.nlargest(range_of_interest, 'AuthorityScore')
-
-    return top_hubs_df, top_authorities_df
-
-def run(df):
+    top_hubs = top_k(hubs, range_of_interest)
+    top_authorities = top_k(authorities, range_of_interest)
+    top_hubs_df = pd.DataFrame({'HubScore': hubs[top_hubs], 'User': nodes[top_hubs]}, index=nodes[top_hubs])
+    top_authorities_df = pd.DataFrame({'AuthorityScore': authorities[top_authorities], 'User': nodes[top_authorities]}, index=nodes[top_authorities])
+
+    return top_hubs_df, top_authorities_df, info
+
+def get_mutual_counts(index, callback=None):
+    # Mutual friend count of every user and the mutual pair totals, cached
+    # with the dataset
+    def compute():
+        mutual_counts, info = reciprocity_summary(index, callback)
+        return {'mutual_counts': mutual_counts}, info
+
+    result, info = cached_result(index, 'reciprocity', {}, compute)
+    return result['mutual_counts'], info
+
+def get_reciprocity(df, range_of_interest, index=None):
+    # Mutual follow statistics, with the users having the most mutual friends
+    if index is None:
+        index = build_adjacency_index(df)
+    mutual_counts, info = get_mutual_counts(index)
+    nodes = index.id_map.ids
+
+    top = top_k(mutual_counts, range_of_interest)
+    top_df = pd.DataFrame({'User': nodes[top], 'MutualFriends': mutual_counts[top]})
+    stats = pd.Series({'Mutual Pairs': info['mutual_pairs'], 'Distinct Edges': info['edges'],
+                       'Users with Mutual Friends': int((mutual_counts > 0).sum())}, name='Value')
+
+    # Log-binned distribution of mutual friend counts, as for the degrees
+    frequency = mutual_counts[mutual_counts > 0]
+    plot = None
+    if len(frequency):
+        counts, bin_edges = np.histogram(frequency, bins=np.logspace(0, np.log10(max(frequency.max(), 2))))
+        plot = plot_degree_distribution(counts, bin_edges, 'Mutual Friend')
+    return top_df, stats, plot
+
+def get_components(df, kind, index=None, callback=None):
+    # Component number of every user (0 is the largest) and the component
+    # sizes, largest first, for weakly or strongly connected components
+    if index is None:
+        index = build_adjacency_index(df)
+
+    def compute():
+        if kind == 'weak':
+            labels, info = weakly_connected_components(index, callback)
+        else:
+            labels, info = strongly_connected_components(index, callback)
+        component, sizes = component_summary(labels)
+        return {'component': component.astype(np.int32), 'sizes': sizes}, info
+
+    result, info = cached_result(index, 'components', {'kind': kind}, compute)
+    return result['component'], result['sizes']
+
+def component_report(df, kind, index=None):
+    # Summary table, log-binned size histogram and giant component members
+    component, sizes = get_components(df, kind, index)
+    nodes = get_degrees(df, index)[0]
+    stats = pd.Series({'Components': len(sizes), 'Giant Component Size': int(sizes[0]),
+                       'Giant Component Share': sizes[0] / len(component),
+                       'Single-User Components': int((sizes == 1).sum())}, name='Value', dtype=object)
+    counts, bin_edges = np.histogram(sizes, bins=np.logspace(0, np.log10(max(sizes.max(), 2))))
+    giant = nodes[component == 0]
+    return stats, plot_degree_distribution(counts, bin_edges, f'{COMPONENT_KINDS[kind]} Component Size'), giant
+
+def get_triangles(df, method="Auto", samples=DEFAULT_SAMPLES, time_budget=DEFAULT_TIME_BUDGET, index=None, callback=None):
+    # Global triangle count, transitivity and average clustering, each with
+    # its 95% interval, counted exactly or estimated by wedge sampling
+    if index is None:
+        index = build_adjacency_index(df)
+
+    def compute():
+        summary, per_user, info = global_triangles(index, method, samples, time_budget, callback=callback)
+        arrays = {'per_user': per_user} if per_user is not None else {}
+        return arrays, dict(info, **summary)
+
+    result, info = cached_result(index, 'triangles', {'method': method, 'samples': samples, 'time_budget': time_budget}, compute)
+    table = pd.DataFrame({name: info[key] for name, key in (('Triangles', 'triangles'), ('Transitivity', 'transitivity'),
+                                                           ('Average Clustering', 'average_clustering'))},
+                         index=['Estimate', '95% Low', '95% High']).T
+    return table, info
+
+def preview_comparison(metric, full_index, index, range_of_interest, settings, fraction):
+    # Top-k overlap (and, for degrees, relative error of the degrees scaled up
+    # by 1 / fraction) between the preview and a cached full run of the
+    # metric. None until the full run has been computed.
+    comparisons = {}
+    for label, name, vector in PREVIEW_SCORES[metric]:
+        params = {'alpha': settings['alpha'], 'tol': settings['tol'], 'max_iter': settings['max_iter']} if name == 'pagerank' \
+            else {'tol': 1e-08, 'max_iter': 100} if name == 'hits' else {}
+        full = find_result(full_index, name, params)
+        sample = find_result(index, name, params)
+        if full is None or sample is None:
+            return None
+        scale = 1 / fraction if name == 'degrees' else None
+        comparisons[label] = compare_to_full(index.id_map.ids, sample[0][vector], full_index.id_map.ids,
+                                             full[0][vector], range_of_interest, scale)
+    return comparisons
+
+def start_full_run(data, index, metric, settings):
+    key, function = metric_job(data, index, metric, settings)
+    get_scheduler().forget_failed(key)
+    get_scheduler().submit(key, METRIC_LABELS[metric], function, metric in CANCELLABLE_METRICS)
+
+def show_preview_comparison(metric, full_data, full_index, index, range_of_interest, settings, fraction):
+    # Compare with the full run when it is cached, otherwise offer to start
+    # it. Returns the full run's job while it is still running.
+    comparison = preview_comparison(metric, full_index, index, range_of_interest, settings, fraction)
+    if comparison is not None:
+        for label, values in comparison.items():
+            line = f"**{label + ': ' if label else ''}{values['overlap']:.0%} of the full run's top {range_of_interest} found by the preview"
+            if 'relative_error' in values:
+                line += f", scaled values off by {values['relative_error']:.1%} on average"
+            st.markdown(line + "**")
+        return None
+    key, function = metric_job(full_data, full_index, metric, settings)
+    job = get_scheduler().get(key)
+    if job is None:
+        st.caption("Preview results come from a sample. Run the full computation to compare.")
+        st.button("Run on Full Dataset", key=f"full_run_{metric}", on_click=start_full_run,
+                  args=(full_data, full_index, metric, settings))
+        return None
+    job_ready(job)
+    return job
+
+def show_metric(metric):
+    # A click on a metric's button also retries it if its last run failed
+    st.session_state['network_stats_metric'] = metric
+    st.session_state['network_stats_retry'] = True
+
+def cancel_job(key):
+    get_scheduler().cancel(key)
+    st.session_state['network_stats_metric'] = None
+
+def metric_job(data, index, metric, settings):
+    # Background work for a metric: fill the result cache, which the page
+    # then slices to the range of interest
+    jobs = {
+        'active_followers': lambda job: get_degree_summary(data, index, 'out_degree'),
+        'followed_targets': lambda job: get_degree_summary(data, index, 'in_degree'),
+        'degree_centrality': lambda job: get_degrees(data, index),
+        'pagerank': lambda job: get_pagerank(data, 1, settings['alpha'], settings['tol'], settings['max_iter'],
+                                             index=index, callback=job.report),
+        'hits': lambda job: get_hits_scores(data, 1, index=index, callback=job.report),
+        'reciprocity': lambda job: get_mutual_counts(index, job.report),
+        'components': lambda job: [get_components(data, kind, index, job.report) for kind in COMPONENT_KINDS],
+        'triangles': lambda job: get_triangles(data, settings['triangle_method'], settings['samples'],
+                                               settings['time_budget'], index, job.report),
+    }
+    params = tuple(settings[name] for name in METRIC_SETTINGS.get(metric, ()))
+    key = (index.fingerprint or id(index), metric) + params
+
+    def function(job):
+        with stage(f"Background job: {metric}"):
+            return jobs[metric](job)
+    return key, function
+
+def job_ready(job):
+    # True once the job has finished, otherwise show its progress
+    if job.done():
+        if job.future.exception() is not None:
+            st.error(f"{job.description} failed: {job.future.exception()}")
+            return False
+        return True
+    if job.progress:
+        st.info(f"{job.description} iteration {job.progress['iterations']}, residual {job.progress['residual']:.3e} ({job.elapsed():.0f}s)")
+    else:
+        st.info(f"{job.description} ({job.elapsed():.0f}s)")
+    if job.cancellable:
+        st.button("Cancel", key=f"cancel_{job.key}", on_click=cancel_job, args=(job.key,))
+    return False
+
+def run(df, index=None):
 
     data = df
+    if index is None:
+        index = build_adjacency_index(data)
 
     # Display Global Statistics of the Network
     st.subheader("**Global Statistics of the Network**")
@@ -146,48 +412,152 @@ def run(df):
     # Sidebar for user input
     st.subheader("Settings")
     range_of_interest = st.slider("Select Range of Interest", 1, 100, 10)
-
-
-    # Buttons for each metric
-    if st.button("Show Most Active Followers"):
-        with st.spinner("Calculating Most Active Followers..."):
-            active_followers, stats_followers, plot_followers = most_active_followers(data, range_of_interest)
-            st.write(f"### Top {range_of_interest} Most Active Followers")
-            st.dataframe(active_followers)
-            st.write("### Statistical Summary of Following Count")
-            st.dataframe(stats_followers)
-            st.markdown(f"**A follower has an average of {stats_followers['mean'].round(3)} targets**")
-            st.pyplot(plot_followers)
-
-    if st.button("Show Most Followed Targets"):
-        with st.spinner("Calculating Most Followed Targets..."):
-            followed_targets, stats_targets, plot_targets = most_followed_targets(data, range_of_interest)
-            st.write(f"### Top {range_of_interest} Most Followed Targets")
-            st.dataframe(followed_targets)
-            st.write("### Statistical Summary of Target Count")
-            st.dataframe(stats_targets)
-            st.markdown(f"**A target has an average of {stats_targets['mean'].round(3)} followers**")
-            st.pyplot(plot_targets)
-
-    if st.button("Show Degree Centrality"):
-        with st.spinner("Calculating Degree Centrality..."):
-            degree_centrality = get_degree_centrality(data, range_of_interest)
-            st.write(f"### Top {range_of_interest} Influential Users by Degree Centrality")
-            st.dataframe(degree_centrality)
-    
-    if st.button("Show PageRank"):
-        with st.spinner("Calculating PageRank..."):
-            pagerank = get_pagerank(data, range_of_interest)
-            st.write(f"### Top {range_of_interest} Influential Users by PageRank")
-            st.dataframe(pagerank)
-
-    if st.button("Show HITS Scores"):
-        with st.spinner("Calculating HITS Scores..."):
-            top_hubs, top_authorities = get_hits_scores(data, range_of_interest)
-            st.write(f"### Top {range_of_interest} Hubs")
-            st.dataframe(top_hubs)
-            st.write(f"### Top {range_of_interest} Authorities")
-            st.dataframe(top_authorities)
+    with st.expander("PageRank Settings"):
+        alpha = st.number_input("Damping Factor (alpha)", 0.0, 1.0, 0.85, 0.01)
+        tol = st.number_input("Tolerance", 1e-12, 1e-02, 1e-06, format="%.0e")
+        max_iter = int(st.number_input("Maximum Iterations", 1, 1000, 100))
+    with st.expander("Triangle Settings"):
+        # Sampling trades accuracy for speed; Auto counts exactly on small graphs
+        triangle_method = st.radio("Counting Method", TRIANGLE_METHODS, horizontal=True)
+        samples = int(st.number_input("Sample Size (wedges)", 1000, 100_000_000, DEFAULT_SAMPLES, 100_000))
+        time_budget = float(st.number_input("Time Budget (seconds)", 0.1, 3600.0, DEFAULT_TIME_BUDGET, 1.0))
+    settings = {'alpha': alpha, 'tol': tol, 'max_iter': max_iter,
+                'triangle_method': triangle_method, 'samples': samples, 'time_budget': time_budget}
+    with st.expander("Preview Settings"):
+        # Preview runs every metric on a reproducible sample of the network
+        preview = st.checkbox("Preview on a Sample", key='preview_mode')
+        sample_method = st.radio("Sampling", SAMPLE_METHODS, horizontal=True, disabled=not preview)
+        fraction = st.slider("Sample Fraction", 0.01, 0.5, 0.05, 0.01, disabled=not preview)
+        seed = int(st.number_input("Sample Seed", 0, 2 ** 31 - 1, 0, disabled=not preview))
+
+    full_data, full_index = data, index
+    full_job = None
+    if preview:
+        with st.spinner("Sampling the network..."):
+            data, index = preview_sample(full_index, sample_method, fraction, seed)
+        st.info(f"Preview: {len(data):,} of {full_index.num_edges:,} edges ({sample_method.lower()} of {fraction:.0%})")
+
+    # Buttons for each metric. The last metric shown stays on screen, so moving
+    # the slider re-slices its cached scores instead of hiding it. Metrics are
+    # computed by background jobs; a request for a job that is already running
+    # attaches to it, and the page polls until the result is ready.
+    shown = st.session_state.get('network_stats_metric')
+    job = None
+    if shown is not None:
+        key, function = metric_job(data, index, shown, settings)
+        if st.session_state.pop('network_stats_retry', False):
+            get_scheduler().forget_failed(key)
+        job = get_scheduler().submit(key, METRIC_LABELS[shown], function, shown in CANCELLABLE_METRICS)
+    ready = job is not None and job_ready(job)
+
+    st.button("Show Most Active Followers", on_click=show_metric, args=('active_followers',))
+    if shown == 'active_followers' and ready:
+        active_followers, stats_followers, plot_followers = most_active_followers(data, range_of_interest, index)
+        st.write(f"### Top {range_of_interest} Most Active Followers")
+        st.dataframe(active_followers)
+        st.write("### Statistical Summary of Following Count")
+        st.dataframe(stats_followers)
+        st.markdown(f"**A follower has an average of {stats_followers['mean'].round(3)} targets**")
+        show_plot(plot_followers)
+        if preview:
+            full_job = show_preview_comparison('active_followers', full_data, full_index, index, range_of_interest, settings, fraction)
+
+    st.button("Show Most Followed Targets", on_click=show_metric, args=('followed_targets',))
+    if shown == 'followed_targets' and ready:
+        followed_targets, stats_targets, plot_targets = most_followed_targets(data, range_of_interest, index)
+        st.write(f"### Top {range_of_interest} Most Followed Targets")
+        st.dataframe(followed_targets)
+        st.write("### Statistical Summary of Target Count")
+        st.dataframe(stats_targets)
+        st.markdown(f"**A target has an average of {stats_targets['mean'].round(3)} followers**")
+        show_plot(plot_targets)
+        if preview:
+            full_job = show_preview_comparison('followed_targets', full_data, full_index, index, range_of_interest, settings, fraction)
+
+    st.button("Show Degree Centrality", on_click=show_metric, args=('degree_centrality',))
+    if shown == 'degree_centrality' and ready:
+        degree_centrality = get_degree_centrality(data, range_of_interest, index)
+        st.write(f"### Top {range_of_interest} Influential Users by Degree Centrality")
+        st.dataframe(degree_centrality)
+        if preview:
+            full_job = show_preview_comparison('degree_centrality', full_data, full_index, index, range_of_interest, settings, fraction)
+
+    st.button("Show PageRank", on_click=show_metric, args=('pagerank',))
+    if shown == 'pagerank' and ready:
+        pagerank, info = get_pagerank(data, range_of_interest, alpha, tol, max_iter, index=index)
+        st.write(f"### Top {range_of_interest} Influential Users by PageRank")
+        st.dataframe(pagerank)
+        warm = ", starting from the scores before the last edge update" if info.get('warm_start') else ""
+        st.markdown(f"**Power iteration ran {info['iterations']} iterations with a residual of {info['residual']:.3e}{warm}**")
+        if not info['converged']:
+            st.warning(f"PageRank did not converge within {info['iterations']} iterations.")
+        if preview:
+            full_job = show_preview_comparison('pagerank', full_data, full_index, index, range_of_interest, settings, fraction)
+
+    st.button("Show HITS Scores", on_click=show_metric, args=('hits',))
+    if shown == 'hits' and ready:
+        top_hubs, top_authorities, info = get_hits_scores(data, range_of_interest, index=index)
+        st.write(f"### Top {range_of_interest} Hubs")
+        st.dataframe(top_hubs)
+        st.write(f"### Top {range_of_interest} Authorities")
+        st.dataframe(top_authorities)
+        warm = ", starting from the scores before the last edge update" if info.get('warm_start') else ""
+        st.markdown(f"**HITS ran {info['iterations']} iterations with a residual of {info['residual']:.3e}{warm}**")
+        if not info['converged']:
+            st.warning(f"HITS did not converge within {info['iterations']} iterations.")
+        if preview:
+            full_job = show_preview_comparison('hits', full_data, full_index, index, range_of_interest, settings, fraction)
+
+    st.button("Show Reciprocity", on_click=show_metric, args=('reciprocity',))
+    if shown == 'reciprocity' and ready:
+        mutual_users, stats_mutual, plot_mutual = get_reciprocity(data, range_of_interest, index)
+        st.write("### Mutual Follows")
+        st.dataframe(stats_mutual)
+        reciprocity = 2 * stats_mutual['Mutual Pairs'] / max(stats_mutual['Distinct Edges'], 1)
+        st.markdown(f"**{reciprocity:.2%} of follow edges are followed back**")
+        st.write(f"### Top {range_of_interest} Users by Mutual Friends")
+        st.dataframe(mutual_users)
+        if plot_mutual is not None:
+            show_plot(plot_mutual)
+
+    st.button("Show Connected Components", on_click=show_metric, args=('components',))
+    if shown == 'components' and ready:
+        lookup = st.text_input("Check whether a user is in the giant components", key='component_lookup')
+        for kind, label in COMPONENT_KINDS.items():
+            stats_components, plot_components, giant = component_report(data, kind, index)
+            st.write(f"### {label} Components")
+            st.dataframe(stats_components)
+            show_plot(plot_components)
+            st.write(f"### Members of the Giant {label} Component")
+            st.dataframe(pd.DataFrame({'User ID': giant[:1000]}), height=150)
+            if lookup.strip().isdigit():
+                member = np.isin(int(lookup.strip()), giant)
+                st.markdown(f"**User {lookup.strip()} is {'in' if member else 'not in'} the giant {label.lower()} component**")
+
+    st.button("Show Clustering and Triangles", on_click=show_metric, args=('triangles',))
+    if shown == 'triangles' and ready:
+        triangle_table, info = get_triangles(data, triangle_method, samples, time_budget, index)
+        st.write("### Triangles and Clustering")
+        st.dataframe(triangle_table)
+        if info['exact']:
+            st.markdown(f"**Counted exactly in {info['seconds']:.1f}s**")
+        else:
+            st.markdown(f"**Estimated from {info['samples']:,} sampled wedges in {info['seconds']:.1f}s**")
+        user_input = st.text_input("User ID for Local Clustering", key='triangle_user').strip().replace(',', '')
+        if user_input.isdigit():
+            local = user_triangles(index, int(user_input), samples)
+            if local is None:
+                st.error("User ID not found in the dataset.")
+            else:
+                st.dataframe(pd.DataFrame({'Triangles': local['triangles'], 'Clustering': local['clustering']},
+                                          index=['Estimate', '95% Low', '95% High']).T)
+                st.markdown(f"**User {user_input} has {local['degree']} distinct neighbors; "
+                            f"{'all' if local['exact'] else f'{samples:,} sampled'} neighbor pairs checked**")
+
+    # Check back on a running job without blocking the page
+    if (job is not None and not job.done()) or (full_job is not None and not full_job.done()):
+        time.sleep(POLL_SECONDS)
+        st.rerun()
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()
@@ -0,0 +1,302 @@
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from id_map import IdMap, index_dtype
+from graph_algorithms import power_pagerank, power_hits
+from compressed_index import compress_neighbors, load_neighbors, BLOCK_EDGES, DECODE_BYTES_PER_EDGE
+
+# Default limit on the memory used for edge data in out-of-core mode
+DEFAULT_MEMORY_LIMIT_MB = 2048
+
+# Working bytes per edge in a block: endpoints, the duplicate mask, weights
+# and the temporaries of bincount and sorting
+BYTES_PER_EDGE = 48
+
+# Node-sized vectors an iterative algorithm keeps at once (scores, degrees,
+# accumulators), each 8 bytes per node
+NODE_VECTORS = 8
+
+MIN_CHUNK_EDGES = 100_000
+
+
+def chunk_edges_for(memory_limit, num_nodes, bytes_per_edge=BYTES_PER_EDGE):
+    # Edges per block so that one block plus the node vectors fit the limit.
+    # Node vectors are always needed, so only the edge share is bounded.
+    available = memory_limit - NODE_VECTORS * 8 * num_nodes
+    return max(MIN_CHUNK_EDGES, int(available // bytes_per_edge))
+
+
+def _column_chunks(df, chunk_rows):
+    follower = df['Follower'].to_numpy()
+    target = df['Target'].to_numpy()
+    for start in range(0, len(follower), chunk_rows):
+        yield np.asarray(follower[start:start + chunk_rows]), np.asarray(target[start:start + chunk_rows])
+
+
+def _chunked_id_map(df, chunk_rows):
+    # Sorted unique user IDs, gathered one chunk of edges at a time
+    high = -1
+    low = 0
+    for follower, target in _column_chunks(df, chunk_rows):
+        if follower.size:
+            low = min(low, follower.min(), target.min())
+            high = max(high, follower.max(), target.max())
+
+    if low >= 0 and high < 8 * len(df) + 1024:
+        # A presence table over the ID range costs one byte per possible ID
+        present = np.zeros(int(high) + 1, dtype=bool)
+        for follower, target in _column_chunks(df, chunk_rows):
+            present[follower] = True
+            present[target] = True
+        nodes = np.flatnonzero(present)
+    else:
+        nodes = np.empty(0, dtype=np.int64)
+        for follower, target in _column_chunks(df, chunk_rows):
+            nodes = np.union1d(nodes, np.concatenate([follower, target]))
+
+    if len(nodes) and nodes[0] >= np.iinfo(np.int32).min and nodes[-1] <= np.iinfo(np.int32).max:
+        nodes = nodes.astype(np.int32)
+    return IdMap(nodes)
+
+
+def _row_buckets(offsets, chunk_edges):
+    # Row boundaries splitting the rows into ranges of at most chunk_edges
+    # edges each (a single larger row gets a range of its own)
+    n = len(offsets) - 1
+    bounds = [0]
+    while bounds[-1] < n:
+        row = bounds[-1]
+        end = int(np.searchsorted(offsets, offsets[row] + chunk_edges, side='right')) - 1
+        bounds.append(min(max(end, row + 1), n))
+    return np.array(bounds, dtype=np.int64)
+
+
+def _build_csr(df, id_map, column_from, column_to, directory, prefix, chunk_rows):
+    # External counting sort of the edge list into CSR files. Degrees give
+    # the offsets; each chunk of edges is then appended to temporary bucket
+    # files, one per range of rows holding at most chunk_rows edges, and each
+    # bucket is sorted in memory and written to its own slice of the
+    # neighbors file. Writes to the neighbors file are sequential, so it
+    # never has to fit in the page cache.
+    n = len(id_map)
+    edges = len(df)
+    from_values = df[column_from].to_numpy()
+    to_values = df[column_to].to_numpy()
+    counts = np.zeros(n, dtype=np.int64)
+    for start in range(0, edges, chunk_rows):
+        counts += np.bincount(id_map.to_index(np.asarray(from_values[start:start + chunk_rows])), minlength=n)
+
+    offsets = np.lib.format.open_memmap(os.path.join(directory, prefix + '_offsets.npy'), mode='w+',
+                                        dtype=np.int32 if edges < np.iinfo(np.int32).max else np.int64, shape=(n + 1,))
+    offsets[0] = 0
+    np.cumsum(counts, out=offsets[1:])
+    neighbors = np.lib.format.open_memmap(os.path.join(directory, prefix + '_neighbors.npy'), mode='w+',
+                                          dtype=index_dtype(n), shape=(edges,))
+
+    # Each edge is kept as one key, row * n + column, so sorting the keys of
+    # a bucket orders it by row and every neighbor list by column
+    bounds = _row_buckets(offsets, chunk_rows)
+    bucket_dir = os.path.join(directory, prefix + '_buckets')
+    os.makedirs(bucket_dir, exist_ok=True)
+
+    def bucket_path(bucket):
+        return os.path.join(bucket_dir, f'{bucket}.bin')
+
+    for start in range(0, edges, chunk_rows):
+        rows = id_map.to_index(np.asarray(from_values[start:start + chunk_rows])).astype(np.int64)
+        columns = id_map.to_index(np.asarray(to_values[start:start + chunk_rows]))
+        keys = rows * n + columns
+        keys.sort()
+        buckets = np.searchsorted(bounds, keys // n, side='right') - 1
+        split = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1], True])
+        for first, last in zip(split[:-1], split[1:]):
+            with open(bucket_path(int(buckets[first])), 'ab') as file:
+                keys[first:last].tofile(file)
+
+    for bucket in range(len(bounds) - 1):
+        path = bucket_path(bucket)
+        if not os.path.exists(path):
+            continue
+        keys = np.fromfile(path, dtype=np.int64)
+        keys.sort()
+        neighbors[int(offsets[bounds[bucket]]):int(offsets[bounds[bucket + 1]])] = keys % n
+        os.remove(path)
+    shutil.rmtree(bucket_dir, ignore_errors=True)
+
+    offsets.flush()
+    neighbors.flush()
+    del offsets, neighbors
+
+
+class OutOfCoreIndex:
+    # Same interface as AdjacencyIndex, but the CSR offsets and neighbor lists
+    # are memory-mapped files built from the mapped edge columns in chunks.
+    # Algorithms read the edges in blocks of chunk_edges. Compressed, the
+    # neighbor lists are kept as delta-encoded blocks and decoded on access.
+
+    out_of_core = True
+
+    def __init__(self, df, fingerprint=None, memory_limit=DEFAULT_MEMORY_LIMIT_MB * 1024 * 1024, directory=None,
+                 compressed=False):
+        self.fingerprint = fingerprint
+        self.memory_limit = memory_limit
+        self.compressed = compressed
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='edge_csr_')
+        self.directory = directory
+
+        if not self._load():
+            # Size chunks from a rough node count before the real one is known
+            self.chunk_edges = chunk_edges_for(memory_limit, 0)
+            self._build(df)
+            self._load()
+        # Decoding a block of compressed edges needs room of its own
+        bytes_per_edge = BYTES_PER_EDGE + (DECODE_BYTES_PER_EDGE if compressed else 0)
+        self.chunk_edges = chunk_edges_for(memory_limit, self.num_nodes, bytes_per_edge)
+        self.derived = {}
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.directory, 'meta.json'), 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            if meta.get('compressed', False) != self.compressed:
+                return False
+            self.id_map = IdMap(np.load(os.path.join(self.directory, 'nodes.npy'), mmap_mode='r'))
+            self.forward_offsets = np.load(os.path.join(self.directory, 'forward_offsets.npy'), mmap_mode='r')
+            self.forward_neighbors = load_neighbors(self.directory, 'forward', self.forward_offsets)
+            self.reverse_offsets = np.load(os.path.join(self.directory, 'reverse_offsets.npy'), mmap_mode='r')
+            self.reverse_neighbors = load_neighbors(self.directory, 'reverse', self.reverse_offsets)
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def _build(self, df):
+        temp_dir = self.directory.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        chunk_rows = self.chunk_edges
+        id_map = _chunked_id_map(df, chunk_rows)
+        np.save(os.path.join(temp_dir, 'nodes.npy'), id_map.ids)
+        _build_csr(df, id_map, 'Follower', 'Target', temp_dir, 'forward', chunk_rows)
+        _build_csr(df, id_map, 'Target', 'Follower', temp_dir, 'reverse', chunk_rows)
+        if self.compressed:
+            # The plain neighbor lists are sorted first, then replaced
+            compress_neighbors(temp_dir, 'forward', chunk_rows)
+            compress_neighbors(temp_dir, 'reverse', chunk_rows)
+        with open(os.path.join(temp_dir, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump({'nodes': len(id_map), 'edges': len(df), 'compressed': self.compressed, 'block_edges': BLOCK_EDGES}, file)
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.replace(temp_dir, self.directory)
+
+    @property
+    def num_nodes(self):
+        return len(self.id_map)
+
+    @property
+    def num_edges(self):
+        return len(self.forward_neighbors)
+
+    def node(self, user):
+        return self.id_map.to_index(user)
+
+    def successors(self, node):
+        return np.asarray(self.forward_neighbors[self.forward_offsets[node]:self.forward_offsets[node + 1]])
+
+    def predecessors(self, node):
+        return np.asarray(self.reverse_neighbors[self.reverse_offsets[node]:self.reverse_offsets[node + 1]])
+
+    def out_degrees(self):
+        return np.diff(np.asarray(self.forward_offsets))
+
+    def in_degrees(self):
+        return np.diff(np.asarray(self.reverse_offsets))
+
+    def edge_blocks(self):
+        # Yield (src, dst, distinct) for consecutive blocks of forward edges.
+        # distinct is False for repeats of the previous (src, dst) pair, so
+        # repeated rows can be counted once, as the in-memory matrices do.
+        offsets = self.forward_offsets
+        previous = None
+        for start in range(0, self.num_edges, self.chunk_edges):
+            end = min(start + self.chunk_edges, self.num_edges)
+            first_row = int(np.searchsorted(offsets, start, side='right')) - 1
+            last_row = int(np.searchsorted(offsets, end, side='left'))
+            row_offsets = np.asarray(offsets[first_row:last_row + 1], dtype=np.int64)
+            counts = np.minimum(row_offsets[1:], end) - np.maximum(row_offsets[:-1], start)
+            src = np.repeat(np.arange(first_row, last_row, dtype=self.forward_neighbors.dtype), counts)
+            dst = np.asarray(self.forward_neighbors[start:end])
+            distinct = np.ones(len(src), dtype=bool)
+            distinct[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+            if previous is not None and len(src):
+                distinct[0] = (src[0], dst[0]) != previous
+            if len(src):
+                previous = (src[-1], dst[-1])
+            yield src, dst, distinct
+
+    def followers_of(self, target):
+        node = self.node(target)
+        followers = self.predecessors(node) if node >= 0 else np.empty(0, dtype=self.reverse_neighbors.dtype)
+        return pd.DataFrame({'Follower': self.id_map.to_ids(followers), 'Target': target})
+
+    def targets_of(self, follower):
+        node = self.node(follower)
+        targets = self.successors(node) if node >= 0 else np.empty(0, dtype=self.forward_neighbors.dtype)
+        return pd.DataFrame({'Follower': follower, 'Target': self.id_map.to_ids(targets)})
+
+    def in_degree(self, user):
+        node = self.node(user)
+        return int(self.reverse_offsets[node + 1] - self.reverse_offsets[node]) if node >= 0 else 0
+
+    def out_degree(self, user):
+        node = self.node(user)
+        return int(self.forward_offsets[node + 1] - self.forward_offsets[node]) if node >= 0 else 0
+
+
+def distinct_out_degrees(index):
+    # Out-degree counting each distinct edge once
+    degree = np.zeros(index.num_nodes, dtype=np.int64)
+    for src, dst, distinct in index.edge_blocks():
+        degree += np.bincount(src[distinct], minlength=index.num_nodes)
+    return degree
+
+
+def pagerank(index, alpha=0.85, tol=1e-06, max_iter=100, callback=None, start=None):
+    # Same iteration as graph_algorithms.pagerank, streaming the edges block by
+    # block instead of multiplying by an in-memory matrix
+    n = index.num_nodes
+
+    def spread(share):
+        total = np.zeros(n)
+        for src, dst, distinct in index.edge_blocks():
+            total += np.bincount(dst[distinct], weights=share[src[distinct]], minlength=n)
+        return total
+
+    return power_pagerank(n, distinct_out_degrees(index), spread, alpha, tol, max_iter, callback, start)
+
+
+def hits(index, tol=1e-08, max_iter=100, callback=None, start=None):
+    # Same iteration as graph_algorithms.hits, two passes over the edge blocks
+    # per step: a = A^T h, then h = A a
+    n = index.num_nodes
+
+    def authority(h):
+        a = np.zeros(n)
+        for src, dst, distinct in index.edge_blocks():
+            a += np.bincount(dst[distinct], weights=h[src[distinct]], minlength=n)
+        return a
+
+    def hub(a):
+        h = np.zeros(n)
+        for src, dst, distinct in index.edge_blocks():
+            h += np.bincount(src[distinct], weights=a[dst[distinct]], minlength=n)
+        return h
+
+    return power_hits(n, authority, hub, tol, max_iter, callback, start)
+
+
+def build_out_of_core_index(df, fingerprint=None, memory_limit=DEFAULT_MEMORY_LIMIT_MB * 1024 * 1024, directory=None,
+                            compressed=False):
+    return OutOfCoreIndex(df, fingerprint, memory_limit, directory, compressed)
@@ -0,0 +1,278 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from dataset_cache import CACHE_DIR
+from graph_algorithms import power_pagerank, power_hits, gather_neighbors
+from compressed_index import load_neighbors
+
+# Worker processes used for the row-block kernels, all cores by default
+WORKERS = int(os.environ.get('NETWORK_TOOL_WORKERS', os.cpu_count() or 1))
+
+# Below this many edges starting the workers costs more than it saves, and
+# the single-process sparse matrix code is used instead
+PARALLEL_MIN_EDGES = 2_000_000
+
+# Edges a worker gathers at once when the index has no chunk size of its own
+BLOCK_EDGES = 4_000_000
+
+ARRAY_NAMES = ['forward_offsets', 'forward_neighbors', 'reverse_offsets', 'reverse_neighbors']
+
+# RAM-backed directory for the score vectors exchanged with the workers
+VECTOR_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+_lock = threading.Lock()
+
+# Arrays of the graph this worker process is attached to
+_graph = {}
+
+
+def _save_arrays(index, directory):
+    # Write the CSR arrays of an in-memory index in the same layout as an
+    # out-of-core index, so either mode can reuse the other's files
+    parent = os.path.dirname(directory.rstrip(os.sep)) or '.'
+    os.makedirs(parent, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix='csr_', dir=parent)
+    np.save(os.path.join(temp_dir, 'nodes.npy'), np.asarray(index.id_map.ids))
+    for name in ARRAY_NAMES:
+        np.save(os.path.join(temp_dir, name + '.npy'), getattr(index, name))
+    with open(os.path.join(temp_dir, 'meta.json'), 'w', encoding='utf-8') as file:
+        json.dump({'nodes': index.num_nodes, 'edges': index.num_edges}, file)
+    try:
+        os.replace(temp_dir, directory)
+    except OSError:
+        # Another session wrote the same files first
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def share_index(index):
+    # Back the index arrays with files that worker processes can map. Pages
+    # are then shared through the OS page cache instead of copied per worker.
+    # A dataset loaded through the edge cache keeps its files in its cache
+    # entry, where out-of-core mode and later sessions reuse them. Any other
+    # index (a preview sample, an edge update, or one without a fingerprint)
+    # gets a temporary directory that is removed along with the index.
+    # Returns the directory holding the arrays.
+    directory = getattr(index, 'directory', None)
+    if directory is not None:
+        return directory
+    if index.fingerprint is not None and os.path.isdir(os.path.join(CACHE_DIR, index.fingerprint)):
+        directory = os.path.join(CACHE_DIR, index.fingerprint, 'csr')
+    else:
+        directory = tempfile.mkdtemp(prefix='edge_csr_')
+        os.rmdir(directory)
+        weakref.finalize(index, shutil.rmtree, directory, ignore_errors=True)
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        _save_arrays(index, directory)
+    for name in ARRAY_NAMES:
+        setattr(index, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode='r'))
+    index.directory = directory
+    return directory
+
+
+def row_blocks(offsets, parts):
+    # Split rows into at most parts consecutive blocks of roughly equal edges
+    edges = int(offsets[-1])
+    bounds = np.searchsorted(offsets, np.linspace(0, edges, parts + 1), side='left')
+    bounds[0], bounds[-1] = 0, len(offsets) - 1
+    bounds = np.unique(bounds)
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def _attach(directory):
+    # Worker initializer: map the shared arrays read-only. Compressed neighbor
+    # lists are decoded by each worker for its own row blocks.
+    _graph.clear()
+    for direction in ('forward', 'reverse'):
+        offsets = np.load(os.path.join(directory, direction + '_offsets.npy'), mmap_mode='r')
+        _graph[direction + '_offsets'] = offsets
+        _graph[direction + '_neighbors'] = load_neighbors(directory, direction, offsets)
+
+
+def _open_vector(path):
+    return np.load(path, mmap_mode='r+')
+
+
+def _sub_blocks(offsets, row_start, row_end, chunk_edges):
+    # Whole rows in pieces of about chunk_edges edges (at least one row)
+    row = row_start
+    while row < row_end:
+        end = int(np.searchsorted(offsets, offsets[row] + chunk_edges, side='right')) - 1
+        end = min(max(end, row + 1), row_end)
+        yield row, end
+        row = end
+
+
+def _row_sums(values, local_offsets):
+    # Sum of values over each row, rows given by offsets into values. A
+    # trailing zero keeps every start a valid reduceat position; reduceat
+    # returns the element at the start, not zero, for an empty row.
+    sums = np.add.reduceat(np.append(values, 0.0), local_offsets[:-1])
+    sums[np.diff(local_offsets) == 0] = 0
+    return sums
+
+
+def _spmv_block(direction, row_start, row_end, input_path, output_path, chunk_edges):
+    # y[row] = sum of x over the row's distinct neighbors, for one row block.
+    # Rows are disjoint between tasks, so every worker writes its own slice.
+    offsets = _graph[direction + '_offsets']
+    neighbors = _graph[direction + '_neighbors']
+    x = _open_vector(input_path)
+    y = _open_vector(output_path)
+    for start, end in _sub_blocks(offsets, row_start, row_end, chunk_edges):
+        row_offsets = np.asarray(offsets[start:end + 1], dtype=np.int64)
+        local_offsets = row_offsets - row_offsets[0]
+        block = np.asarray(neighbors[row_offsets[0]:row_offsets[-1]])
+        # Neighbor lists are sorted, so a repeated edge follows its first copy
+        repeated = np.zeros(len(block), dtype=bool)
+        repeated[1:] = block[1:] == block[:-1]
+        repeated[local_offsets[:-1][local_offsets[:-1] < len(block)]] = False
+        values = x[block]
+        values[repeated] = 0
+        y[start:end] = _row_sums(values, local_offsets)
+    y.flush()
+
+
+def _neighbors_block(direction, nodes, starts, output_path):
+    # Copy the neighbor lists of nodes from one row block to where they
+    # start in the shared output, so the worker reads one stretch of the
+    # shared arrays and nothing is sent back
+    offsets = _graph[direction + '_offsets']
+    sources = np.asarray(offsets[nodes], dtype=np.int64)
+    lengths = np.asarray(offsets[nodes + 1], dtype=np.int64) - sources
+    within = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    output = _open_vector(output_path)
+    output[within + np.repeat(starts, lengths)] = _graph[direction + '_neighbors'][within + np.repeat(sources, lengths)]
+    output.flush()
+
+
+class ParallelGraph:
+    # Worker pool attached to one dataset's index. The CSR arrays live in
+    # memory-mapped files that every worker maps once; score vectors are
+    # exchanged through files in shared memory. Each kernel splits the rows
+    # into one block per worker, balanced by edge count.
+
+    def __init__(self, index, workers=WORKERS):
+        self.directory = share_index(index)
+        self.n = index.num_nodes
+        self.workers = workers
+        chunk_edges = getattr(index, 'chunk_edges', None)
+        self.chunk_edges = max(1, chunk_edges // workers) if chunk_edges else BLOCK_EDGES
+        self.offsets = {'forward': index.forward_offsets, 'reverse': index.reverse_offsets}
+        self.blocks = {
+            'forward': row_blocks(np.asarray(index.forward_offsets), workers),
+            'reverse': row_blocks(np.asarray(index.reverse_offsets), workers),
+        }
+        # spawn, as forking a process that runs threads is not safe
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_attach, initargs=(self.directory,))
+        self.vector_dir = tempfile.mkdtemp(prefix='network_vectors_', dir=VECTOR_DIR)
+        self._finalizer = weakref.finalize(self, _shutdown, self.pool, self.vector_dir)
+
+    def close(self):
+        self._finalizer()
+
+    def _vectors(self):
+        # A fresh input/output pair per call, so concurrent jobs do not share
+        vectors = []
+        for _ in range(2):
+            handle, path = tempfile.mkstemp(suffix='.npy', dir=self.vector_dir)
+            os.close(handle)
+            vectors.append((np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(self.n,)), path))
+        return vectors
+
+    def operator(self, direction):
+        # Returns (apply, close): apply(x) gives y with y[row] summing x over
+        # the row's distinct neighbors. 'forward' is A @ x, 'reverse' A^T @ x.
+        (x, input_path), (y, output_path) = self._vectors()
+
+        def apply(values):
+            x[:] = values
+            x.flush()
+            futures = [self.pool.submit(_spmv_block, direction, start, end, input_path, output_path,
+                                        self.chunk_edges)
+                       for start, end in self.blocks[direction]]
+            for future in futures:
+                future.result()
+            return np.array(y)
+
+        def close():
+            for path in (input_path, output_path):
+                os.remove(path)
+
+        return apply, close
+
+    def distinct_degrees(self, direction):
+        # Degree of every node counting repeated edges once
+        apply, close = self.operator(direction)
+        try:
+            return apply(np.ones(self.n))
+        finally:
+            close()
+
+    def pagerank(self, alpha=0.85, tol=1e-06, max_iter=100, callback=None, start=None):
+        spread, close = self.operator('reverse')
+        try:
+            out_degree = self.distinct_degrees('forward')
+            return power_pagerank(self.n, out_degree, spread, alpha, tol, max_iter, callback, start)
+        finally:
+            close()
+
+    def hits(self, tol=1e-08, max_iter=100, callback=None, start=None):
+        authority, close_authority = self.operator('reverse')
+        hub, close_hub = self.operator('forward')
+        try:
+            return power_hits(self.n, authority, hub, tol, max_iter, callback, start)
+        finally:
+            close_authority()
+            close_hub()
+
+    def neighborhoods(self, nodes, direction='forward'):
+        # Neighbor lists of many nodes at once, as gather_neighbors returns
+        # them. The nodes are split at the row block bounds, so each worker
+        # gathers the lists in its own block, and writes them straight to
+        # their place in the order of nodes.
+        nodes = np.asarray(nodes, dtype=np.int64)
+        offsets = self.offsets[direction]
+        lengths = np.asarray(offsets[nodes + 1], dtype=np.int64) - np.asarray(offsets[nodes], dtype=np.int64)
+        owner = np.repeat(np.arange(len(nodes)), lengths)
+        if len(owner) == 0:
+            return owner, np.empty(0, dtype=np.int64)
+        starts = np.cumsum(lengths) - lengths
+        block = np.searchsorted([end for _, end in self.blocks[direction]], nodes, side='right')
+        parts = [np.flatnonzero(block == part) for part in range(len(self.blocks[direction]))]
+        handle, path = tempfile.mkstemp(suffix='.npy', dir=self.vector_dir)
+        os.close(handle)
+        try:
+            np.lib.format.open_memmap(path, mode='w+', dtype=np.int64, shape=(len(owner),)).flush()
+            futures = [self.pool.submit(_neighbors_block, direction, nodes[part], starts[part], path)
+                       for part in parts if len(part)]
+            for future in futures:
+                future.result()
+            return owner, np.load(path)
+        finally:
+            os.remove(path)
+
+
+def _shutdown(pool, vector_dir):
+    pool.shutdown(wait=False, cancel_futures=True)
+    shutil.rmtree(vector_dir, ignore_errors=True)
+
+
+def get_parallel_graph(index, workers=WORKERS, min_edges=PARALLEL_MIN_EDGES):
+    # Worker pool for the dataset, started on first use and kept for the
+    # dataset's lifetime. None when one process would do just as well, or
+    # for indices marked to run on one process (preview samples).
+    if workers < 2 or index.num_edges < min_edges or index.derived.get('single_process'):
+        return None
+    with _lock:
+        graph = index.derived.get('parallel_graph')
+        if graph is None or graph.workers != workers:
+            graph = ParallelGraph(index, workers)
+            index.derived['parallel_graph'] = graph
+        return graph
@@ -0,0 +1,86 @@
+import numpy as np
+from parallel_graph import BLOCK_EDGES
+from graph_algorithms import edges_exist
+
+
+def row_ranges(index, chunk_edges):
+    # Consecutive row ranges holding about chunk_edges edges in both the
+    # forward and the reverse adjacency (at least one row each)
+    forward, reverse = index.forward_offsets, index.reverse_offsets
+    n = index.num_nodes
+    row = 0
+    while row < n:
+        end = min(int(np.searchsorted(forward, forward[row] + chunk_edges, side='right')),
+                  int(np.searchsorted(reverse, reverse[row] + chunk_edges, side='right'))) - 1
+        end = min(max(end, row + 1), n)
+        yield row, end
+        row = end
+
+
+def _upper_keys(offsets, neighbors, start, end, n):
+    # Packed (row, neighbor) keys of the distinct edges of rows start..end
+    # whose neighbor is the larger endpoint, i.e. (min, max) keys. CSR rows
+    # are in order and each neighbor list is sorted, so the keys come out
+    # sorted. Also returns the number of distinct edges in the rows.
+    row_offsets = np.asarray(offsets[start:end + 1], dtype=np.int64)
+    rows = np.repeat(np.arange(start, end, dtype=np.int64), np.diff(row_offsets))
+    columns = np.asarray(neighbors[row_offsets[0]:row_offsets[-1]], dtype=np.int64)
+    distinct = np.ones(len(rows), dtype=bool)
+    distinct[1:] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+    upper = distinct & (columns > rows)
+    return rows[upper] * n + columns[upper], int(distinct.sum())
+
+
+def mutual_pairs(index, chunk_edges=None):
+    # Yield (low, high, distinct_edges) for blocks of rows: every reciprocal
+    # pair low < high with edges both ways, found by joining the (min, max)
+    # keys of forward edges (low follows high) with those of reverse edges
+    # (high follows low). Self-loops are never mutual.
+    if chunk_edges is None:
+        chunk_edges = getattr(index, 'chunk_edges', BLOCK_EDGES)
+    n = max(index.num_nodes, 1)
+    for start, end in row_ranges(index, chunk_edges):
+        follows, distinct_edges = _upper_keys(index.forward_offsets, index.forward_neighbors, start, end, n)
+        followed_by, _ = _upper_keys(index.reverse_offsets, index.reverse_neighbors, start, end, n)
+        positions = np.minimum(np.searchsorted(followed_by, follows), max(len(followed_by) - 1, 0))
+        found = follows[followed_by[positions] == follows] if len(followed_by) else follows[:0]
+        yield found // n, found % n, distinct_edges
+
+
+def reciprocity_summary(index, callback=None):
+    # Mutual friend count of every user, plus the number of mutual pairs and
+    # the overall reciprocity: the share of distinct edges whose reverse edge
+    # also exists, as nx.overall_reciprocity computes it. callback() is
+    # called after every block of rows.
+    mutual_counts = np.zeros(index.num_nodes, dtype=np.int64)
+    pairs = 0
+    edges = 0
+    for low, high, distinct_edges in mutual_pairs(index):
+        mutual_counts += np.bincount(low, minlength=index.num_nodes)
+        mutual_counts += np.bincount(high, minlength=index.num_nodes)
+        pairs += len(low)
+        edges += distinct_edges
+        if callback is not None:
+            callback()
+    info = {'mutual_pairs': pairs, 'edges': edges, 'reciprocity': 2 * pairs / edges if edges else 0.0}
+    return mutual_counts, info
+
+
+def mutual_friends(index, user):
+    # User IDs the user follows that also follow the user back
+    node = index.node(user)
+    if node < 0:
+        return index.id_map.ids[:0]
+    friends = np.intersect1d(index.successors(node), index.predecessors(node))
+    return index.id_map.to_ids(friends[friends != node])
+
+
+def mark_mutual_edges(index, edges):
+    # Copy of a Follower/Target edge frame with a Mutual column, True where
+    # the target also follows the follower
+    followers = index.node(edges['Follower'].to_numpy())
+    targets = index.node(edges['Target'].to_numpy())
+    known = (followers >= 0) & (targets >= 0)
+    mutual = np.zeros(len(edges), dtype=bool)
+    mutual[known] = edges_exist(index.forward_offsets, index.forward_neighbors, targets[known], followers[known])
+    return edges.assign(Mutual=mutual)
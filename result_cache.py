@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import numpy as np
+from instrumentation import stage
+
+RESULT_CACHE_DIR = '.result_cache'
+
+
+def result_key(name, params):
+    # Stable file-friendly key for a metric and its parameters
+    encoded = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    return f"{name}-{hashlib.blake2b(encoded, digest_size=8).hexdigest()}"
+
+
+def load_result(fingerprint, key):
+    path = os.path.join(RESULT_CACHE_DIR, fingerprint, key)
+    try:
+        with np.load(path + '.npz') as stored:
+            arrays = {name: stored[name] for name in stored.files}
+        with open(path + '.json', 'r', encoding='utf-8') as file:
+            info = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return arrays, info
+
+
+def save_result(fingerprint, key, arrays, info):
+    directory = os.path.join(RESULT_CACHE_DIR, fingerprint)
+    path = os.path.join(directory, key)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Write the info last, so a partly written result is never loaded
+        with open(path + '.npz.tmp', 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(path + '.npz.tmp', path + '.npz')
+        with open(path + '.json.tmp', 'w', encoding='utf-8') as file:
+            json.dump(info, file)
+        os.replace(path + '.json.tmp', path + '.json')
+    except OSError:
+        pass
+
+
+def find_result(index, name, params):
+    # The stored (arrays, info) result for this dataset and parameters, or
+    # None when it has not been computed yet
+    memory = index.derived.setdefault('results', {}) if index is not None else {}
+    fingerprint = getattr(index, 'fingerprint', None)
+    key = result_key(name, params)
+    if key in memory:
+        return memory[key]
+    result = load_result(fingerprint, key) if fingerprint else None
+    if result is not None:
+        memory[key] = result
+    return result
+
+
+def cached_result(index, name, params, compute):
+    # Return the (arrays, info) result of compute() for this dataset and
+    # parameters. Results are kept in memory with the dataset's index and on
+    # disk under the dataset fingerprint, so they survive server restarts.
+    with stage(f"Look up {name} result"):
+        result = find_result(index, name, params)
+    if result is None:
+        with stage(f"Compute {name}"):
+            result = compute()
+        fingerprint = getattr(index, 'fingerprint', None)
+        if fingerprint:
+            save_result(fingerprint, result_key(name, params), *result)
+        if index is not None:
+            index.derived.setdefault('results', {})[result_key(name, params)] = result
+    return result
@@ -1,89 +1,26 @@
-import networkx as nx
 import streamlit as st
-from pyvis.network import Network
 import streamlit.components.v1 as components
-import tempfile
-import os
-import shutil
-
-def get_targets_user_follows(follower, df):
-    df_targets_user_follows = df[df.Follower == follower]
-    return df_targets_user_follows
+from graph_rendering import render_network_html, sample_neighbors, DEFAULT_NODE_CAP, SAMPLING_METHODS
+from adjacency_index import build_adjacency_index
+from instrumentation import stage
+
+def get_targets_user_follows(follower, df, index=None):
+    # Answer from the adjacency index when one was built for this dataset
+    with stage("Find targets"):
+        if index is not None:
+            return index.targets_of(follower)
+        df_targets_user_follows = df[df.Follower == follower]
+        return df_targets_user_follows
 
 def visualize_targets_user_follows(target, df):
-    G = nx.from_pandas_edgelist(df, 'Follower', 'Target', create_using=nx.DiGraph())
-    
-    pos = nx.circular_layout(G)
-    
-    # Create a Pyvis network
-    net = Network(notebook=False, width="100%", height="900px", directed=True)
-    net.toggle_hide_edges_on_drag(False)
-    net.toggle_physics(True)
+    # Render the edges to an HTML string in memory
+    return render_network_html(target, df)
 
-    for node in G.nodes:
-        size = 35 if node == target else 25  # Increase the size for better visibility
-        color = '#FF9999' if node == target else '#4169E1'  # Light blue color for regular nodes
-        border_color = '#00008B'  # Dark blue border for contrast
-        title = f"ID: {node}"  # The title will be shown on hover
-        net.add_node(node, label=str(node), x = pos[node][0]*1000, y=pos[node][1]*1000,size=size, color=color, title=title, borderWidth=2, borderColor=border_color, font={'size': 14, 'color': '#000000'})
-
-    for edge in G.edges:
-        net.add_edge(edge[0], edge[1], width=0.5)  # Keep edges thin
-
-    # Use hierarchical layout to potentially improve the clarity
-    net.set_options("""
-    {
-      "physics": {
-        "hierarchicalRepulsion": {
-          "centralGravity": 0.0,
-          "springLength": 100,
-          "springConstant": 0.01,
-          "nodeDistance": 120,
-          "damping": 0.09
-        },
-        "minVelocity": 0.75,
-        "solver": "hierarchicalRepulsion"
-      },
-      "nodes": {
-        "scaling": {
-          "label": {
-            "enabled": true
-          }
-        }
-      },
-      "edges": {
-        "color": {
-          "inherit": true
-        },
-        "smooth": false
-      },
-      "layout": {
-        "hierarchical": {
-          "enabled": false,
-          "levelSeparation": 150,
-          "nodeSpacing": 100,
-          "treeSpacing": 200,
-          "blockShifting": true,
-          "edgeMinimization": true,
-          "parentCentralization": true,
-          "direction": "DU", 
-          "sortMethod": "directed" 
-        }
-      }
-    }
-    """)
-
-    # Create a temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.html')
-    
-    # Generate the network in the temporary file
-    net.save_graph(temp_file.name)
-
-    return temp_file.name
-
-def run(df):
+def run(df, index=None):
 
     data = df
+    if index is None:
+        index = build_adjacency_index(data)
 
     st.subheader("Visualize Who a Target User Follows")
     
@@ -105,20 +42,18 @@ def run(df):
 
     # Display the head the data so user can pick a target
     st.dataframe(data[0:1000], height=150)
+
+    # Large neighborhoods are drawn as a sample of at most node_cap users
+    node_cap = st.number_input('Maximum Users to Draw', 10, 100000, DEFAULT_NODE_CAP, 50)
+    sampling = st.radio('Sampling for Large Neighborhoods', SAMPLING_METHODS, horizontal=True)
     
     if st.button('Visualize') and valid_input is True:
         with st.spinner('Generating Visualization...'):
-            df_filtered = get_targets_user_follows(user_id, data)
-            temp_file_path = visualize_targets_user_follows(user_id, df_filtered)
-            
-            # Read from the temporary file
-            with open(temp_file_path, 'r', encoding='utf-8') as file:
-                source_code = file.read()
-                components.html(source_code, width=700, height=800)
-
-            # Clean up: delete the temporary file
-            os.remove(temp_file_path)
-            shutil.rmtree('lib')
+            df_filtered = get_targets_user_follows(user_id, data, index)
+            df_shown, total = sample_neighbors(df_filtered, 'Target', int(node_cap), sampling, index)
+            st.markdown(f"**{len(df_shown)} of {total} targets shown**")
+            source_code = visualize_targets_user_follows(user_id, df_shown)
+            components.html(source_code, width=700, height=800)
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
@@ -0,0 +1,259 @@
+import os
+import time
+import numpy as np
+from graph_algorithms import edges_exist
+from parallel_graph import BLOCK_EDGES
+from reciprocity import row_ranges
+
+METHODS = ["Auto", "Exact", "Sampling"]
+
+# Auto mode counts exactly up to this many undirected edges, and samples above
+EXACT_MAX_EDGES = 2_000_000
+
+DEFAULT_SAMPLES = 1_000_000
+DEFAULT_TIME_BUDGET = 10.0
+
+# Wedges checked per vectorized step
+BATCH = 100_000
+
+# Normal quantile of the 95% confidence intervals
+Z = 1.96
+
+
+def _undirected_block(index, start, end):
+    # Distinct neighbors of rows start..end ignoring direction and self-loops,
+    # as sorted (row, neighbor) pairs
+    rows, columns = [], []
+    for offsets, neighbors in ((index.forward_offsets, index.forward_neighbors),
+                               (index.reverse_offsets, index.reverse_neighbors)):
+        row_offsets = np.asarray(offsets[start:end + 1], dtype=np.int64)
+        rows.append(np.repeat(np.arange(start, end, dtype=np.int64), np.diff(row_offsets)))
+        columns.append(np.asarray(neighbors[row_offsets[0]:row_offsets[-1]], dtype=np.int64))
+    n = max(index.num_nodes, 1)
+    # Both halves are sorted already, so the stable sort only merges two runs
+    keys = np.sort(np.concatenate([rows[0] * n + columns[0], rows[1] * n + columns[1]]), kind='stable')
+    keys = keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys
+    rows, columns = keys // n, keys % n
+    keep = rows != columns
+    return rows[keep], columns[keep]
+
+
+def undirected_adjacency(index, callback=None):
+    # CSR of the undirected simple graph (the graph nx.Graph(G) would give),
+    # built a block of rows at a time and kept with the dataset. Out-of-core
+    # indices write it next to their other files. callback() is called after
+    # every block of rows.
+    if 'undirected' in index.derived:
+        return index.derived['undirected']
+    n = index.num_nodes
+    chunk_edges = getattr(index, 'chunk_edges', BLOCK_EDGES)
+    on_disk = getattr(index, 'out_of_core', False)
+    if on_disk:
+        offsets_path = os.path.join(index.directory, 'undirected_offsets.npy')
+        neighbors_path = os.path.join(index.directory, 'undirected_neighbors.npy')
+
+    if not on_disk or not os.path.exists(neighbors_path):
+        # First pass counts each row's neighbors, the second writes them
+        degree = np.zeros(n, dtype=np.int64)
+        for start, end in row_ranges(index, chunk_edges):
+            rows, _ = _undirected_block(index, start, end)
+            degree[start:end] = np.bincount(rows - start, minlength=end - start)
+            if callback is not None:
+                callback()
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(degree, out=offsets[1:])
+        dtype = index.forward_neighbors.dtype
+        if on_disk:
+            neighbors = np.lib.format.open_memmap(neighbors_path + '.tmp', mode='w+', dtype=dtype, shape=(int(offsets[-1]),))
+        else:
+            neighbors = np.empty(int(offsets[-1]), dtype=dtype)
+        for start, end in row_ranges(index, chunk_edges):
+            _, columns = _undirected_block(index, start, end)
+            neighbors[offsets[start]:offsets[end]] = columns
+            if callback is not None:
+                callback()
+        if on_disk:
+            # Write the neighbors last, so a partly written pair is never loaded
+            neighbors.flush()
+            del neighbors
+            np.save(offsets_path, offsets)
+            os.replace(neighbors_path + '.tmp', neighbors_path)
+
+    if on_disk:
+        offsets = np.load(offsets_path, mmap_mode='r')
+        neighbors = np.load(neighbors_path, mmap_mode='r')
+    index.derived['undirected'] = (offsets, neighbors)
+    return offsets, neighbors
+
+
+def _pair(position, k):
+    # The position-th pair (i, j), i < j, of k items in row-major order
+    position = position.astype(np.float64)
+    k = k.astype(np.float64)
+    first = np.floor(((2 * k - 1) - np.sqrt(np.maximum((2 * k - 1) ** 2 - 8 * position, 0))) / 2)
+    before = lambda i: i * (2 * k - i - 1) / 2
+    # Correct floating point error at the boundaries
+    first = np.where(before(first + 1) <= position, first + 1, first)
+    first = np.where(before(first) > position, first - 1, first)
+    second = position - before(first) + first + 1
+    return first.astype(np.int64), second.astype(np.int64)
+
+
+def exact_triangles(index, callback=None):
+    # Count every triangle once from its lowest-ranked corner: edges point
+    # from the lower (degree, node) rank to the higher, and each pair of
+    # out-neighbors of a node closes a triangle when the two are adjacent.
+    # Pairs are enumerated and checked in vectorized batches; callback() is
+    # called after every batch.
+    offsets, neighbors = undirected_adjacency(index, callback)
+    n = index.num_nodes
+    degree = np.diff(np.asarray(offsets))
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.lexsort((np.arange(n), degree))] = np.arange(n)
+
+    triangles = np.zeros(n, dtype=np.int64)
+    for start, end in _undirected_ranges(offsets, BLOCK_EDGES):
+        row_offsets = np.asarray(offsets[start:end + 1], dtype=np.int64)
+        rows = np.repeat(np.arange(start, end, dtype=np.int64), np.diff(row_offsets))
+        columns = np.asarray(neighbors[row_offsets[0]:row_offsets[-1]], dtype=np.int64)
+        higher = rank[columns] > rank[rows]
+        rows, columns = rows[higher], columns[higher]
+        # Oriented out-neighbor lists of this block, still sorted by node
+        out_degree = np.bincount(rows - start, minlength=end - start)
+        out_offsets = np.r_[0, np.cumsum(out_degree)]
+        pairs = out_degree * (out_degree - 1) // 2
+        pair_offsets = np.r_[0, np.cumsum(pairs)]
+        for first_pair in range(0, int(pair_offsets[-1]), BATCH * 10):
+            position = np.arange(first_pair, min(first_pair + BATCH * 10, int(pair_offsets[-1])))
+            owner = np.searchsorted(pair_offsets, position, side='right') - 1
+            i, j = _pair(position - pair_offsets[owner], out_degree[owner])
+            v = columns[out_offsets[owner] + i]
+            w = columns[out_offsets[owner] + j]
+            closed = edges_exist(offsets, neighbors, v, w)
+            for corner in (owner[closed] + start, v[closed], w[closed]):
+                triangles += np.bincount(corner, minlength=n)
+            if callback is not None:
+                callback()
+    return triangles, degree
+
+
+def _undirected_ranges(offsets, chunk_edges):
+    n = len(offsets) - 1
+    row = 0
+    while row < n:
+        end = int(np.searchsorted(offsets, offsets[row] + chunk_edges, side='right')) - 1
+        end = min(max(end, row + 1), n)
+        yield row, end
+        row = end
+
+
+def _interval(closed, trials):
+    # Estimate and Wilson 95% interval of a proportion, which stays sensible
+    # for the very small closure rates of sparse graphs
+    if not trials:
+        return 0.0, 0.0, 0.0
+    p = closed / trials
+    center = (p + Z ** 2 / (2 * trials)) / (1 + Z ** 2 / trials)
+    half = Z * np.sqrt(p * (1 - p) / trials + Z ** 2 / (4 * trials ** 2)) / (1 + Z ** 2 / trials)
+    return p, max(center - half, 0.0), min(center + half, 1.0)
+
+
+def _sample_wedges(offsets, neighbors, centers, center_degree, rng):
+    # Whether a uniformly chosen pair of neighbors of each center is adjacent
+    first = rng.integers(0, center_degree, size=len(centers))
+    second = rng.integers(0, center_degree - 1, size=len(centers))
+    second += second >= first
+    starts = np.asarray(offsets[centers], dtype=np.int64)
+    v = np.asarray(neighbors[starts + first])
+    w = np.asarray(neighbors[starts + second])
+    return edges_exist(offsets, neighbors, v, w)
+
+
+def sampled_triangles(index, samples=DEFAULT_SAMPLES, time_budget=DEFAULT_TIME_BUDGET, seed=0, callback=None):
+    # Wedge sampling. Transitivity is the share of closed wedges among wedges
+    # drawn uniformly (center chosen by its wedge count); average clustering
+    # is the share of closed wedges when the center is a uniformly chosen
+    # node, counting nodes with fewer than two neighbors as open. Sampling
+    # stops after samples wedges of each kind or time_budget seconds.
+    # callback() is called after every batch.
+    offsets, neighbors = undirected_adjacency(index, callback)
+    degree = np.diff(np.asarray(offsets))
+    wedges = degree * (degree - 1) / 2
+    total_wedges = wedges.sum()
+    cumulative = np.cumsum(wedges)
+    rng = np.random.default_rng(seed)
+    started = time.monotonic()
+
+    drawn = closed_global = closed_local = 0
+    while drawn < samples and (drawn == 0 or time.monotonic() - started < time_budget):
+        size = min(BATCH, samples - drawn)
+        if total_wedges > 0:
+            centers = np.searchsorted(cumulative, rng.random(size) * total_wedges, side='right')
+            centers = np.minimum(centers, len(degree) - 1)
+            closed_global += int(_sample_wedges(offsets, neighbors, centers, degree[centers], rng).sum())
+            nodes = rng.integers(0, len(degree), size)
+            nodes = nodes[degree[nodes] >= 2]
+            closed_local += int(_sample_wedges(offsets, neighbors, nodes, degree[nodes], rng).sum())
+        drawn += size
+        if callback is not None:
+            callback()
+
+    transitivity = _interval(closed_global, drawn)
+    clustering = _interval(closed_local, drawn)
+    info = {'samples': drawn, 'seconds': time.monotonic() - started, 'exact': False}
+    return {
+        'triangles': [float(value * total_wedges / 3) for value in transitivity],
+        'transitivity': [float(value) for value in transitivity],
+        'average_clustering': [float(value) for value in clustering],
+    }, info
+
+
+def global_triangles(index, method="Auto", samples=DEFAULT_SAMPLES, time_budget=DEFAULT_TIME_BUDGET, seed=0, callback=None):
+    # Triangle count, transitivity and average clustering of the undirected
+    # graph, as nx.triangles, nx.transitivity and nx.average_clustering give
+    # them. Each value is [estimate, low, high]; exact counts have no spread.
+    # Also returns the per-node triangle counts when counted exactly.
+    offsets, _ = undirected_adjacency(index, callback)
+    if method == "Sampling" or (method == "Auto" and offsets[-1] // 2 > EXACT_MAX_EDGES):
+        summary, info = sampled_triangles(index, samples, time_budget, seed, callback)
+        return summary, None, info
+
+    started = time.monotonic()
+    triangles, degree = exact_triangles(index, callback)
+    wedges = degree * (degree - 1) / 2
+    total = float(triangles.sum() / 3)
+    transitivity = float(3 * total / wedges.sum()) if wedges.sum() else 0.0
+    local = np.divide(triangles, wedges, out=np.zeros(len(degree)), where=wedges > 0)
+    clustering = float(local.mean()) if len(local) else 0.0
+    summary = {'triangles': [total] * 3, 'transitivity': [transitivity] * 3, 'average_clustering': [clustering] * 3}
+    return summary, triangles, {'samples': 0, 'seconds': time.monotonic() - started, 'exact': True}
+
+
+def user_triangles(index, user, samples=DEFAULT_SAMPLES, seed=0):
+    # Triangles through one user and the user's clustering coefficient, each
+    # [estimate, low, high]. Neighbor pairs are all checked when there are at
+    # most samples of them, otherwise samples pairs are drawn at random.
+    offsets, neighbors = undirected_adjacency(index)
+    node = index.node(user)
+    if node < 0:
+        return None
+    degree = int(offsets[node + 1] - offsets[node])
+    pairs = degree * (degree - 1) // 2
+    if pairs == 0:
+        return {'degree': degree, 'triangles': [0.0] * 3, 'clustering': [0.0] * 3, 'exact': True}
+
+    friends = np.asarray(neighbors[offsets[node]:offsets[node + 1]])
+    closed = 0
+    rng = np.random.default_rng(seed)
+    if pairs <= samples:
+        for first_pair in range(0, pairs, BATCH * 10):
+            position = np.arange(first_pair, min(first_pair + BATCH * 10, pairs))
+            i, j = _pair(position, np.full(len(position), degree))
+            closed += int(edges_exist(offsets, neighbors, friends[i], friends[j]).sum())
+        return {'degree': degree, 'triangles': [float(closed)] * 3, 'clustering': [closed / pairs] * 3, 'exact': True}
+
+    for first_pair in range(0, samples, BATCH):
+        centers = np.full(min(BATCH, samples - first_pair), node)
+        closed += int(_sample_wedges(offsets, neighbors, centers, degree, rng).sum())
+    clustering = [float(value) for value in _interval(closed, samples)]
+    return {'degree': degree, 'triangles': [value * pairs for value in clustering], 'clustering': clustering, 'exact': False}
@@ -0,0 +1,280 @@
+import hashlib
+import re
+import time
+import numpy as np
+import pandas as pd
+import streamlit as st
+from graph_algorithms import distinct_row_lengths, gather_neighbors, top_k
+from adjacency_index import build_adjacency_index
+from parallel_graph import BLOCK_EDGES
+from instrumentation import stage
+from job_scheduler import get_scheduler
+from result_cache import cached_result, result_key
+
+# Where candidates come from: the accounts followed by the accounts the user
+# follows, or the accounts followed by the user's own followers. The users in
+# between are the ones a candidate shares with the user.
+BASES = {'targets': "Followed by accounts the user follows", 'followers': "Followed by the user's followers"}
+
+SIMILARITIES = {'jaccard': "Jaccard", 'adamic_adar': "Adamic-Adar"}
+
+# Users in between who follow more accounts than this are skipped. They
+# would add most of the work and say little about any one candidate.
+DEFAULT_HUB_LIMIT = 5000
+
+DEFAULT_TOP_K = 10
+
+BATCH_SOURCES = ["Most Active Followers", "Listed User IDs"]
+
+# Seconds between checks on a running batch
+POLL_SECONDS = 1.0
+
+COLUMNS = ['User ID', 'Rank', 'Recommended', 'Shared', 'Jaccard', 'Adamic-Adar']
+
+
+def distinct_followers(index):
+    # Follower count of every user counting repeated follows once, cached
+    # with the dataset
+    def compute():
+        chunk_edges = getattr(index, 'chunk_edges', None) or BLOCK_EDGES
+        return {'followers': distinct_row_lengths(index.reverse_offsets, index.reverse_neighbors, chunk_edges)}, {}
+
+    arrays, info = cached_result(index, 'distinct_followers', {}, compute)
+    return arrays['followers']
+
+
+def candidate_scores(index, node, basis='targets', hub_limit=DEFAULT_HUB_LIMIT):
+    # Every account two steps from the node that it does not follow yet, with
+    # the number of users in between it shares with the node, its Jaccard
+    # similarity (shared over the union of the node's users in between and
+    # the candidate's distinct followers) and its Adamic-Adar score (each
+    # shared user weighted by 1 / log of their degree). Skipped hubs are left
+    # out of the node's users in between, as they are never counted as
+    # shared. The neighbor lists of the users in between are gathered and
+    # intersected in one step.
+    own = index.successors(node) if basis == 'targets' else index.predecessors(node)
+    own = np.unique(np.asarray(own, dtype=np.int64))
+    own = own[own != node]
+    out_degree = np.asarray(index.forward_offsets[own + 1], dtype=np.int64) - np.asarray(index.forward_offsets[own], dtype=np.int64)
+    in_degree = np.asarray(index.reverse_offsets[own + 1], dtype=np.int64) - np.asarray(index.reverse_offsets[own], dtype=np.int64)
+    expanded = out_degree <= hub_limit
+    owner, candidates = gather_neighbors(index.forward_offsets, index.forward_neighbors, own[expanded])
+
+    # Neighbor lists are sorted, so a repeated edge follows its first copy
+    keep = candidates != node
+    keep[1:] &= (candidates[1:] != candidates[:-1]) | (owner[1:] != owner[:-1])
+    owner, candidates = owner[keep], candidates[keep]
+
+    nodes, inverse, shared = np.unique(candidates, return_inverse=True, return_counts=True)
+    # A user in between follows or is followed by both ends, so their degree is at least two
+    weights = 1.0 / np.log(np.maximum(out_degree[expanded] + in_degree[expanded], 2))
+    adamic_adar = np.bincount(inverse, weights=weights[owner], minlength=len(nodes))
+    followers = distinct_followers(index)[nodes]
+    jaccard = shared / np.maximum(int(expanded.sum()) + followers - shared, 1)
+
+    new = ~np.isin(nodes, np.asarray(index.successors(node)))
+    info = {'between': len(own), 'skipped_hubs': int((~expanded).sum()), 'edges_read': len(keep), 'candidates': int(new.sum())}
+    return nodes[new], shared[new], jaccard[new], adamic_adar[new], info
+
+
+def top_candidates(index, node, k=DEFAULT_TOP_K, similarity='jaccard', basis='targets', hub_limit=DEFAULT_HUB_LIMIT):
+    # The k best candidates for the node as a DataFrame, best first
+    nodes, shared, jaccard, adamic_adar, info = candidate_scores(index, node, basis, hub_limit)
+    top = top_k(jaccard if similarity == 'jaccard' else adamic_adar, k)
+    users = index.id_map.to_ids(nodes[top])
+    return pd.DataFrame({'Recommended': users, 'Shared': shared[top], 'Jaccard': jaccard[top],
+                         'Adamic-Adar': adamic_adar[top]}), info
+
+
+def recommend_many(index, users, k=DEFAULT_TOP_K, similarity='jaccard', basis='targets', hub_limit=DEFAULT_HUB_LIMIT,
+                   callback=None):
+    # Top k candidates of every user in users, one row per user and candidate.
+    # Users missing from the network are left out. callback(done) is called
+    # after each user.
+    tables = []
+    for done, user in enumerate(np.asarray(users, dtype=np.int64).tolist(), 1):
+        node = index.node(user)
+        if node >= 0:
+            table, _ = top_candidates(index, node, k, similarity, basis, hub_limit)
+            table.insert(0, 'Rank', np.arange(1, len(table) + 1))
+            table.insert(0, 'User ID', user)
+            tables.append(table)
+        if callback is not None:
+            callback(done)
+    if not tables:
+        return pd.DataFrame({column: [] for column in COLUMNS})
+    return pd.concat(tables, ignore_index=True)
+
+
+def _settings_key(similarity, basis, hub_limit):
+    return similarity, basis, int(hub_limit)
+
+
+def _batch_params(users, k, similarity, basis, hub_limit):
+    # Result cache parameters of a batch; the users enter as a digest
+    users = np.asarray(users, dtype=np.int64)
+    return {'k': k, 'similarity': similarity, 'basis': basis, 'hub_limit': int(hub_limit),
+            'users': hashlib.blake2b(users.tobytes(), digest_size=16).hexdigest()}
+
+
+def precompute(index, users, k=DEFAULT_TOP_K, similarity='jaccard', basis='targets', hub_limit=DEFAULT_HUB_LIMIT,
+               callback=None):
+    # Top k candidates of many users, kept in the result cache and with the
+    # dataset so that lookups of these users with the same settings are
+    # answered from the table
+    users = np.asarray(users, dtype=np.int64)
+    params = _batch_params(users, k, similarity, basis, hub_limit)
+
+    def compute():
+        table = recommend_many(index, users, k, similarity, basis, hub_limit, callback)
+        return {column: table[column].to_numpy() for column in COLUMNS}, {'users': len(users), 'rows': len(table)}
+
+    arrays, info = cached_result(index, 'recommendations', params, compute)
+    table = pd.DataFrame({column: arrays[column] for column in COLUMNS})
+    index.derived.setdefault('recommendations', {})[_settings_key(similarity, basis, hub_limit)] = (k, table)
+    return table
+
+
+def recommend(user, index, k=DEFAULT_TOP_K, similarity='jaccard', basis='targets', hub_limit=DEFAULT_HUB_LIMIT):
+    # Top k accounts for the user to follow and what finding them read, from
+    # a precomputed table when one covers the user, else scored on the spot.
+    # The info is None when the user is not in the network.
+    node = index.node(user)
+    if node < 0:
+        return pd.DataFrame({column: [] for column in COLUMNS[2:]}), None
+    precomputed = index.derived.get('recommendations', {}).get(_settings_key(similarity, basis, hub_limit))
+    if precomputed is not None and k <= precomputed[0]:
+        rows = precomputed[1][precomputed[1]['User ID'] == user]
+        if len(rows):
+            return rows[COLUMNS[2:]].head(k).reset_index(drop=True), {'precomputed': True}
+    with stage("Score follow candidates"):
+        return top_candidates(index, node, k, similarity, basis, hub_limit)
+
+
+def parse_user_ids(text):
+    # Integer user IDs in text separated by commas, spaces or new lines
+    return np.array([int(value) for value in re.findall(r'\d+', text)], dtype=np.int64)
+
+
+def most_active_followers(index, count):
+    # IDs of the count users following the most accounts
+    return index.id_map.to_ids(top_k(np.asarray(index.out_degrees()), count))
+
+
+def batch_job(index, users, k, similarity, basis, hub_limit):
+    # Background job key and function for a batch of users
+    params = _batch_params(users, k, similarity, basis, hub_limit)
+    key = f"{getattr(index, 'fingerprint', None) or id(index)}-{result_key('recommendations', params)}"
+
+    def function(job):
+        def report(done):
+            job.progress = {'done': done, 'total': len(users)}
+            job.report()
+        with stage("Background job: recommendations"):
+            return precompute(index, users, k, similarity, basis, hub_limit, report)
+    return key, function
+
+
+def start_batch(index, users, k, similarity, basis, hub_limit):
+    key, function = batch_job(index, users, k, similarity, basis, hub_limit)
+    get_scheduler().forget_failed(key)
+    get_scheduler().submit(key, "Precomputing recommendations...", function)
+    st.session_state['recommendation_batch'] = key
+
+
+def cancel_batch(key):
+    get_scheduler().cancel(key)
+    st.session_state.pop('recommendation_batch', None)
+
+
+def show_batch(index, k, similarity, basis, hub_limit):
+    # Settings and state of the batch run. Returns the job while it runs.
+    source = st.radio("Users", BATCH_SOURCES, horizontal=True)
+    if source == BATCH_SOURCES[0]:
+        count = int(st.number_input("Number of Users", 1, 1_000_000, 1000, 100))
+        users = most_active_followers(index, count)
+    else:
+        users = parse_user_ids(st.text_area("User IDs (separated by commas, spaces or new lines)", key='batch_user_ids'))
+    st.button("Precompute Recommendations", on_click=start_batch, args=(index, users, k, similarity, basis, hub_limit),
+              disabled=len(users) == 0)
+
+    key = st.session_state.get('recommendation_batch')
+    job = get_scheduler().get(key) if key is not None else None
+    if job is None:
+        return None
+    if not job.done():
+        progress = job.progress
+        if progress:
+            st.info(f"{job.description} {progress['done']:,} of {progress['total']:,} users ({job.elapsed():.0f}s)")
+        else:
+            st.info(f"{job.description} ({job.elapsed():.0f}s)")
+        st.button("Cancel", key='cancel_recommendation_batch', on_click=cancel_batch, args=(key,))
+        return job
+    if job.future.exception() is not None:
+        st.error(f"Precomputing recommendations failed: {job.future.exception()}")
+        return None
+    table = job.result()
+    st.markdown(f"**{len(table):,} recommendations for {table['User ID'].nunique():,} users**")
+    st.dataframe(table.head(1000), height=250)
+    st.download_button("Download Recommendations", table.to_csv(index=False), file_name="recommendations.csv", mime="text/csv")
+    return None
+
+
+def run(df, index=None):
+
+    data = df
+    if index is None:
+        index = build_adjacency_index(data)
+
+    st.subheader("Who to Follow")
+
+    user_input = st.text_area('Enter User ID')
+
+    # Clean user_input
+    user_input = user_input.strip().replace(',', '')
+
+    # Check if user_input is valid
+    valid_input = False
+    try:
+        user_id = int(user_input)
+        if 1 <= user_id <= 11316811:
+            valid_input = True
+        else:
+            st.error("User ID must be between 1 and 11316811.")
+    except ValueError:
+        st.error("Please enter a valid integer as User ID. Choose an ID from the data below.")
+
+    # Display the head the data so user can pick a user
+    st.dataframe(data[0:1000], height=150)
+
+    basis = st.radio('Candidates', list(BASES), format_func=BASES.get, horizontal=True)
+    similarity = st.radio('Similarity', list(SIMILARITIES), format_func=SIMILARITIES.get, horizontal=True)
+    k = st.slider('Number of Recommendations', 1, 100, DEFAULT_TOP_K)
+    with st.expander("Candidate Settings"):
+        hub_limit = int(st.number_input('Skip Users Following More Than', 1, 100_000_000, DEFAULT_HUB_LIMIT, 500))
+
+    if st.button('Recommend') and valid_input is True:
+        with st.spinner('Scoring Candidates...'):
+            recommended, info = recommend(user_id, index, k, similarity, basis, hub_limit)
+        if info is None:
+            st.error("User ID not found in the dataset.")
+        else:
+            st.markdown(f"### Top {len(recommended)} Accounts for {user_id} to Follow")
+            if info.get('precomputed'):
+                st.markdown("**From the precomputed recommendations**")
+            else:
+                st.markdown(f"**Scored {info['candidates']:,} candidates over {info['edges_read']:,} edges from "
+                            f"{info['between']:,} users in between, skipping {info['skipped_hubs']:,} following more than {hub_limit:,}**")
+            st.dataframe(recommended)
+
+    with st.expander("Batch Recommendations"):
+        # Precomputed on a background job for many users at once
+        job = show_batch(index, k, similarity, basis, hub_limit)
+
+    # Check back on a running batch without blocking the page
+    if job is not None:
+        time.sleep(POLL_SECONDS)
+        st.rerun()
+
+if __name__ == "__main__":
+    run()